@@ -0,0 +1,56 @@
+"""Benchmark the Reports queries on SQLite vs the Parquet + DuckDB analytics mirror.
+
+Run from the repository root (requires duckdb and pyarrow):
+
+    python -m benchmarks.bench_analytics --documents 100000 --items 10
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from utils import analytics, database, reports
+from benchmarks.bench_reports import build_database, timed
+
+QUERIES = {
+    'category totals': reports.get_category_totals,
+    'document line items': reports.get_document_line_items,
+    'top items': reports.get_top_items,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=10, help="line items per document")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    if not analytics.ANALYTICS_AVAILABLE:
+        raise SystemExit("duckdb and pyarrow are required: pip install duckdb pyarrow")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = build_database(os.path.join(tmp, 'bench.db'), args.documents, args.items)
+        analytics.MIRROR_DIR = os.path.join(tmp, 'analytics')
+        
+        start = time.perf_counter()
+        exported = analytics.sync_mirror()
+        sync_ms = (time.perf_counter() - start) * 1000
+        
+        sqlite_conn = sqlite3.connect(database.DB_PATH)
+        duck_conn = analytics.connect_mirror()
+        
+        print(f"documents={rows['documents']} line_items={rows['line_items']}")
+        print(f"initial sync: {sync_ms:.0f} ms ({sum(exported.values())} rows)")
+        print(f"{'query':<22}{'sqlite ms':>12}{'duckdb ms':>12}{'speedup':>10}")
+        
+        for name, query in QUERIES.items():
+            sqlite_ms = timed(lambda: query(sqlite_conn.cursor()), args.repeat)
+            duck_ms = timed(lambda: query(duck_conn), args.repeat)
+            print(f"{name:<22}{sqlite_ms:>12.1f}{duck_ms:>12.1f}{sqlite_ms / duck_ms:>9.1f}x")
+        
+        sqlite_conn.close()
+        duck_conn.close()
+
+if __name__ == '__main__':
+    main()
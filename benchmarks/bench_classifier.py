@@ -0,0 +1,91 @@
+"""Learned categorizer throughput: batch scoring of line items versus one call per item and the keyword rules.
+
+Labelled line items are drawn from the synthetic product catalogue with
+random sizes and brand words mixed in. A model is trained on part of them
+and timed scoring the rest; accuracy is reported alongside the rule engine.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_classifier --train 2000 --items 100000
+"""
+import argparse
+import random
+import time
+
+from utils import database
+from utils.categorizer import KeywordAutomaton
+from utils.classifier import NaiveBayesModel
+from utils.synthetic_data import CATEGORY_PRODUCTS
+
+BRANDS = ['Acme', 'Golden', 'Farm Fresh', 'Value', 'Premium', 'Organic', 'Store Brand', 'Daily']
+SIZES = ['', '1kg', '500g', '2L', '6pk', 'x12', 'Large', 'Family Size']
+
+def sample_items(n, seed):
+    """(description, category) pairs"""
+    rng = random.Random(seed)
+    categories = list(CATEGORY_PRODUCTS)
+    items = []
+    for _ in range(n):
+        category = rng.choice(categories)
+        description = f"{rng.choice(BRANDS)} {rng.choice(CATEGORY_PRODUCTS[category])} {rng.choice(SIZES)}".strip()
+        items.append((description, category))
+    return items
+
+def rule_automaton():
+    """The seeded line-item rules, compiled as the database would"""
+    return KeywordAutomaton([
+        (keyword, category, priority, 'word' if keyword in database.WORD_KEYWORDS else 'substring')
+        for category, priority, keywords in database.DEFAULT_CATEGORY_RULES['line_item']
+        for keyword in keywords
+    ])
+
+def per_thousand(seconds, n):
+    return seconds / n * 1000 * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--train', type=int, default=2000, help="corrections to train on")
+    parser.add_argument('--items', type=int, default=100000, help="line items to score")
+    parser.add_argument('--batch', type=int, default=50, help="items per receipt when scoring in batches")
+    args = parser.parse_args()
+    
+    training = sample_items(args.train, seed=1)
+    scoring = sample_items(args.items, seed=2)
+    texts = [text for text, _ in scoring]
+    expected = [category for _, category in scoring]
+    
+    model = NaiveBayesModel()
+    start = time.perf_counter()
+    model.partial_fit([text for text, _ in training], [category for _, category in training])
+    print(f"train       {args.train:>8} examples {time.perf_counter() - start:8.3f} s")
+    
+    start = time.perf_counter()
+    labels, confidences, coverage = model.predict(texts)
+    seconds = time.perf_counter() - start
+    accuracy = sum(label == category for label, category in zip(labels, expected)) / len(expected)
+    print(f"one batch   {per_thousand(seconds, len(texts)):8.2f} ms / 1000 items  accuracy {accuracy:.1%}")
+    
+    # Receipt-sized batches, as save_line_items() scores them
+    start = time.perf_counter()
+    for i in range(0, len(texts), args.batch):
+        model.predict(texts[i:i + args.batch])
+    print(f"receipts    {per_thousand(time.perf_counter() - start, len(texts)):8.2f} ms / 1000 items  ({args.batch} per batch)")
+    
+    sample = texts[:min(len(texts), 10000)]
+    start = time.perf_counter()
+    for text in sample:
+        model.predict([text])
+    print(f"per item    {per_thousand(time.perf_counter() - start, len(sample)):8.2f} ms / 1000 items")
+    
+    automaton = rule_automaton()
+    start = time.perf_counter()
+    rule_labels = [automaton.best(text) or database.CATEGORY_FALLBACKS['line_item'] for text in texts]
+    seconds = time.perf_counter() - start
+    accuracy = sum(label == category for label, category in zip(rule_labels, expected)) / len(expected)
+    print(f"rules       {per_thousand(seconds, len(texts)):8.2f} ms / 1000 items  accuracy {accuracy:.1%}")
+    
+    confident = sum(c >= database.CLASSIFIER_MIN_CONFIDENCE and v >= database.CLASSIFIER_MIN_COVERAGE for c, v in zip(confidences, coverage))
+    print(f"above thresholds {confident / len(texts):.1%} of items")
+
+if __name__ == '__main__':
+    main()
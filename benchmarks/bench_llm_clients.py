@@ -0,0 +1,102 @@
+"""Chat latency with a new LLM client per message versus the shared client registry.
+
+A local stand-in for an OpenAI-compatible server answers chat completions
+instantly. Each new connection is delayed by --handshake-ms to stand in
+for the TCP and TLS setup of a remote provider, which a shared client
+pays once and a new client pays on every message.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_llm_clients --messages 50 --handshake-ms 30
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import OpenAI
+
+from utils import chat_service
+
+RESULTS = [{'total': 1234.5}]
+
+def completion(model):
+    """Minimal chat completion response body"""
+    return {
+        'id': 'chatcmpl-bench',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': "The total amount is $1,234.50"}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 50, 'completion_tokens': 8, 'total_tokens': 58},
+    }
+
+def start_server(handshake_ms):
+    """Serve chat completions on a free local port; returns the server and its connection counter"""
+    connections = {'count': 0}
+    
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 keeps the connection open between requests; without Nagle
+        # the separately written headers and body are not held back
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+        
+        def setup(self):
+            connections['count'] += 1
+            time.sleep(handshake_ms / 1000)
+            super().setup()
+        
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            body = json.dumps(completion(request['model'])).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, connections
+
+def time_messages(get_client, messages):
+    """Per-message latency in milliseconds of answering a chat message with a client from get_client()"""
+    durations = []
+    for _ in range(messages):
+        start = time.perf_counter()
+        chat_service.chat_with_llm(get_client(), "What is the total amount spent?", RESULTS, 'bench-model')
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+def report(name, durations, connections):
+    print(f"{name:<20} median {statistics.median(durations):8.2f} ms  mean {statistics.mean(durations):8.2f} ms  "
+          f"first {durations[0]:8.2f} ms  connections {connections}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=50, help="chat messages per run")
+    parser.add_argument('--handshake-ms', type=float, default=30.0, help="delay of every new connection")
+    args = parser.parse_args()
+    
+    server, connections = start_server(args.handshake_ms)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    
+    # What get_configured_llm() used to do for every message
+    durations = time_messages(lambda: OpenAI(base_url=base_url, api_key='bench'), args.messages)
+    report("new client", durations, connections['count'])
+    
+    connections['count'] = 0
+    chat_service.clear_llm_clients()
+    durations = time_messages(lambda: chat_service.get_llm_client('ollama', base_url, 'bench'), args.messages)
+    report("shared client", durations, connections['count'])
+    
+    chat_service.clear_llm_clients()
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark the Reports page data access: per-document N+1 queries vs grouped queries.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_reports --documents 5000 --items 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from utils import database, synthetic_data
+from utils.reports import get_report_data
+
+def build_database(path, documents, items_per_document):
+    """Fill a fresh database with synthetic receipts; returns the row counts per table"""
+    database.DB_PATH = path
+    database.init_database()
+    return synthetic_data.generate(transactions=documents, mean_items=items_per_document)
+
+def legacy_report():
+    """The query pattern the Reports page used before: one query per document for items and totals"""
+    database.execute_query("""
+        SELECT category, SUM(total) as total_amount, COUNT(*) as item_count
+        FROM line_items WHERE category IS NOT NULL GROUP BY category ORDER BY total_amount DESC
+    """)
+    docs = database.execute_query("""
+        SELECT DISTINCT d.id, d.uploaded_at, t.vendor_name, t.transaction_date, t.amount
+        FROM documents d
+        JOIN transactions t ON d.id = t.document_id
+        JOIN line_items li ON d.id = li.document_id
+        ORDER BY d.uploaded_at DESC
+    """)
+    for doc in docs:
+        database.execute_query(f"""
+            SELECT description, quantity, unit_price, total, category
+            FROM line_items WHERE document_id = {doc['id']} ORDER BY category, description
+        """)
+        database.execute_query(f"""
+            SELECT category, SUM(total) as cat_total
+            FROM line_items WHERE document_id = {doc['id']} GROUP BY category ORDER BY cat_total DESC
+        """)
+    database.execute_query("""
+        SELECT description, SUM(total) as total_spent, COUNT(*) as purchase_count, category
+        FROM line_items GROUP BY description ORDER BY total_spent DESC LIMIT 10
+    """)
+
+def timed(fn, repeat):
+    """Best wall-clock time of `repeat` runs, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=8, help="line items per document")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = build_database(os.path.join(tmp, 'bench.db'), args.documents, args.items)
+        
+        # Clear the result cache so every run hits the database
+        legacy_ms = timed(lambda: (database.clear_query_cache(), legacy_report()), args.repeat)
+        grouped_ms = timed(lambda: (database.clear_query_cache(), get_report_data()), args.repeat)
+    
+    print(f"documents={rows['documents']} line_items={rows['line_items']}")
+    print(f"legacy N+1 queries : {legacy_ms:10.1f} ms")
+    print(f"grouped queries    : {grouped_ms:10.1f} ms")
+    print(f"speedup            : {legacy_ms / grouped_ms:10.1f}x")
+
+if __name__ == '__main__':
+    main()
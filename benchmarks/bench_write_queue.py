@@ -0,0 +1,119 @@
+"""Concurrency stress test: N sessions writing directly vs through the single-writer queue.
+
+Each simulated session saves documents with line items and edits a
+transaction, the same write mix as the Upload and Documents pages. Reports
+write throughput, latency percentiles and "database is locked" failures.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_write_queue --sessions 16 --writes 50
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from utils import database
+
+def sample_document(session, n):
+    """Extracted-document payload like the one the OCR service produces"""
+    return {
+        'vendor_name': f"Vendor {session}",
+        'invoice_number': f"INV-{session}-{n}",
+        'transaction_date': '2026-01-15',
+        'amount': 10.0 + n,
+        'tax_amount': 1.0,
+        'confidence': 0.9,
+        'raw_text': f"Receipt {n} from vendor {session}",
+    }
+
+def sample_line_items(n):
+    return [
+        {'description': 'Chicken breast', 'quantity': 1, 'unit_price': 5.0, 'total': 5.0},
+        {'description': 'Milk 1L', 'quantity': 2, 'unit_price': 1.5, 'total': 3.0},
+        {'description': f"Item {n}", 'quantity': 1, 'unit_price': 2.0, 'total': 2.0},
+    ]
+
+def direct_write(fn, *args):
+    """The old pattern: each session opens its own connection and commits on its own"""
+    conn = sqlite3.connect(database.DB_PATH)
+    try:
+        result = fn(conn.cursor(), *args)
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+def queued_write(fn, *args):
+    return database.submit_write(fn, *args, tables=('documents', 'transactions', 'line_items')).result()
+
+def run_session(write, session, writes, latencies, errors):
+    """One simulated user: upload documents and correct a transaction after each"""
+    for n in range(writes):
+        started = time.perf_counter()
+        try:
+            doc_id = write(database._insert_document, sample_document(session, n), 'Other')
+            rows = [
+                (doc_id, doc_id, item['description'], item['quantity'], item['unit_price'], item['total'], 'Grocery Items')
+                for item in sample_line_items(n)
+            ]
+            write(database._insert_line_items, rows)
+            write(database._execute_write, "UPDATE transactions SET category = ? WHERE document_id = ?", ('Office Supplies', doc_id))
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+        latencies.append(time.perf_counter() - started)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(mode, sessions, writes):
+    """Run all sessions concurrently and return throughput and latency figures"""
+    write = queued_write if mode == 'queue' else direct_write
+    latencies, errors = [], []
+    
+    threads = [
+        threading.Thread(target=run_session, args=(write, session, writes, latencies, errors))
+        for session in range(sessions)
+    ]
+    
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    # Each session iteration is three writes
+    return {
+        'writes_per_sec': sessions * writes * 3 / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': len(errors),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=50, help="documents saved per session")
+    args = parser.parse_args()
+    
+    print(f"sessions={args.sessions} documents per session={args.writes}")
+    print(f"{'mode':<8}{'writes/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    
+    for mode in ('direct', 'queue'):
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DB_PATH = os.path.join(tmp, 'bench.db')
+            database.init_database()
+            
+            result = run(mode, args.sessions, args.writes)
+            print(f"{mode:<8}{result['writes_per_sec']:>10.0f}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}")
+            
+            if mode == 'queue':
+                database.get_write_queue().close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""Scale benchmark suite: time the database layer and every page's queries at several data sizes.
+
+For each scale a fresh database is filled by utils.synthetic_data and the
+public read and write functions in utils/database.py (not the cache, writer
+queue and maintenance plumbing) plus the queries each page issues are timed
+with a cold result cache. Results are written as JSON; pass an earlier
+report as --baseline to flag functions that got slower.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --scales 10000 100000 1000000 --output data/benchmark.json
+    python -m benchmarks.run_benchmarks --scales 10000 --baseline data/benchmark.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from utils import database, reports, synthetic_data, text_to_sql
+from utils.chat_service import generate_sql
+
+CHAT_QUESTIONS = [
+    "What is the total amount spent?",
+    "How many transactions do we have?",
+    "Show spending by category",
+    "Who are the top vendors?",
+    "Show recent transactions",
+    "How much did we spend this month?",
+]
+
+# What a model answers for "Who are the top 5 vendors?"; later questions reuse the plan
+TOP_VENDORS_SQL = """
+    SELECT v.name, SUM(t.amount) AS total
+    FROM transactions t JOIN vendors v ON v.id = t.vendor_id
+    WHERE t.duplicate_of IS NULL
+    GROUP BY v.id ORDER BY total DESC LIMIT 5
+"""
+
+# Rows per call for the bulk edit and delete cases
+BATCH_SIZE = 100
+
+SAMPLE_DOCUMENT = {
+    'vendor_name': 'Fresh Market',
+    'invoice_number': 'BENCH-0001',
+    'transaction_date': '2026-01-15',
+    'amount': 42.5,
+    'tax_amount': 3.1,
+    'confidence': 0.9,
+    'raw_text': 'Fresh Market chicken breast milk bread',
+}
+
+SAMPLE_LINE_ITEMS = [
+    {'description': 'Chicken Breast', 'quantity': 1, 'unit_price': 8.5, 'total': 8.5},
+    {'description': 'Milk 1L', 'quantity': 2, 'unit_price': 1.5, 'total': 3.0},
+    {'description': 'White Bread', 'quantity': 1, 'unit_price': 2.5, 'total': 2.5},
+]
+
+def sample_ids():
+    """A document, transaction and vendor from the middle of the table, and a cursor deep into the listing"""
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT MAX(id) FROM documents")
+    middle = cursor.fetchone()[0] // 2
+    cursor.execute("SELECT document_id, id, vendor_id FROM transactions WHERE document_id >= ? ORDER BY document_id LIMIT 1", (middle,))
+    document_id, transaction_id, vendor_id = cursor.fetchone()
+    cursor.execute("SELECT id FROM transactions WHERE id >= ? ORDER BY id LIMIT ?", (transaction_id, BATCH_SIZE))
+    transaction_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT id FROM line_items WHERE transaction_id >= ? ORDER BY id LIMIT ?", (transaction_id, BATCH_SIZE))
+    line_item_ids = [row[0] for row in cursor.fetchall()]
+    
+    conn.close()
+    
+    # Cursor for page 20 of the default listing
+    after = None
+    for _ in range(20):
+        _, after = database.get_documents_page(after=after)
+    
+    text_to_sql.generate_plan("Who are the top 5 vendors?", lambda system, question: TOP_VENDORS_SQL)
+    
+    return {
+        'document_id': document_id, 'transaction_id': transaction_id, 'vendor_id': vendor_id, 'deep_cursor': after,
+        'transaction_ids': transaction_ids, 'line_item_ids': line_item_ids,
+    }
+
+def upload_document():
+    """What the Upload page does per file: save the document, its items and look up the transaction"""
+    doc_id = database.save_document(SAMPLE_DOCUMENT)
+    transaction_id = database.execute_query("SELECT id FROM transactions WHERE document_id = ?", (doc_id,))[0]['id']
+    database.save_line_items(doc_id, transaction_id, SAMPLE_LINE_ITEMS)
+    return doc_id
+
+def documents_page(ids):
+    """Everything the Documents page loads on a first visit"""
+    database.get_document_stats()
+    for field in ('category', 'vendor_name', 'status'):
+        database.get_filter_values(field)
+    docs, _ = database.get_documents_page()
+    database.get_line_items(docs[0]['id'])
+
+def benchmark_cases(ids):
+    """Name -> callable for every timed operation"""
+    cases = {
+        # utils/database.py
+        'database.get_metrics': database.get_metrics,
+        'database.get_all_documents': database.get_all_documents,
+        'database.get_all_documents[category]': lambda: database.get_all_documents({'category': 'Bakery'}),
+        'database.get_documents_page': database.get_documents_page,
+        'database.get_documents_page[page 20]': lambda: database.get_documents_page(after=ids['deep_cursor']),
+        'database.get_documents_page[vendor]': lambda: database.get_documents_page({'vendor_name': 'Fresh Market'}),
+        'database.get_documents_page[vendor_id]': lambda: database.get_documents_page({'vendor_id': ids['vendor_id']}),
+        'database.get_document': lambda: database.get_document(ids['document_id']),
+        'database.get_document_stats': database.get_document_stats,
+        'database.get_document_stats[status]': lambda: database.get_document_stats({'status': 'pending'}),
+        'database.get_filter_values[vendor_name]': lambda: database.get_filter_values('vendor_name'),
+        'database.search_documents': lambda: database.search_documents('chicken'),
+        'database.search_documents[prefix]': lambda: database.search_documents('fresh mar'),
+        'database.execute_query': lambda: database.execute_query("SELECT * FROM transactions WHERE id = ?", (ids['transaction_id'],)),
+        'database.iter_query': lambda: sum(1 for _ in database.iter_query("SELECT id, amount FROM transactions")),
+        'database.get_line_items': lambda: database.get_line_items(ids['document_id']),
+        'database.auto_categorize': lambda: database.auto_categorize('Fresh Market', 'chicken milk bread'),
+        'database.auto_categorize_line_item': lambda: database.auto_categorize_line_item('Chicken Breast'),
+        'database.categorize_batch[receipt]': lambda: database.categorize_batch('line_item', [item['description'] for item in SAMPLE_LINE_ITEMS] * 10),
+        'database.categorize[line_item]': lambda: database.categorize('line_item', 'Chicken Breast'),
+        'database.get_category_rules': database.get_category_rules,
+        'database.get_categories': database.get_categories,
+        'database.get_category_model[line_item]': lambda: database.get_category_model('line_item'),
+        'database.list_category_models': database.list_category_models,
+        'database.match_vendor[exact]': lambda: database.match_vendor('Fresh Market'),
+        'database.match_vendor[misspelled]': lambda: database.match_vendor('Frseh Markte'),
+        'database.get_vendors': database.get_vendors,
+        'database.get_unlinked_vendor_count': database.get_unlinked_vendor_count,
+        'database.match_product[exact]': lambda: database.match_product('1. Chicken Breast'),
+        'database.match_product[misspelled]': lambda: database.match_product('Chiken Braest'),
+        'database.get_products': database.get_products,
+        'database.get_unlinked_product_count': database.get_unlinked_product_count,
+        'database.recategorize[line_item]': lambda: database.recategorize(['line_item']),
+        'database.save_document': lambda: database.save_document(SAMPLE_DOCUMENT),
+        'database.save_line_items': lambda: database.save_line_items(ids['document_id'], ids['transaction_id'], SAMPLE_LINE_ITEMS),
+        'database.update_transaction': lambda: database.update_transaction(ids['transaction_id'], {'category': 'Bakery'}),
+        'database.delete_document': lambda: database.delete_document(upload_document()),
+        'database.delete_documents': lambda: database.delete_documents([upload_document() for _ in range(10)]),
+        'database.update_transactions': lambda: database.update_transactions([{'id': row_id, 'category': 'Bakery'} for row_id in ids['transaction_ids']]),
+        'database.update_line_items': lambda: database.update_line_items([{'id': row_id, 'category': 'Bakery'} for row_id in ids['line_item_ids']]),
+        'database.find_duplicates': database.find_duplicates,
+        'database.flag_duplicates': database.flag_duplicates,
+        'database.backfill_vendors': database.backfill_vendors,
+        'database.backfill_products': database.backfill_products,
+        'database.train_category_model[line_item]': lambda: database.train_category_model('line_item', full=True),
+        'database.get_category_tree': database.get_category_tree,
+        'database.set_category_parent': lambda: database.set_category_parent('Bakery', 'Grocery Items'),
+        'database.add_category_rule': lambda: database.add_category_rule('Bakery', 'sourdough'),
+        'database.get_storage_status': database.get_storage_status,
+        'database.reclaim_free_space': lambda: database.reclaim_free_space(min_free_pages=0),
+        # Pages
+        'page.home': database.get_metrics,
+        'page.upload': upload_document,
+        'page.documents': lambda: documents_page(ids),
+        'page.documents.export': lambda: database.get_all_documents({'status': 'processed'}),
+        'page.reports': reports.get_report_data,
+    }
+    
+    for question in CHAT_QUESTIONS:
+        cases[f"page.chat[{question}]"] = lambda sql=generate_sql(question): database.execute_query(sql)
+    cases['text_to_sql.lookup_plan'] = lambda: text_to_sql.lookup_plan("Who are the top 10 vendors?")
+    
+    return cases
+
+def time_case(fn, repeat):
+    """Best and median wall-clock time in milliseconds, with a cold result cache for every run"""
+    durations = []
+    for _ in range(repeat):
+        database.clear_query_cache()
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return {'best_ms': round(min(durations), 3), 'median_ms': round(statistics.median(durations), 3)}
+
+def run_scale(transactions, repeat, tmp):
+    """Build a database with `transactions` receipts and time every case on it"""
+    database.DB_PATH = os.path.join(tmp, f"bench-{transactions}.db")
+    database.init_database()
+    
+    start = time.perf_counter()
+    rows = synthetic_data.generate(transactions=transactions)
+    build_seconds = time.perf_counter() - start
+    
+    ids = sample_ids()
+    timings = {}
+    
+    for name, fn in benchmark_cases(ids).items():
+        try:
+            timings[name] = time_case(fn, repeat)
+        except Exception as e:
+            timings[name] = {'error': f"{type(e).__name__}: {e}"}
+        
+        result = timings[name]
+        print(f"  {name:<58}" + (f"{result['median_ms']:>12.2f} ms" if 'error' not in result else f"  {result['error']}"))
+    
+    database.get_write_queue().close()
+    
+    return {
+        'rows': rows,
+        'build_seconds': round(build_seconds, 2),
+        'database_mb': round(os.path.getsize(database.DB_PATH) / 1e6, 1),
+        'timings': timings,
+    }
+
+def compare(report, baseline, tolerance):
+    """Cases whose median time grew by more than `tolerance` times versus the baseline"""
+    regressions = []
+    for scale, result in report['scales'].items():
+        previous = baseline.get('scales', {}).get(scale, {}).get('timings', {})
+        for name, timing in result['timings'].items():
+            before = previous.get(name, {}).get('median_ms')
+            after = timing.get('median_ms')
+            # Ignore sub-millisecond noise
+            if before and after and after > max(before * tolerance, before + 1.0):
+                regressions.append((scale, name, before, after))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000], help="transactions per run, e.g. 10000 100000 1000000")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='data/benchmark.json')
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="slowdown factor reported as a regression")
+    args = parser.parse_args()
+    
+    report = {
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'scales': {},
+    }
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for transactions in args.scales:
+            print(f"scale {transactions} transactions")
+            report['scales'][str(transactions)] = run_scale(transactions, args.repeat, tmp)
+    
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        
+        for scale, name, before, after in regressions:
+            print(f"REGRESSION {scale:>8} {name}: {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            sys.exit(1)
+        print("no regressions")
+
+if __name__ == '__main__':
+    main()
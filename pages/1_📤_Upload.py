@@ -1,6 +1,7 @@
 import streamlit as st
 from utils.ocr_service import process_document
-from utils.database import save_document, save_line_items, init_database
+from utils.database import save_document, save_line_items, init_database, DuplicateDocumentError, DUPLICATE_POLICY
+from utils.file_store import store_file
 import tempfile
 import os
 
@@ -128,13 +129,22 @@ if uploaded_file:
                         
                         # Save to database
                         try:
-                            doc_id = save_document(result["data"])
+                            # Keep the original file in the content-addressed store
+                            result["data"]["file_path"] = store_file(tmp_path)
+                            doc_id = save_document(result["data"], st.session_state.get('duplicate_policy', DUPLICATE_POLICY))
+                            duplicate_of = result["data"].get("duplicate_of")
                             
+                            if duplicate_of and duplicate_of != doc_id:
+                                st.warning(f"🔁 Saved as a duplicate of Document ID {duplicate_of}; it is left out of totals and reports")
+                            
+                            if duplicate_of == doc_id:
+                                # Merged into the copy already on file, which keeps its own line items
+                                st.info(f"🔁 This invoice is already saved (Document ID: {doc_id}); missing fields were filled in from this copy")
                             # Save line items if available
-                            if line_items:
+                            elif line_items:
                                 # Get transaction_id from the saved document
                                 from utils.database import execute_query
-                                trans = execute_query(f"SELECT id FROM transactions WHERE document_id = {doc_id}")
+                                trans = execute_query("SELECT id FROM transactions WHERE document_id = ?", (doc_id,))
                                 if trans:
                                     transaction_id = trans[0]['id']
                                     save_line_items(doc_id, transaction_id, line_items)
@@ -143,6 +153,8 @@ if uploaded_file:
                                     st.success(f"💾 Saved to database (Document ID: {doc_id})")
                             else:
                                 st.success(f"💾 Saved to database (Document ID: {doc_id})")
+                        except DuplicateDocumentError as e:
+                            st.warning(f"🔁 Not saved: this invoice is already on file (Document ID: {e.document_id})")
                         except Exception as e:
                             st.warning(f"⚠️ Saved locally but database error: {str(e)}")
                         
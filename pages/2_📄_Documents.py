@@ -1,10 +1,37 @@
 import streamlit as st
+import os
 import pandas as pd
-from utils.database import get_all_documents, delete_document, update_transaction, get_line_items, init_database
+from utils.database import (
+    get_documents_page, search_documents, get_document, get_document_stats, get_filter_values,
+    delete_document, delete_documents, update_transaction, update_transactions, get_line_items, update_line_items,
+    get_categories, get_vendors, init_database
+)
+from utils.export import EXPORT_FORMATS, available_formats, export_documents
+from utils.file_store import blob_path, get_thumbnail
 from datetime import datetime
+from PIL import UnidentifiedImageError
+
+PAGE_SIZE = 25
+GRID_PAGE_SIZE = 200
+LIST_VIEW = "📋 List"
+GRID_VIEW = "✏️ Grid Edit"
+
+# Transaction fields editable in the grid
+GRID_COLUMNS = ['vendor_name', 'invoice_number', 'transaction_date', 'amount', 'category']
+EXPORT_DOWNLOAD_LIMIT_MB = 200
 
 st.set_page_config(page_title="Documents", page_icon="📄", layout="wide")
 
+def show_thumbnail(key, size, width=None):
+    """Show a cached preview; a corrupt stored image gets a placeholder instead of breaking the page"""
+    try:
+        thumbnail = get_thumbnail(key, size)
+    except (OSError, UnidentifiedImageError):
+        st.caption("🖼️ Preview unavailable")
+        return
+    if thumbnail:
+        st.image(thumbnail, width=width)
+
 # Initialize database
 init_database()
 
@@ -17,118 +44,349 @@ if 'editing_id' not in st.session_state:
     st.session_state.editing_id = None
 if 'show_delete_confirm' not in st.session_state:
     st.session_state.show_delete_confirm = None
+if 'page_cursors' not in st.session_state:
+    st.session_state.page_cursors = [None]
+if 'selected_docs' not in st.session_state:
+    st.session_state.selected_docs = {}
+if 'show_bulk_delete_confirm' not in st.session_state:
+    st.session_state.show_bulk_delete_confirm = False
+if 'grid_window' not in st.session_state:
+    st.session_state.grid_window = None
+    st.session_state.grid_version = 0
 
-# Get all documents
-documents = get_all_documents()
+# Get document totals
+stats = get_document_stats()
 
-if documents:
-    # Convert to DataFrame
-    df = pd.DataFrame(documents)
-    
+if stats['count']:
     # Metrics
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Documents", len(documents))
+        st.metric("Total Documents", stats['count'])
     
     with col2:
-        processed = sum(1 for d in documents if d.get('status') == 'processed')
-        st.metric("Processed", processed)
+        st.metric("Processed", stats['processed'])
     
     with col3:
-        total_amount = sum(float(d.get('amount', 0) or 0) for d in documents)
-        st.metric("Total Amount", f"${total_amount:,.2f}")
+        st.metric("Total Amount", f"${stats['total_amount']:,.2f}")
     
     with col4:
-        avg_confidence = sum(float(d.get('confidence_score', 0) or 0) for d in documents) / len(documents) if documents else 0
-        st.metric("Avg Confidence", f"{avg_confidence*100:.1f}%")
+        st.metric("Avg Confidence", f"{stats['avg_confidence']*100:.1f}%")
     
     st.markdown("---")
     
+    # Full-text search
+    search_text = st.text_input(
+        "🔍 Search documents",
+        placeholder="Search vendor, invoice number, receipt text or items, e.g. dialog router"
+    ).strip()
+    
     # Filters
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        categories = ['All'] + sorted(list(set(d.get('category') for d in documents if d.get('category'))))
+        categories = ['All'] + get_filter_values('category')
         selected_category = st.selectbox("Filter by Category", categories)
     
     with col2:
-        vendors = ['All'] + sorted(list(set(d.get('vendor_name') for d in documents if d.get('vendor_name'))))
-        selected_vendor = st.selectbox("Filter by Vendor", vendors)
+        # Canonical vendors, so OCR spelling variants are filtered together
+        vendor_ids = {vendor['name']: vendor['id'] for vendor in get_vendors() if vendor['transactions']}
+        selected_vendor = st.selectbox("Filter by Vendor", ['All'] + list(vendor_ids))
     
     with col3:
-        statuses = ['All'] + sorted(list(set(d.get('status') for d in documents if d.get('status'))))
+        statuses = ['All'] + get_filter_values('status')
         selected_status = st.selectbox("Filter by Status", statuses)
     
-    # Apply filters
-    filtered_docs = documents.copy()
+    # Build SQL filters
+    filters = {}
     
     if selected_category != 'All':
-        filtered_docs = [d for d in filtered_docs if d.get('category') == selected_category]
+        filters['category'] = selected_category
     
     if selected_vendor != 'All':
-        filtered_docs = [d for d in filtered_docs if d.get('vendor_name') == selected_vendor]
+        filters['vendor_id'] = vendor_ids[selected_vendor]
     
     if selected_status != 'All':
-        filtered_docs = [d for d in filtered_docs if d.get('status') == selected_status]
+        filters['status'] = selected_status
+    
+    # Extraction metadata filters (indexed generated columns)
+    with st.expander("🔬 Extraction Filters"):
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            selected_engine = st.selectbox("OCR Engine", ['All'] + get_filter_values('engine'))
+        
+        with col2:
+            selected_source = st.selectbox("Source", ['All'] + get_filter_values('source'))
+        
+        with col3:
+            max_confidence = st.slider("Confidence below", 0, 100, 100, step=5, format="%d%%")
+    
+    if selected_engine != 'All':
+        filters['engine'] = selected_engine
+    
+    if selected_source != 'All':
+        filters['source'] = selected_source
+    
+    if max_confidence < 100:
+        filters['max_confidence'] = max_confidence / 100
+    
+    view_mode = st.radio("View", [LIST_VIEW, GRID_VIEW], horizontal=True, label_visibility="collapsed")
+    grid_view = view_mode == GRID_VIEW
+    page_size = GRID_PAGE_SIZE if grid_view else PAGE_SIZE
+    
+    # Restart pagination when the search, filters or view change
+    filter_key = tuple(sorted(filters.items()))
+    if st.session_state.get('documents_filter_key') != (search_text, filter_key, view_mode):
+        st.session_state.documents_filter_key = (search_text, filter_key, view_mode)
+        st.session_state.page_cursors = [None]
+        st.session_state.grid_window = None
+    
+    filtered_stats = get_document_stats(filters) if filters else stats
+    
+    # The grid keeps its window between reruns and patches edited rows in place
+    window_key = (search_text, filter_key, st.session_state.page_cursors[-1])
+    grid_window = st.session_state.grid_window
+    
+    # Load only the current page (ranked by relevance when searching)
+    if grid_view and grid_window and grid_window['key'] == window_key:
+        page_docs, next_cursor = grid_window['docs'], grid_window['next_cursor']
+    elif search_text:
+        page_docs, next_cursor = search_documents(search_text, filters, offset=st.session_state.page_cursors[-1] or 0, limit=page_size)
+    else:
+        page_docs, next_cursor = get_documents_page(filters, after=st.session_state.page_cursors[-1], limit=page_size)
+    
+    if grid_view and not (grid_window and grid_window['key'] == window_key):
+        st.session_state.grid_window = {'key': window_key, 'docs': page_docs, 'next_cursor': next_cursor}
+        st.session_state.grid_version += 1
+    
+    if search_text and not page_docs:
+        st.info(f"No documents match \"{search_text}\"")
     
     st.markdown("---")
     
-    # Display documents with edit/delete buttons
-    for doc in filtered_docs:
-        with st.container():
-            col1, col2, col3, col4, col5, col6 = st.columns([2, 2, 2, 2, 1, 1])
-            
+    if grid_view:
+        # Spreadsheet-style editing: dirty cells are collected and saved in one batch
+        grid_docs = [doc for doc in page_docs if doc.get('transaction_id')]
+        grid_df = pd.DataFrame(grid_docs, columns=['id'] + GRID_COLUMNS)
+        category_options = sorted(set(categories[1:]) | {doc['category'] for doc in grid_docs if doc.get('category')})
+        
+        editor_key = f"transactions_grid_{st.session_state.grid_version}"
+        st.data_editor(
+            grid_df,
+            key=editor_key,
+            num_rows="fixed",
+            hide_index=True,
+            use_container_width=True,
+            disabled=['id'],
+            column_config={
+                'id': st.column_config.NumberColumn("Doc ID"),
+                'vendor_name': st.column_config.TextColumn("Vendor"),
+                'invoice_number': st.column_config.TextColumn("Invoice #"),
+                'transaction_date': st.column_config.TextColumn("Date", help="YYYY-MM-DD"),
+                'amount': st.column_config.NumberColumn("Amount", format="$%.2f", min_value=0.0),
+                'category': st.column_config.SelectboxColumn("Category", options=category_options),
+            }
+        )
+        
+        edited_rows = st.session_state[editor_key]['edited_rows']
+        
+        col1, col2, col3 = st.columns([1, 1, 2])
+        
+        with col1:
+            if st.button(f"💾 Save {len(edited_rows)} Changed Rows", type="primary", disabled=not edited_rows):
+                changes = [
+                    dict(edits, id=grid_docs[int(position)]['transaction_id'])
+                    for position, edits in edited_rows.items()
+                ]
+                
+                updated = update_transactions(changes)
+                
+                # Patch the cached window rows only once the write succeeded
+                for position, edits in edited_rows.items():
+                    grid_docs[int(position)].update(edits)
+                
+                st.session_state.grid_version += 1
+                st.toast(f"✅ Saved {updated} rows")
+                st.rerun()
+        
+        with col2:
+            if st.button("↩️ Discard Changes", disabled=not edited_rows):
+                st.session_state.grid_version += 1
+                st.rerun()
+        
+        with col3:
+            if st.button("🔄 Reload"):
+                st.session_state.grid_window = None
+                st.rerun()
+        
+        st.markdown("---")
+    else:
+        # Display documents with edit/delete buttons
+        for doc in page_docs:
+            with st.container():
+                col1, col2, col3, col4, col5, col6 = st.columns([2, 2, 2, 2, 1, 1])
+                
+                with col1:
+                    # Cached small preview; the full image is never decoded on rerun
+                    show_thumbnail(doc.get('file_path'), 'small', width=80)
+                    st.write(f"**ID:** {doc['id']}")
+                    st.write(f"**Vendor:** {doc.get('vendor_name', 'N/A')}")
+                
+                with col2:
+                    st.write(f"**Invoice #:** {doc.get('invoice_number', 'N/A')}")
+                    st.write(f"**Date:** {doc.get('transaction_date', 'N/A')}")
+                
+                with col3:
+                    amount = doc.get('amount', 0) or 0
+                    st.write(f"**Amount:** ${amount:,.2f}")
+                    st.write(f"**Category:** {doc.get('category', 'N/A')}")
+                
+                with col4:
+                    conf = doc.get('confidence_score', 0) or 0
+                    st.write(f"**Confidence:** {conf*100:.1f}%")
+                    st.write(f"**Uploaded:** {(doc.get('uploaded_at') or 'N/A')[:10]}")
+                
+                with col5:
+                    if st.button("✏️ Edit", key=f"edit_{doc['id']}"):
+                        st.session_state.editing_id = doc['id']
+                        st.rerun()
+                
+                with col6:
+                    if st.button("🗑️", key=f"delete_{doc['id']}"):
+                        st.session_state.show_delete_confirm = doc['id']
+                        st.rerun()
+                    
+                    # Selection survives paging: kept as document id -> transaction id
+                    if st.checkbox("Select", value=doc['id'] in st.session_state.selected_docs, key=f"select_{doc['id']}"):
+                        st.session_state.selected_docs[doc['id']] = doc.get('transaction_id')
+                    else:
+                        st.session_state.selected_docs.pop(doc['id'], None)
+                
+                # Matching text for search results
+                if doc.get('snippet'):
+                    st.caption(doc['snippet'])
+                
+                # Larger preview and the original file on demand
+                if doc.get('file_path'):
+                    if st.toggle("🖼️ View Original", key=f"original_{doc['id']}"):
+                        show_thumbnail(doc['file_path'], 'medium')
+                        original_path = blob_path(doc['file_path'])
+                        if os.path.exists(original_path):
+                            with open(original_path, 'rb') as f:
+                                st.download_button(
+                                    "📥 Download Original",
+                                    data=f,
+                                    file_name=f"document-{doc['id']}{os.path.splitext(original_path)[1]}",
+                                    key=f"download_original_{doc['id']}"
+                                )
+                        else:
+                            st.warning("Original file is missing from the file store")
+                
+                # Load line items only when the row is expanded
+                if doc['line_item_count']:
+                    if st.toggle(f"🛒 View {doc['line_item_count']} Line Items", key=f"items_{doc['id']}"):
+                        line_items = get_line_items(doc['id'])
+                        items_df = pd.DataFrame(line_items)
+                        items_df = items_df[['description', 'quantity', 'unit_price', 'total', 'category']]
+                        items_df['unit_price'] = items_df['unit_price'].apply(lambda x: f"${x:.2f}" if pd.notna(x) else "N/A")
+                        items_df['total'] = items_df['total'].apply(lambda x: f"${x:.2f}" if pd.notna(x) else "N/A")
+                        items_df = items_df.rename(columns={
+                            'description': 'Item',
+                            'quantity': 'Qty',
+                            'unit_price': 'Unit Price',
+                            'total': 'Total',
+                            'category': 'Category'
+                        })
+                        # Category corrections are saved and teach the learned categorizer
+                        edited_items = st.data_editor(
+                            items_df,
+                            key=f"items_editor_{doc['id']}",
+                            use_container_width=True,
+                            hide_index=True,
+                            disabled=['Item', 'Qty', 'Unit Price', 'Total'],
+                            column_config={
+                                'Category': st.column_config.SelectboxColumn("Category", options=sorted(set(get_categories()) | set(items_df['Category'].dropna()))),
+                            }
+                        )
+                        item_changes = [
+                            {'id': item['id'], 'category': category}
+                            for item, category in zip(line_items, edited_items['Category'])
+                            if category and category != item['category']
+                        ]
+                        if item_changes and st.button(f"💾 Save {len(item_changes)} Item Categories", key=f"save_items_{doc['id']}"):
+                            update_line_items(item_changes)
+                            st.rerun()
+                
+                st.markdown("---")
+        
+    # Bulk actions on the selected documents
+    selected_docs = st.session_state.selected_docs
+    if selected_docs:
+        col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
+        
+        with col1:
+            st.write(f"**{len(selected_docs)} selected**")
+            if st.button("Clear Selection"):
+                st.session_state.selected_docs = {}
+                st.rerun()
+        
+        with col2:
+            bulk_category = st.selectbox("Set category of selected", categories[1:], key="bulk_category")
+        
+        with col3:
+            if st.button("🏷️ Apply Category", disabled=not bulk_category):
+                updated = update_transactions([
+                    {'id': transaction_id, 'category': bulk_category}
+                    for transaction_id in selected_docs.values() if transaction_id
+                ])
+                st.session_state.grid_window = None
+                st.success(f"✅ Updated {updated} transactions")
+                st.rerun()
+        
+        with col4:
+            if st.button("🗑️ Delete Selected"):
+                st.session_state.show_bulk_delete_confirm = True
+                st.rerun()
+        
+        if st.session_state.show_bulk_delete_confirm:
+            st.warning(f"⚠️ Delete {len(selected_docs)} documents and all their line items?")
+            col1, col2, col3 = st.columns([1, 1, 2])
             with col1:
-                st.write(f"**ID:** {doc['id']}")
-                st.write(f"**Vendor:** {doc.get('vendor_name', 'N/A')}")
-            
-            with col2:
-                st.write(f"**Invoice #:** {doc.get('invoice_number', 'N/A')}")
-                st.write(f"**Date:** {doc.get('transaction_date', 'N/A')}")
-            
-            with col3:
-                amount = doc.get('amount', 0) or 0
-                st.write(f"**Amount:** ${amount:,.2f}")
-                st.write(f"**Category:** {doc.get('category', 'N/A')}")
-            
-            with col4:
-                conf = doc.get('confidence_score', 0) or 0
-                st.write(f"**Confidence:** {conf*100:.1f}%")
-                st.write(f"**Uploaded:** {doc.get('uploaded_at', 'N/A')[:10]}")
-            
-            with col5:
-                if st.button("✏️ Edit", key=f"edit_{doc['id']}"):
-                    st.session_state.editing_id = doc['id']
+                if st.button("✅ Yes, Delete All", type="primary"):
+                    deleted = delete_documents(list(selected_docs))
+                    st.session_state.selected_docs = {}
+                    st.session_state.show_bulk_delete_confirm = False
+                    st.session_state.page_cursors = [None]
+                    st.session_state.grid_window = None
+                    st.success(f"🗑️ Deleted {deleted} documents")
                     st.rerun()
-            
-            with col6:
-                if st.button("🗑️", key=f"delete_{doc['id']}"):
-                    st.session_state.show_delete_confirm = doc['id']
+            with col2:
+                if st.button("❌ Cancel", key="cancel_bulk_delete"):
+                    st.session_state.show_bulk_delete_confirm = False
                     st.rerun()
-            
-            # Show line items if available
-            line_items = get_line_items(doc['id'])
-            if line_items:
-                with st.expander(f"🛒 View {len(line_items)} Line Items"):
-                    items_df = pd.DataFrame(line_items)
-                    items_df = items_df[['description', 'quantity', 'unit_price', 'total', 'category']]
-                    items_df['unit_price'] = items_df['unit_price'].apply(lambda x: f"${x:.2f}" if pd.notna(x) else "N/A")
-                    items_df['total'] = items_df['total'].apply(lambda x: f"${x:.2f}" if pd.notna(x) else "N/A")
-                    items_df = items_df.rename(columns={
-                        'description': 'Item',
-                        'quantity': 'Qty',
-                        'unit_price': 'Unit Price',
-                        'total': 'Total',
-                        'category': 'Category'
-                    })
-                    st.dataframe(items_df, use_container_width=True, hide_index=True)
-            
-            st.markdown("---")
+        
+        st.markdown("---")
+    
+    # Pagination
+    col1, col2, col3 = st.columns([1, 1, 2])
+    
+    with col1:
+        if st.button("⬅️ Previous", disabled=len(st.session_state.page_cursors) <= 1):
+            st.session_state.page_cursors.pop()
+            st.rerun()
+    
+    with col2:
+        if st.button("Next ➡️", disabled=next_cursor is None):
+            st.session_state.page_cursors.append(next_cursor)
+            st.rerun()
+    
+    with col3:
+        st.write(f"Page {len(st.session_state.page_cursors)}")
     
     # Edit Modal
     if st.session_state.editing_id:
-        doc_to_edit = next((d for d in documents if d['id'] == st.session_state.editing_id), None)
+        doc_to_edit = get_document(st.session_state.editing_id)
         if doc_to_edit:
             with st.form(f"edit_form_{st.session_state.editing_id}"):
                 st.subheader(f"✏️ Edit Document #{st.session_state.editing_id}")
@@ -162,11 +420,8 @@ if documents:
                 
                 # Handle form submission outside the columns
                 if save_clicked:
-                    # Get transaction ID
-                    from utils.database import execute_query
-                    trans = execute_query(f"SELECT id FROM transactions WHERE document_id = {st.session_state.editing_id}")
-                    if trans:
-                        update_transaction(trans[0]['id'], {
+                    if doc_to_edit.get('transaction_id'):
+                        update_transaction(doc_to_edit['transaction_id'], {
                             'vendor_name': vendor,
                             'invoice_number': invoice,
                             'transaction_date': date.strftime('%Y-%m-%d'),
@@ -188,6 +443,7 @@ if documents:
         with col1:
             if st.button("✅ Yes, Delete", type="primary"):
                 delete_document(st.session_state.show_delete_confirm)
+                st.session_state.page_cursors = [None]
                 st.success("🗑️ Document deleted successfully!")
                 st.session_state.show_delete_confirm = None
                 st.rerun()
@@ -202,23 +458,48 @@ if documents:
     col1, col2, col3 = st.columns([1, 1, 2])
     
     with col1:
-        # Download as CSV
-        export_df = pd.DataFrame(filtered_docs)
-        if 'amount' in export_df.columns:
-            export_df['amount'] = export_df['amount'].apply(lambda x: f"${x:,.2f}" if pd.notna(x) else "N/A")
-        if 'confidence_score' in export_df.columns:
-            export_df['confidence_score'] = export_df['confidence_score'].apply(lambda x: f"{x*100:.1f}%" if pd.notna(x) else "N/A")
-        
-        csv = export_df.to_csv(index=False)
-        st.download_button(
-            label="📥 Download CSV",
-            data=csv,
-            file_name="documents.csv",
-            mime="text/csv"
+        # Exports stream straight from the database to a file under data/exports
+        formats = available_formats()
+        export_format = st.selectbox(
+            "Export format",
+            formats,
+            format_func=lambda fmt: EXPORT_FORMATS[fmt]['label'],
+            help="One row per line item, with the document and transaction columns"
         )
+        
+        if st.button("📦 Prepare Export"):
+            progress_text = st.empty()
+            with st.spinner("Exporting..."):
+                st.session_state.last_export = export_documents(
+                    export_format, filters,
+                    progress=lambda rows: progress_text.caption(f"{rows:,} rows written")
+                )
+            progress_text.empty()
+        
+        last_export = st.session_state.get('last_export')
+        if last_export and os.path.exists(last_export['path']):
+            st.caption(
+                f"{last_export['rows']:,} rows, {last_export['bytes'] / 1e6:.1f} MB "
+                f"in {last_export['seconds']:.1f}s ({last_export['rows_per_sec']:,.0f} rows/s)"
+            )
+            
+            # Very large files stay on disk instead of going through the browser
+            if last_export['bytes'] <= EXPORT_DOWNLOAD_LIMIT_MB * 1e6:
+                with open(last_export['path'], 'rb') as f:
+                    st.download_button(
+                        label=f"📥 Download {EXPORT_FORMATS[last_export['format']]['label']}",
+                        data=f,
+                        file_name=os.path.basename(last_export['path']),
+                        mime=EXPORT_FORMATS[last_export['format']]['mime']
+                    )
+            else:
+                st.info(f"Export saved to `{last_export['path']}`")
     
     with col2:
-        st.write(f"Showing {len(filtered_docs)} of {len(documents)} documents")
+        if search_text:
+            st.write(f"Showing {len(page_docs)} matches for \"{search_text}\"")
+        else:
+            st.write(f"Showing {len(page_docs)} of {filtered_stats['count']} documents")
 
 else:
     st.info("📭 No documents yet. Upload your first document to get started!")
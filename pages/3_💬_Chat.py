@@ -1,3 +1,4 @@
+import itertools
 import streamlit as st
 from utils.chat_service import process_query
 from utils.database import init_database
@@ -37,42 +38,52 @@ if prompt := st.chat_input("Ask a question about your expenses..."):
     
     # Get assistant response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                result = process_query(prompt)
-                answer = result["answer"]
-                
-                st.markdown(answer)
-                
-                # Show data
-                if result.get("data"):
-                    with st.expander("📊 View Data"):
-                        st.json(result["data"])
-                
-                # Show provider info
-                provider = result.get("provider", "unknown")
-                if provider == "openrouter":
-                    st.caption("🤖 Powered by OpenRouter (Llama 3.3 70B) - Free")
-                elif provider == "openai":
-                    st.caption("🤖 Powered by OpenAI GPT-4o-mini")
-                elif provider == "basic":
-                    st.caption("📊 Basic response (no LLM)")
-                
-                # Save to history
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": answer,
-                    "data": result.get("data"),
-                    "provider": provider
-                })
+        try:
+            # The spinner runs until the first token; the rest is written as it arrives
+            with st.spinner("Thinking..."):
+                result = process_query(prompt, stream=True)
+                chunks = result["answer"]
+                first = next(chunks, "")
+            answer = st.write_stream(itertools.chain([first], chunks))
             
-            except Exception as e:
-                error_msg = f"Sorry, I encountered an error: {str(e)}"
-                st.error(error_msg)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_msg
-                })
+            # Show data
+            if result.get("data"):
+                with st.expander("📊 View Data"):
+                    st.json(result["data"])
+            
+            # Show provider info
+            provider = result.get("provider", "unknown")
+            if provider == "openrouter":
+                st.caption("🤖 Powered by OpenRouter (Llama 3.3 70B) - Free")
+            elif provider == "openai":
+                st.caption("🤖 Powered by OpenAI GPT-4o-mini")
+            elif provider == "basic":
+                st.caption("📊 Basic response (no LLM)")
+            
+            if result.get("cached"):
+                st.caption("⚡ Answer reused from the answer cache")
+            
+            sql_source = result.get("sql_source")
+            if sql_source == "plan_cache":
+                st.caption("⚡ SQL reused from the plan cache")
+            elif sql_source == "llm":
+                st.caption("🧠 SQL written by the LLM")
+            
+            # Save to history
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": answer,
+                "data": result.get("data"),
+                "provider": provider
+            })
+        
+        except Exception as e:
+            error_msg = f"Sorry, I encountered an error: {str(e)}"
+            st.error(error_msg)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": error_msg
+            })
 
 # Sidebar with suggestions
 with st.sidebar:
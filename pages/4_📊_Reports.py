@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-from utils.database import execute_query, init_database
+from utils.database import init_database
+from utils.reports import get_report_data
+from utils.analytics import ANALYTICS_AVAILABLE, get_mirror_status, sync_mirror
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
@@ -26,23 +28,36 @@ st.markdown("---")
 # Category Summary
 st.subheader("📈 Spending by Category")
 
-# Get category totals from line items
-category_query = f"""
-    SELECT category, SUM(total) as total_amount, COUNT(*) as item_count
-    FROM line_items
-    WHERE category IS NOT NULL
-    GROUP BY category
-    ORDER BY total_amount DESC
-"""
+# Query engine: SQLite, or the columnar mirror (Parquet + DuckDB) for large datasets
+engine = 'sqlite'
+if ANALYTICS_AVAILABLE:
+    with st.expander("⚙️ Analytics Engine"):
+        use_mirror = st.toggle("Use columnar mirror (DuckDB)", value=True)
+        engine = 'auto' if use_mirror else 'sqlite'
+        
+        mirror_status = get_mirror_status()
+        pending = sum(mirror_status['pending_rows'].values())
+        st.caption(
+            f"Last sync: {mirror_status['synced_at'] or 'never'} · {pending} rows newer than the mirror (read from SQLite)"
+            f" · {mirror_status['pending_changes']} edits/deletes read from SQLite until the next sync"
+        )
+        
+        if st.button("🔄 Sync Mirror"):
+            with st.spinner("Exporting to Parquet..."):
+                exported = sync_mirror()
+            st.success(f"✅ Exported {sum(exported.values())} rows")
 
-category_data = execute_query(category_query)
+# Fetch all report data in a few grouped queries
+report = get_report_data(engine=engine)
+category_data = report['categories']['category']
 
 if category_data:
     # Display metrics
     col1, col2, col3 = st.columns(3)
     
-    total_spending = sum(item['total_amount'] for item in category_data)
-    total_items = sum(item['item_count'] for item in category_data)
+    df_cat = pd.DataFrame(report['categories'])
+    total_spending = df_cat['total_amount'].sum()
+    total_items = int(df_cat['item_count'].sum())
     
     with col1:
         st.metric("Total Spending", f"${total_spending:,.2f}")
@@ -58,7 +73,6 @@ if category_data:
     
     with col1:
         # Bar chart
-        df_cat = pd.DataFrame(category_data)
         fig_bar = px.bar(
             df_cat,
             x='category',
@@ -100,82 +114,54 @@ if category_data:
     # Line Items by Document
     st.subheader("🛒 Line Items by Document")
     
-    # Get all documents with line items
-    docs_query = """
-        SELECT DISTINCT d.id, d.uploaded_at, t.vendor_name, t.transaction_date, t.amount
-        FROM documents d
-        JOIN transactions t ON d.id = t.document_id
-        JOIN line_items li ON d.id = li.document_id
-        ORDER BY d.uploaded_at DESC
-    """
-    
-    docs_with_items = execute_query(docs_query)
-    
-    if docs_with_items:
-        for doc in docs_with_items:
-            with st.expander(f"📄 Document #{doc['id']} - {doc.get('vendor_name', 'Unknown')} - ${doc.get('amount', 0):,.2f}"):
-                # Get line items for this document
-                items_query = f"""
-                    SELECT description, quantity, unit_price, total, category
-                    FROM line_items
-                    WHERE document_id = {doc['id']}
-                    ORDER BY category, description
-                """
+    # Line items for all documents, with per-document category totals
+    doc_items_df = pd.DataFrame(report['document_items'])
+    
+    if not doc_items_df.empty:
+        for doc_id, doc_items in doc_items_df.groupby('document_id', sort=False):
+            doc = doc_items.iloc[0]
+            doc_amount = doc['amount'] if pd.notna(doc['amount']) else 0
+            with st.expander(f"📄 Document #{doc_id} - {doc['vendor_name'] or 'Unknown'} - ${doc_amount:,.2f}"):
+                items_df = doc_items[['description', 'quantity', 'unit_price', 'total', 'category']].copy()
+                
+                # Format currency
+                items_df['unit_price'] = items_df['unit_price'].apply(lambda x: f"${x:.2f}" if pd.notna(x) else "N/A")
+                items_df['total'] = items_df['total'].apply(lambda x: f"${x:.2f}" if pd.notna(x) else "N/A")
+                
+                # Rename columns
+                items_df = items_df.rename(columns={
+                    'description': 'Item',
+                    'quantity': 'Qty',
+                    'unit_price': 'Unit Price',
+                    'total': 'Total',
+                    'category': 'Category'
+                })
+                
+                st.dataframe(items_df, use_container_width=True, hide_index=True)
                 
-                items = execute_query(items_query)
+                # Category totals for this document
+                st.markdown("**Category Totals:**")
+                cat_totals = (
+                    doc_items[['category', 'cat_total']]
+                    .drop_duplicates('category')
+                    .sort_values('cat_total', ascending=False)
+                    .to_dict('records')
+                )
                 
-                if items:
-                    items_df = pd.DataFrame(items)
-                    
-                    # Format currency
-                    items_df['unit_price'] = items_df['unit_price'].apply(lambda x: f"${x:.2f}" if pd.notna(x) else "N/A")
-                    items_df['total'] = items_df['total'].apply(lambda x: f"${x:.2f}" if pd.notna(x) else "N/A")
-                    
-                    # Rename columns
-                    items_df = items_df.rename(columns={
-                        'description': 'Item',
-                        'quantity': 'Qty',
-                        'unit_price': 'Unit Price',
-                        'total': 'Total',
-                        'category': 'Category'
-                    })
-                    
-                    st.dataframe(items_df, use_container_width=True, hide_index=True)
-                    
-                    # Category totals for this document
-                    st.markdown("**Category Totals:**")
-                    cat_totals_query = f"""
-                        SELECT category, SUM(total) as cat_total
-                        FROM line_items
-                        WHERE document_id = {doc['id']}
-                        GROUP BY category
-                        ORDER BY cat_total DESC
-                    """
-                    
-                    cat_totals = execute_query(cat_totals_query)
-                    
-                    cols = st.columns(len(cat_totals) if len(cat_totals) <= 4 else 4)
-                    for idx, cat in enumerate(cat_totals):
-                        with cols[idx % 4]:
-                            st.metric(cat['category'], f"${cat['cat_total']:,.2f}")
+                cols = st.columns(len(cat_totals) if len(cat_totals) <= 4 else 4)
+                for idx, cat in enumerate(cat_totals):
+                    with cols[idx % 4]:
+                        st.metric(cat['category'], f"${cat['cat_total']:,.2f}")
     
     st.markdown("---")
     
     # Top Items
     st.subheader("🏆 Top Items by Spending")
     
-    top_items_query = """
-        SELECT description, SUM(total) as total_spent, COUNT(*) as purchase_count, category
-        FROM line_items
-        GROUP BY description
-        ORDER BY total_spent DESC
-        LIMIT 10
-    """
-    
-    top_items = execute_query(top_items_query)
+    top_items = report['top_items']['description']
     
     if top_items:
-        top_df = pd.DataFrame(top_items)
+        top_df = pd.DataFrame(report['top_items']).drop(columns=['product_id'])
         top_df['total_spent'] = top_df['total_spent'].apply(lambda x: f"${x:.2f}")
         top_df = top_df.rename(columns={
             'description': 'Item',
@@ -191,3 +177,51 @@ else:
     
     if st.button("📤 Go to Upload Page"):
         st.switch_page("pages/1_📤_Upload.py")
+
+# Department drill-down over the category tree
+departments = report['departments']
+
+if departments['department']:
+    st.markdown("---")
+    st.subheader("🏢 Spending by Department")
+    
+    df_dept = pd.DataFrame(departments)
+    rollups = pd.DataFrame(report['category_rollups'])
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        fig = px.bar(
+            df_dept,
+            x='department',
+            y='total_amount',
+            labels={'department': 'Department', 'total_amount': 'Amount ($)'},
+            color='total_amount',
+            color_continuous_scale='Teal'
+        )
+        fig.update_layout(showlegend=False, height=400)
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        department = st.selectbox("Department", df_dept['department'])
+        in_department = rollups[rollups['department'] == department]
+        
+        # Categories whose parent is outside the department are its top level
+        top_level = in_department[~in_department['parent_id'].isin(in_department['id'])]
+        parent_name = st.selectbox("Category", ["All"] + top_level['name'].tolist())
+        
+        if parent_name == "All":
+            shown = top_level
+        else:
+            parent_id = top_level.loc[top_level['name'] == parent_name, 'id'].iloc[0]
+            shown = in_department[(in_department['id'] == parent_id) | (in_department['parent_id'] == parent_id)]
+        
+        st.dataframe(
+            shown[['name', 'total_amount', 'transaction_count']].rename(columns={
+                'name': 'Category',
+                'total_amount': 'Spending (incl. subcategories)',
+                'transaction_count': 'Transactions'
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
@@ -1,5 +1,16 @@
 import streamlit as st
-from utils.database import init_database
+from utils.database import (
+    init_database, get_query_cache_stats, clear_query_cache, get_storage_status, reclaim_free_space, enable_incremental_vacuum,
+    get_categories, get_category_rules, add_category_rule, delete_category_rules, recategorize, get_category_tree, set_category_parent,
+    list_category_models, train_category_model, activate_category_model, CLASSIFIER_MIN_CONFIDENCE,
+    get_vendors, get_unlinked_vendor_count, backfill_vendors, get_products, get_unlinked_product_count, backfill_products,
+    find_duplicates, flag_duplicates, DUPLICATE_POLICIES, DUPLICATE_POLICY
+)
+from utils.categorizer import MATCH_MODES
+from utils.answer_cache import get_answer_cache_stats, clear_answers, ANSWER_CACHE_PERSIST, ANSWER_CACHE_TTL
+from utils.text_to_sql import get_plan_cache_stats, clear_plans
+from utils.chat_service import clear_llm_clients
+from utils.backup import create_backup, list_backups, BACKUP_KEEP
 import json
 import os
 
@@ -115,6 +126,10 @@ col1, col2, col3 = st.columns([1, 1, 2])
 
 with col1:
     if st.button("💾 Save Configuration", type="primary"):
+        # Chat opens new connections for the new provider
+        if provider != st.session_state.llm_provider:
+            clear_llm_clients()
+        
         # Update session state
         st.session_state.llm_provider = provider
         st.session_state.llm_model = model
@@ -274,6 +289,349 @@ with col1:
 with col2:
     st.metric("Model", st.session_state.llm_model)
 
+# Query cache
+st.markdown("---")
+st.subheader("🗄️ Query Cache")
+
+cache_stats = get_query_cache_stats()
+
+col1, col2, col3, col4 = st.columns(4)
+
+with col1:
+    st.metric("Hit Rate", f"{cache_stats['hit_rate']*100:.1f}%")
+
+with col2:
+    st.metric("Hits / Misses", f"{cache_stats['hits']} / {cache_stats['misses']}")
+
+with col3:
+    st.metric("Cached Results", cache_stats['size'])
+
+with col4:
+    if st.button("🧹 Clear Cache"):
+        clear_query_cache()
+        st.rerun()
+
+# Chat answer and SQL plan caches
+st.markdown("---")
+st.subheader("💬 Chat Caches")
+
+st.caption("Answers are reused when the same question is asked about unchanged data with the same provider and model. SQL plans are reused for questions that differ only in names, dates or numbers.")
+
+answer_stats = get_answer_cache_stats()
+plan_stats = get_plan_cache_stats()
+
+col1, col2, col3, col4 = st.columns(4)
+
+with col1:
+    st.metric("Answer Hit Rate", f"{answer_stats['hit_rate']*100:.1f}%")
+
+with col2:
+    st.metric("LLM Time Saved", f"{answer_stats['saved_ms'] / 1000:.1f} s")
+
+with col3:
+    st.metric("Cached Answers", answer_stats['size'])
+
+with col4:
+    st.metric("SQL Plans", plan_stats['plans'], f"{plan_stats['hit_rate']*100:.0f}% reused", delta_color="off")
+
+st.session_state.answer_cache_persist = st.checkbox(
+    "Keep cached answers on disk",
+    value=st.session_state.get('answer_cache_persist', ANSWER_CACHE_PERSIST),
+    help=f"Answers are kept for {ANSWER_CACHE_TTL // 3600} hours"
+)
+
+col1, col2 = st.columns(2)
+
+with col1:
+    if st.button("🧹 Clear Answers"):
+        clear_answers()
+        st.rerun()
+
+with col2:
+    if st.button("🧹 Clear SQL Plans"):
+        clear_plans()
+        st.rerun()
+
+# Database storage
+st.markdown("---")
+st.subheader("💽 Database Storage")
+
+storage = get_storage_status()
+
+col1, col2, col3, col4 = st.columns(4)
+
+with col1:
+    st.metric("File Size", f"{storage['file_bytes'] / 1e6:.1f} MB")
+
+with col2:
+    st.metric("Free Space", f"{storage['free_bytes'] / 1e6:.1f} MB")
+
+with col3:
+    st.metric("Auto Vacuum", "Incremental" if storage['incremental'] else "Off")
+
+with col4:
+    if storage['incremental']:
+        if st.button("♻️ Reclaim Space", disabled=not storage['freelist_count']):
+            reclaim_free_space(max_pages=storage['freelist_count'], min_free_pages=1)
+            st.rerun()
+    else:
+        # Converting rewrites the whole file once; later deletes reclaim space in small steps
+        if st.button("♻️ Enable Incremental Vacuum", help="Runs a one-time full VACUUM"):
+            with st.spinner("Rewriting database file..."):
+                enable_incremental_vacuum()
+            st.rerun()
+
+# Categorization rules
+st.markdown("---")
+st.subheader("🏷️ Categorization Rules")
+
+st.caption("Keywords that assign categories to new uploads. When several rules match, the highest priority wins.")
+
+rule_scopes = {'Line Items': 'line_item', 'Transactions': 'transaction'}
+rule_scope = rule_scopes[st.radio("Rules for", list(rule_scopes), horizontal=True)]
+
+rules = get_category_rules(rule_scope)
+if rules:
+    st.dataframe(
+        [{'ID': r['id'], 'Keyword': r['keyword'], 'Category': r['category'], 'Priority': r['priority'], 'Match': r['match_mode']} for r in rules],
+        hide_index=True,
+        use_container_width=True
+    )
+
+with st.form("add_category_rule", clear_on_submit=True):
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        new_keyword = st.text_input("Keyword")
+    with col2:
+        new_category = st.selectbox("Category", get_categories())
+    with col3:
+        new_priority = st.number_input("Priority", value=0, step=10)
+    with col4:
+        new_match = st.selectbox("Match", MATCH_MODES, help="substring: anywhere; word: whole word; prefix: start of a word")
+    
+    if st.form_submit_button("➕ Add Rule"):
+        try:
+            add_category_rule(new_category, new_keyword, rule_scope, int(new_priority), new_match)
+            st.success(f"Rule '{new_keyword}' → {new_category} saved")
+        except ValueError as e:
+            st.error(str(e))
+
+col1, col2 = st.columns(2)
+
+with col1:
+    rules_to_delete = st.multiselect("Delete rules", [r['id'] for r in rules], format_func=lambda rule_id: next(f"{r['keyword']} → {r['category']}" for r in rules if r['id'] == rule_id))
+    if st.button("🗑️ Delete Selected Rules", disabled=not rules_to_delete):
+        delete_category_rules(rules_to_delete)
+        st.rerun()
+
+with col2:
+    st.caption("Apply the current rules and learned model to documents already in the database. Categories corrected by hand are kept.")
+    if st.button("🔄 Recategorize Existing Data"):
+        with st.spinner("Recategorizing..."):
+            changed = recategorize()
+        st.success(f"Updated {changed['transaction']} transactions and {changed['line_item']} line items")
+
+# Category tree
+st.markdown("---")
+st.subheader("🌳 Category Tree")
+
+st.caption("Spending of a category rolls up into its parents and department in Reports. Moving a category moves its subcategories with it.")
+
+tree = get_category_tree()
+
+with st.expander("Category tree"):
+    st.markdown("\n".join(
+        f"{'  ' * node['depth']}- {node['name']}" + (f" ({node['department']})" if node['department'] else "")
+        for node in tree
+    ))
+
+with st.form("set_category_parent"):
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        moved_category = st.selectbox("Category", [node['name'] for node in tree])
+    with col2:
+        new_parent = st.selectbox("Parent", ["(top level)"] + [node['name'] for node in tree])
+    
+    if st.form_submit_button("🌳 Move Category"):
+        try:
+            set_category_parent(moved_category, None if new_parent == "(top level)" else new_parent)
+            st.success(f"Moved {moved_category}")
+            st.rerun()
+        except ValueError as e:
+            st.error(str(e))
+
+# Learned categorizer
+st.markdown("---")
+st.subheader("🧠 Learned Categorizer")
+
+st.caption(f"Trained from categories you correct on the Documents page. Predictions below {CLASSIFIER_MIN_CONFIDENCE:.0%} confidence fall back to the keyword rules.")
+
+models = list_category_models(rule_scope)
+if models:
+    st.dataframe(
+        [
+            {
+                'Version': m['version'],
+                'Active': '✅' if m['active'] else '',
+                'Examples': m['examples'],
+                'Categories': m['labels'],
+                'Unlearned Corrections': m['pending'],
+                'Trained': m['created_at'],
+            }
+            for m in models
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+else:
+    st.info("No model trained yet for these rules")
+
+col1, col2, col3 = st.columns(3)
+
+with col1:
+    if st.button("🎓 Train on New Corrections"):
+        result = train_category_model(rule_scope)
+        if result:
+            st.success(f"Version {result['version']}: learned {result['new_examples']} corrections")
+        else:
+            st.info("No new corrections to learn from")
+
+with col2:
+    if st.button("🔁 Retrain From Scratch", help="Uses only the latest correction of every row"):
+        result = train_category_model(rule_scope, full=True)
+        if result:
+            st.success(f"Version {result['version']} trained on {result['examples']} corrections")
+
+with col3:
+    inactive_versions = [m['version'] for m in models if not m['active']]
+    if inactive_versions:
+        rollback_version = st.selectbox("Roll back to version", inactive_versions)
+        if st.button("⏪ Activate Version"):
+            activate_category_model(rollback_version)
+            st.rerun()
+
+# Vendors
+st.markdown("---")
+st.subheader("🏢 Vendors")
+
+st.caption("Extracted vendor names are matched to canonical vendors, so OCR spelling variants are counted together.")
+
+vendors = get_vendors()
+unlinked = get_unlinked_vendor_count()
+
+col1, col2, col3 = st.columns(3)
+
+with col1:
+    st.metric("Vendors", len(vendors))
+
+with col2:
+    st.metric("Name Variants", sum(vendor['aliases'] for vendor in vendors))
+
+with col3:
+    st.metric("Unlinked Transactions", unlinked)
+    if unlinked and st.button("🔗 Link Existing Transactions"):
+        with st.spinner("Matching vendor names..."):
+            linked = backfill_vendors()
+        st.success(f"Linked {linked} transactions")
+        st.rerun()
+
+if vendors:
+    with st.expander("Vendor list"):
+        st.dataframe(
+            [{'Vendor': v['name'], 'Name Variants': v['aliases'], 'Transactions': v['transactions']} for v in vendors],
+            hide_index=True,
+            use_container_width=True
+        )
+
+# Product catalog
+st.markdown("---")
+st.subheader("🛒 Product Catalog")
+
+st.caption("Line-item descriptions are matched to catalog products, so item reports count spelling variants and numbered items together.")
+
+products = get_products()
+unlinked_items = get_unlinked_product_count()
+
+col1, col2, col3 = st.columns(3)
+
+with col1:
+    st.metric("Products", len(products))
+
+with col2:
+    st.metric("Description Variants", sum(product['aliases'] for product in products))
+
+with col3:
+    st.metric("Unlinked Line Items", unlinked_items)
+    if unlinked_items and st.button("🔗 Link Existing Line Items"):
+        with st.spinner("Matching item descriptions..."):
+            linked = backfill_products()
+        st.success(f"Linked {linked} line items")
+        st.rerun()
+
+if products:
+    with st.expander("Product list"):
+        st.dataframe(
+            [{'Product': p['name'], 'Description Variants': p['aliases'], 'Line Items': p['line_items']} for p in products],
+            hide_index=True,
+            use_container_width=True
+        )
+
+# Duplicate invoices
+st.markdown("---")
+st.subheader("🔁 Duplicate Invoices")
+
+st.caption("An invoice is identified by its vendor, invoice number, date and amount. Copies of an invoice already on file are checked at save time and kept out of totals and reports.")
+
+policy_labels = {
+    'flag': "Save and flag as duplicate",
+    'merge': "Merge into the saved copy",
+    'reject': "Reject",
+}
+st.session_state.duplicate_policy = st.selectbox(
+    "When an uploaded invoice is already on file",
+    DUPLICATE_POLICIES,
+    index=DUPLICATE_POLICIES.index(st.session_state.get('duplicate_policy', DUPLICATE_POLICY)),
+    format_func=policy_labels.get
+)
+
+if st.button("🔍 Scan for Duplicates"):
+    with st.spinner("Scanning transactions..."):
+        st.session_state.duplicate_scan = find_duplicates()
+
+if 'duplicate_scan' in st.session_state:
+    found = st.session_state.duplicate_scan
+    if found:
+        st.warning(f"{len(found)} saved transactions repeat an earlier invoice")
+        if st.button("🏷️ Flag Duplicates"):
+            flagged = flag_duplicates()
+            del st.session_state.duplicate_scan
+            st.success(f"Flagged {flagged} duplicates")
+    else:
+        st.success("No unflagged duplicates")
+
+# Backups
+st.markdown("---")
+st.subheader("🗄️ Backups")
+
+st.caption(f"Snapshots are copied online while uploads continue, verified and compressed. The newest {BACKUP_KEEP} are kept. Schedule `python -m utils.backup create` from cron for regular snapshots.")
+
+if st.button("💾 Create Backup Now"):
+    with st.spinner("Copying database..."):
+        result = create_backup()
+    st.success(f"Saved {result['path']} ({result['bytes'] / 1e6:.1f} MB in {result['seconds']:.1f}s)")
+
+backups = list_backups()
+if backups:
+    st.dataframe(
+        [{'Snapshot': os.path.basename(b['path']), 'Size (MB)': round(b['bytes'] / 1e6, 1), 'Created': b['created_at']} for b in backups],
+        hide_index=True,
+        use_container_width=True
+    )
+else:
+    st.info("No backups yet")
+
 # Instructions
 st.markdown("---")
 st.subheader("📖 Instructions")
@@ -60,6 +60,10 @@ if metrics["total_documents"] > 0:
         st.markdown("**Top Categories**")
         for cat, amount in metrics.get('top_categories', [])[:5]:
             st.write(f"- {cat}: ${amount:,.2f}")
+        
+        st.markdown("**By Department**")
+        for department, amount in metrics.get('department_totals', []):
+            st.write(f"- {department}: ${amount:,.2f}")
 else:
     st.info("👈 **Get started by uploading a document using the sidebar!**")
 
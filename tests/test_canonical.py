@@ -0,0 +1,25 @@
+import pytest
+
+from utils import database
+
+@pytest.fixture(autouse=True)
+def fresh_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'database.db'))
+    monkeypatch.chdir(tmp_path)
+    database.init_database()
+    database.clear_query_cache()
+    yield
+    database.get_write_queue().close()
+    database.clear_query_cache()
+
+def test_rolled_back_products_do_not_merge_with_reused_ids():
+    doc_id = database.save_document({'vendor_name': 'Acme', 'amount': 4.0, 'transaction_date': '2026-01-01'})
+    with pytest.raises(Exception):
+        database.save_line_items(doc_id, None, [{'description': 'Widget Deluxe', 'total': 2}, {'description': 'Bad', 'total': [1]}])
+    assert database.match_product('Widget Deluxe') is None
+    
+    database.save_line_items(doc_id, None, [{'description': 'Garden Hose', 'total': 2}])
+    database.save_line_items(doc_id, None, [{'description': 'Widget Deluxe', 'total': 2}])
+    
+    assert database.match_product('Widget Deluxe')['id'] != database.match_product('Garden Hose')['id']
+    assert [product['name'] for product in database.get_products()] == ['Garden Hose', 'Widget Deluxe']
@@ -0,0 +1,49 @@
+import pytest
+
+from utils import database, text_to_sql
+
+TOP_VENDORS_SQL = """
+    SELECT vendor_name, SUM(amount) AS total FROM transactions
+    WHERE transaction_date >= date('now', '-{days} days')
+    GROUP BY vendor_name ORDER BY total DESC LIMIT {limit}
+"""
+
+@pytest.fixture(autouse=True)
+def fresh_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'database.db'))
+    monkeypatch.chdir(tmp_path)
+    database.init_database()
+    database.clear_query_cache()
+    yield
+    database.get_write_queue().close()
+    database.clear_query_cache()
+
+def test_group_by_and_order_by_positions_stay_fixed():
+    question = "Which vendor had more than 1 invoice?"
+    sql = "SELECT vendor_name, COUNT(*) FROM transactions GROUP BY 1 HAVING COUNT(*) > 1 ORDER BY 2 DESC, 1 LIMIT 50"
+    
+    template, bindings, used = text_to_sql.parameterize(sql, text_to_sql.extract_literals(question))
+    
+    assert template == "SELECT vendor_name, COUNT(*) FROM transactions GROUP BY 1 HAVING COUNT(*) > ? ORDER BY 2 DESC, 1 LIMIT 50"
+    assert bindings == [(0, 'number')]
+    assert used == {0}
+
+def test_repeated_question_values_are_not_reused_for_other_values():
+    text_to_sql.generate_plan(
+        "Top 5 vendors in the last 5 days",
+        lambda system, question: TOP_VENDORS_SQL.format(days=5, limit=5)
+    )
+    
+    assert text_to_sql.lookup_plan("Top 10 vendors in the last 5 days") is None
+    sql, params = text_to_sql.lookup_plan("Top 5 vendors in the last 5 days")
+    assert "'-5 days'" in sql and 'LIMIT 5' in sql and params == ()
+
+def test_distinct_question_values_bind_in_order():
+    text_to_sql.generate_plan(
+        "Top 5 vendors in the last 30 days",
+        lambda system, question: TOP_VENDORS_SQL.format(days=30, limit=5)
+    )
+    
+    sql, params = text_to_sql.lookup_plan("Top 10 vendors in the last 7 days")
+    assert 'LIMIT ?' in sql
+    assert params == ('7', 10)
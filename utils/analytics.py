@@ -0,0 +1,357 @@
+import bisect
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import time
+from utils import change_log, database
+
+# Try to import the columnar stack (optional)
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ANALYTICS_AVAILABLE = True
+except ImportError:
+    ANALYTICS_AVAILABLE = False
+
+MIRROR_DIR = "data/analytics"
+SYNC_CHUNK_ROWS = 100000
+
+# Change-log consumer name of the mirror
+MIRROR_CONSUMER = 'analytics_mirror'
+
+# Mirrored tables: column name -> type ('int', 'float' or 'str'); timestamps stay as
+# text so ordering and formatting match SQLite
+MIRROR_TABLES = {
+    'documents': {
+        'id': 'int', 'source': 'str', 'document_type': 'str', 'status': 'str',
+        'confidence_score': 'float', 'uploaded_at': 'str', 'processed_at': 'str',
+    },
+    'transactions': {
+        'id': 'int', 'document_id': 'int', 'vendor_name': 'str', 'invoice_number': 'str',
+        'transaction_date': 'str', 'amount': 'float', 'currency': 'str', 'tax_amount': 'float',
+        'category': 'str', 'category_id': 'int', 'department': 'str', 'status': 'str', 'duplicate_of': 'int',
+        'created_at': 'str',
+    },
+    'line_items': {
+        'id': 'int', 'document_id': 'int', 'transaction_id': 'int', 'description': 'str',
+        'quantity': 'float', 'unit_price': 'float', 'total': 'float', 'category': 'str',
+        'category_id': 'int', 'product_id': 'int', 'created_at': 'str',
+    },
+}
+
+# Small lookup tables copied whole from SQLite into every DuckDB connection
+DIMENSION_TABLES = {
+    'categories': {'id': 'int', 'name': 'str', 'parent_id': 'int', 'department': 'str'},
+    'category_closure': {'ancestor_id': 'int', 'descendant_id': 'int', 'depth': 'int'},
+}
+
+# Column used to partition each table by month
+PARTITION_COLUMNS = {
+    'documents': 'uploaded_at',
+    'transactions': 'created_at',
+    'line_items': 'created_at',
+}
+
+def _manifest_path():
+    return os.path.join(MIRROR_DIR, 'manifest.json')
+
+def load_manifest():
+    """Read the mirror manifest (high-water marks per table and change-log position)"""
+    try:
+        with open(_manifest_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'tables': {}, 'synced_at': None}
+
+def _save_manifest(manifest):
+    """Atomically replace the manifest"""
+    tmp_path = _manifest_path() + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, _manifest_path())
+
+def _arrow_schema(table):
+    """Arrow schema for a mirrored or dimension table"""
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+    columns = MIRROR_TABLES.get(table) or DIMENSION_TABLES[table]
+    return pa.schema([(name, types[kind]) for name, kind in columns.items()])
+
+def _write_partitions(table, rows, first_id, last_id):
+    """Write one chunk of rows as a Parquet file per month partition.
+    
+    Each file is written beside its target and renamed over it, so readers
+    see either the old or the new chunk. Returns the written paths.
+    """
+    columns = list(MIRROR_TABLES[table])
+    partition_index = columns.index(PARTITION_COLUMNS[table])
+    
+    by_month = {}
+    for row in rows:
+        month = (row[partition_index] or 'unknown')[:7]
+        by_month.setdefault(month, []).append(row)
+    
+    paths = []
+    for month, month_rows in by_month.items():
+        directory = os.path.join(MIRROR_DIR, table, f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        
+        data = {name: [row[i] for row in month_rows] for i, name in enumerate(columns)}
+        arrow_table = pa.Table.from_pydict(data, schema=_arrow_schema(table))
+        path = os.path.join(directory, f"part-{first_id:012d}-{last_id:012d}.parquet")
+        tmp_path = path + '.tmp'
+        try:
+            pq.write_table(arrow_table, tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        paths.append(path)
+    
+    return paths
+
+def _chunk_files(table):
+    """Mirror files of a table grouped by the id range of the export chunk that wrote them"""
+    chunks = {}
+    for path in glob.glob(os.path.join(MIRROR_DIR, table, '*', 'part-*.parquet')):
+        first_id, last_id = os.path.basename(path)[len('part-'):-len('.parquet')].split('-')
+        chunks.setdefault((int(first_id), int(last_id)), []).append(path)
+    return chunks
+
+def _rewrite_chunks(cursor, table, row_ids):
+    """Re-export only the chunks containing the given (updated or deleted) row ids.
+    
+    Returns the number of rows written.
+    """
+    chunks = _chunk_files(table)
+    ranges = sorted(chunks)
+    starts = [first_id for first_id, _ in ranges]
+    
+    affected = set()
+    for row_id in row_ids:
+        index = bisect.bisect_right(starts, row_id) - 1
+        if index >= 0 and row_id <= ranges[index][1]:
+            affected.add(ranges[index])
+    
+    count = 0
+    for first_id, last_id in sorted(affected):
+        cursor.execute(
+            f"SELECT {', '.join(MIRROR_TABLES[table])} FROM {table} WHERE id BETWEEN ? AND ? ORDER BY id",
+            (first_id, last_id)
+        )
+        rows = cursor.fetchall()
+        written = set(_write_partitions(table, rows, first_id, last_id)) if rows else set()
+        
+        # Only drop month files the replacement no longer covers, after it exists
+        for path in chunks[(first_id, last_id)]:
+            if path not in written:
+                os.remove(path)
+        count += len(rows)
+    
+    return count
+
+def sync_mirror():
+    """Bring the Parquet mirror of documents, transactions and line_items up to date.
+    
+    New rows are appended by id. Updates and deletes of already exported rows
+    are read from the change log since the last sync, and only the export
+    chunks containing those rows are rewritten. The first sync (or one after
+    the mirror's change-log position was lost) exports everything.
+    Returns per-table counts of exported rows.
+    """
+    if not ANALYTICS_AVAILABLE:
+        raise RuntimeError("Analytics mirror requires duckdb and pyarrow")
+    
+    os.makedirs(MIRROR_DIR, exist_ok=True)
+    manifest = load_manifest()
+    exported = {}
+    
+    # Register before reading so compaction keeps the changes made during the export
+    since_seq = manifest.get('change_seq')
+    if change_log.get_checkpoint(MIRROR_CONSUMER) is None:
+        change_log.register_consumer(MIRROR_CONSUMER)
+        since_seq = None
+    
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    
+    # One read transaction so the change log and the exported rows are the same snapshot
+    cursor.execute("BEGIN")
+    
+    try:
+        # Without every change since the last sync the mirror cannot be patched: rebuild it
+        if since_seq is None or since_seq < change_log.get_compacted_seq(cursor):
+            since_seq = None
+            for table in MIRROR_TABLES:
+                shutil.rmtree(os.path.join(MIRROR_DIR, table), ignore_errors=True)
+            manifest['tables'] = {}
+        
+        change_seq = change_log.get_max_seq(cursor)
+        summary = {}
+        if since_seq is not None:
+            summary = change_log.summarize_changes(change_log.fetch_changes(cursor, since_seq))
+        
+        for table, columns in MIRROR_TABLES.items():
+            state = manifest['tables'].get(table, {'high_water_id': 0})
+            count = 0
+            
+            # Files written with another column set are re-exported in full
+            if state.get('columns') != list(columns):
+                shutil.rmtree(os.path.join(MIRROR_DIR, table), ignore_errors=True)
+                state = {'high_water_id': 0, 'columns': list(columns)}
+            
+            # Changed rows that were already exported
+            changes = summary.get(table)
+            if changes:
+                changed_ids = [row_id for row_id in changes['upserted'] | changes['deleted'] if row_id <= state['high_water_id']]
+                count += _rewrite_chunks(cursor, table, changed_ids)
+            
+            cursor.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id",
+                (state['high_water_id'],)
+            )
+            
+            while True:
+                rows = cursor.fetchmany(SYNC_CHUNK_ROWS)
+                if not rows:
+                    break
+                _write_partitions(table, rows, rows[0][0], rows[-1][0])
+                state['high_water_id'] = rows[-1][0]
+                count += len(rows)
+            
+            manifest['tables'][table] = state
+            exported[table] = count
+    finally:
+        conn.rollback()
+        conn.close()
+    
+    manifest['change_seq'] = change_seq
+    manifest['synced_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    _save_manifest(manifest)
+    
+    # Only advance the consumer once the manifest is on disk
+    change_log.commit_checkpoint(MIRROR_CONSUMER, change_seq)
+    change_log.compact()
+    database.bump_table_versions('analytics_mirror')
+    
+    return exported
+
+def mirror_ready():
+    """Whether the columnar query path can be used"""
+    return ANALYTICS_AVAILABLE and bool(load_manifest()['tables'])
+
+def get_mirror_status():
+    """Freshness of the mirror: last sync time, unexported rows and pending edits.
+    
+    pending_rows counts rows newer than the mirror per table; pending_changes
+    counts updates and deletes of exported rows waiting in the change log.
+    """
+    manifest = load_manifest()
+    status = {'available': ANALYTICS_AVAILABLE, 'synced_at': manifest['synced_at'], 'pending_rows': {}, 'pending_changes': 0}
+    
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    
+    for table in MIRROR_TABLES:
+        high_water_id = manifest['tables'].get(table, {}).get('high_water_id', 0)
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE id > ?", (high_water_id,))
+        status['pending_rows'][table] = cursor.fetchone()[0]
+    
+    if manifest.get('change_seq') is not None:
+        cursor.execute("SELECT COUNT(*) FROM change_log WHERE seq > ? AND operation != 'insert'", (manifest['change_seq'],))
+        status['pending_changes'] = cursor.fetchone()[0]
+    
+    conn.close()
+    return status
+
+def _copy_rows(con, name, table, rows):
+    """Load SQLite rows of a mirrored or dimension table into a DuckDB table.
+    
+    The rows are copied rather than registered as an Arrow scan: DuckDB
+    pushes join filters into scans that PyArrow cannot evaluate.
+    """
+    columns = MIRROR_TABLES.get(table) or DIMENSION_TABLES[table]
+    con.register('_rows', pa.Table.from_pydict(
+        {column: [row[i] for row in rows] for i, column in enumerate(columns)},
+        schema=_arrow_schema(table)
+    ))
+    con.execute(f"CREATE TABLE {name} AS SELECT * FROM _rows")
+    con.unregister('_rows')
+
+def connect_mirror():
+    """DuckDB connection with one view per mirrored table.
+    
+    Each view is the Parquet mirror plus rows read straight from SQLite: rows
+    added since the last sync, and rows with changes in the change log the
+    mirror has not applied yet (their exported copies are left out, so
+    deleted rows disappear). Queries therefore match SQLite before the next
+    sync_mirror(). The small DIMENSION_TABLES are copied in whole on every
+    connect.
+    """
+    if not ANALYTICS_AVAILABLE:
+        raise RuntimeError("Analytics mirror requires duckdb and pyarrow")
+    
+    manifest = load_manifest()
+    con = duckdb.connect()
+    
+    # Without a change-log position exported rows cannot be trusted
+    change_seq = manifest.get('change_seq')
+    if change_seq is not None and change_log.get_checkpoint(MIRROR_CONSUMER) is None:
+        change_seq = None
+    
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    
+    # One read transaction so the change log and the rows read are the same snapshot
+    cursor.execute("BEGIN")
+    
+    try:
+        # Nor once changes the mirror has not applied were compacted away
+        if change_seq is not None and change_seq < change_log.get_compacted_seq(cursor):
+            change_seq = None
+        
+        changed = {}
+        if change_seq is not None:
+            cursor.execute("SELECT DISTINCT table_name, row_id FROM change_log WHERE seq > ?", (change_seq,))
+            for table, row_id in cursor.fetchall():
+                changed.setdefault(table, []).append(row_id)
+        
+        for table, columns in MIRROR_TABLES.items():
+            column_list = ', '.join(columns)
+            state = manifest['tables'].get(table, {})
+            # Until the next sync, a table mirrored with an older column set is read from SQLite
+            high_water_id = state.get('high_water_id', 0) if state.get('columns') == list(columns) and change_seq is not None else 0
+            changed_ids = [row_id for row_id in changed.get(table, ()) if row_id <= high_water_id]
+            
+            # Rows newer than the last sync, and changed rows, come straight from SQLite
+            cursor.execute(
+                f"SELECT {column_list} FROM {table} WHERE id > ? OR id IN (SELECT value FROM json_each(?)) ORDER BY id",
+                (high_water_id, json.dumps(changed_ids))
+            )
+            _copy_rows(con, f"{table}_tail", table, cursor.fetchall())
+            
+            sources = [f"SELECT {column_list} FROM {table}_tail"]
+            pattern = os.path.join(MIRROR_DIR, table, '*', '*.parquet')
+            # A table whose exported rows were all deleted has no files left to read
+            if high_water_id and _chunk_files(table):
+                mirrored = f"SELECT {column_list} FROM read_parquet('{pattern}', hive_partitioning = true)"
+                if changed_ids:
+                    con.register('_ids', pa.table({'id': pa.array(changed_ids, pa.int64())}))
+                    con.execute(f"CREATE TABLE {table}_changed AS SELECT id FROM _ids")
+                    con.unregister('_ids')
+                    mirrored += f" WHERE id NOT IN (SELECT id FROM {table}_changed)"
+                sources.insert(0, mirrored)
+            
+            con.execute(f"CREATE VIEW {table} AS {' UNION ALL '.join(sources)}")
+        
+        for table, columns in DIMENSION_TABLES.items():
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+            _copy_rows(con, table, table, cursor.fetchall())
+    finally:
+        conn.rollback()
+        conn.close()
+    
+    return con
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from utils import database
+
+# Answers kept in memory, and how long an answer stays valid
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_TTL = 24 * 3600
+
+# Answers are also written to the database when persistence is on, so they survive restarts
+ANSWER_CACHE_PERSIST = False
+
+_answers = OrderedDict()
+_answers_lock = threading.Lock()
+_answer_stats = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'expired': 0, 'evictions': 0, 'saved_ms': 0.0}
+
+def normalize_question(question):
+    """Question without case, repeated whitespace or trailing punctuation"""
+    return ' '.join(re.sub(r'[?!.\s]+$', '', (question or '').lower()).split())
+
+def fingerprint_results(results):
+    """Hash of query results; answers about different data never share a key"""
+    return hashlib.sha1(json.dumps(results, sort_keys=True, default=str).encode()).hexdigest()
+
+def answer_key(question, results, provider, model):
+    """Cache key of an LLM answer: normalized question, result fingerprint, provider and model"""
+    parts = [database.DB_PATH, normalize_question(question), fingerprint_results(results), provider or '', model or '']
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+def get_answer(key, persist=ANSWER_CACHE_PERSIST):
+    """Cached answer for a key, or None when missing or older than ANSWER_CACHE_TTL"""
+    now = time.time()
+    with _answers_lock:
+        entry = _answers.get(key)
+        if entry is not None and now - entry['created'] > ANSWER_CACHE_TTL:
+            del _answers[key]
+            _answer_stats['expired'] += 1
+            entry = None
+        if entry is not None:
+            _answers.move_to_end(key)
+            _answer_stats['hits'] += 1
+            _answer_stats['saved_ms'] += entry['latency_ms']
+            return entry['answer']
+    
+    if persist:
+        entry = _load_answer(key, now)
+        if entry is not None:
+            _remember(key, entry)
+            with _answers_lock:
+                _answer_stats['hits'] += 1
+                _answer_stats['disk_hits'] += 1
+                _answer_stats['saved_ms'] += entry['latency_ms']
+            return entry['answer']
+    
+    with _answers_lock:
+        _answer_stats['misses'] += 1
+    return None
+
+def put_answer(key, answer, latency_ms, persist=ANSWER_CACHE_PERSIST):
+    """Remember an answer and how long the LLM took to produce it"""
+    entry = {'answer': answer, 'latency_ms': latency_ms, 'created': time.time()}
+    _remember(key, entry)
+    if persist:
+        database.submit_write(_save_answer, key, entry, tables=('chat_answers',))
+
+def _remember(key, entry):
+    with _answers_lock:
+        _answers[key] = entry
+        _answers.move_to_end(key)
+        while len(_answers) > ANSWER_CACHE_SIZE:
+            _answers.popitem(last=False)
+            _answer_stats['evictions'] += 1
+
+def _load_answer(key, now):
+    conn = sqlite3.connect(database.DB_PATH)
+    row = conn.execute(
+        "SELECT answer, latency_ms, created FROM chat_answers WHERE key = ? AND created > ?",
+        (key, now - ANSWER_CACHE_TTL)
+    ).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return {'answer': row[0], 'latency_ms': row[1], 'created': row[2]}
+
+def _save_answer(cursor, key, entry):
+    cursor.execute(
+        "INSERT OR REPLACE INTO chat_answers (key, answer, latency_ms, created) VALUES (?, ?, ?, ?)",
+        (key, entry['answer'], entry['latency_ms'], entry['created'])
+    )
+    
+    # Drop expired answers and keep the most recent ones
+    cursor.execute("DELETE FROM chat_answers WHERE created <= ?", (entry['created'] - ANSWER_CACHE_TTL,))
+    cursor.execute("""
+        DELETE FROM chat_answers WHERE key NOT IN (
+            SELECT key FROM chat_answers ORDER BY created DESC LIMIT ?
+        )
+    """, (ANSWER_CACHE_SIZE,))
+
+def get_answer_cache_stats():
+    """Hit/miss counters, LLM time saved by hits and size of the answer cache"""
+    with _answers_lock:
+        stats = dict(_answer_stats)
+        stats['size'] = len(_answers)
+    
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+def clear_answers():
+    """Forget all cached answers, on disk too, and reset the statistics"""
+    with _answers_lock:
+        _answers.clear()
+        for name in _answer_stats:
+            _answer_stats[name] = 0.0 if name == 'saved_ms' else 0
+    database.submit_write(lambda cursor: cursor.execute("DELETE FROM chat_answers"), tables=('chat_answers',)).result()
@@ -0,0 +1,216 @@
+"""Online backups of the SQLite database (command line: python -m utils.backup --help)"""
+import argparse
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from urllib.request import pathname2url
+from utils import database
+
+BACKUP_DIR = "data/backups"
+BACKUP_KEEP = 7
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_PAUSE = 0.005
+BACKUP_MAX_RESTARTS = 3
+COPY_CHUNK_BYTES = 1024 * 1024
+
+class BackupError(Exception):
+    """Raised when a snapshot cannot be taken or fails verification"""
+
+class _BackupRestarted(Exception):
+    """The source changed through another connection and the paged copy started over"""
+
+def _copy_database(source_path, target_path, pages, pause):
+    """Copy a live database into target_path with the online backup API.
+    
+    Copies `pages` pages per step and pauses between steps so writers get
+    the lock. Returns how many times the copy had to start over.
+    """
+    for attempt in range(BACKUP_MAX_RESTARTS + 1):
+        source = sqlite3.connect(source_path, timeout=30, isolation_level=None)
+        target = sqlite3.connect(target_path)
+        
+        # Under WAL, an open read transaction pins a snapshot: writers keep
+        # committing and the copy never restarts. In rollback-journal mode it
+        # would block writers, so there commits from other connections
+        # restart the copy and the last attempt runs in a single step.
+        pinned = source.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        if pinned:
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        
+        remaining_before = [None]
+        
+        def progress(status, remaining, total):
+            if remaining_before[0] is not None and remaining > remaining_before[0]:
+                raise _BackupRestarted()
+            remaining_before[0] = remaining
+            time.sleep(pause)
+        
+        step_pages = pages if pinned or attempt < BACKUP_MAX_RESTARTS else -1
+        try:
+            source.backup(target, pages=step_pages, progress=progress)
+            return attempt
+        except _BackupRestarted:
+            continue
+        finally:
+            target.close()
+            source.close()
+    
+    raise BackupError(f"Backup restarted {BACKUP_MAX_RESTARTS + 1} times because of concurrent writes")
+
+def _integrity_check(path):
+    """Run PRAGMA integrity_check; returns the list of problems (empty when healthy)"""
+    conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return [] if problems == ['ok'] else problems
+
+def _compress(source_path, target_path):
+    with open(source_path, 'rb') as source, gzip.open(target_path, 'wb', compresslevel=6) as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_BYTES)
+
+def _decompress(source_path, target_path):
+    """Copy a snapshot to target_path, decompressing .gz files"""
+    opener = gzip.open if source_path.endswith('.gz') else open
+    with opener(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_BYTES)
+
+def list_backups(backup_dir=BACKUP_DIR):
+    """Snapshots in backup_dir, newest first"""
+    paths = glob.glob(os.path.join(backup_dir, 'backup-*.db.gz')) + glob.glob(os.path.join(backup_dir, 'backup-*.db'))
+    backups = [
+        {'path': path, 'bytes': os.path.getsize(path), 'created_at': datetime.fromtimestamp(os.path.getmtime(path))}
+        for path in paths
+    ]
+    return sorted(backups, key=lambda backup: backup['path'], reverse=True)
+
+def rotate_backups(keep=BACKUP_KEEP, backup_dir=BACKUP_DIR):
+    """Delete all but the newest `keep` snapshots; returns the deleted paths"""
+    deleted = [backup['path'] for backup in list_backups(backup_dir)[keep:]]
+    for path in deleted:
+        os.remove(path)
+    return deleted
+
+def create_backup(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP, compress=True,
+                  pages=BACKUP_PAGES_PER_STEP, pause=BACKUP_STEP_PAUSE):
+    """Take a verified snapshot of the live database and rotate old ones.
+    
+    Pages are copied in small steps from a pinned WAL read snapshot, so
+    uploads keep committing while a backup runs. Returns the snapshot path,
+    its size, the copy time and how often the paged copy had to restart
+    because of concurrent writes.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    name = f"backup-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.db"
+    path = os.path.join(backup_dir, name + ('.gz' if compress else ''))
+    if os.path.exists(path):
+        raise BackupError(f"Snapshot {path} already exists")
+    
+    start = time.perf_counter()
+    fd, copy_path = tempfile.mkstemp(dir=backup_dir, suffix='.tmp')
+    os.close(fd)
+    
+    try:
+        restarts = _copy_database(database.DB_PATH, copy_path, pages, pause)
+        
+        problems = _integrity_check(copy_path)
+        if problems:
+            raise BackupError(f"Snapshot failed integrity check: {problems[:5]}")
+        
+        if compress:
+            _compress(copy_path, copy_path + '.gz')
+            os.replace(copy_path + '.gz', path)
+        else:
+            os.replace(copy_path, path)
+    finally:
+        for leftover in (copy_path, copy_path + '.gz'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    
+    rotate_backups(keep, backup_dir)
+    
+    return {
+        'path': path,
+        'bytes': os.path.getsize(path),
+        'seconds': time.perf_counter() - start,
+        'restarts': restarts,
+    }
+
+def verify_backup(path):
+    """Decompress a snapshot to a scratch file and integrity-check it; returns table row counts"""
+    with tempfile.TemporaryDirectory() as scratch:
+        return restore_backup(path, os.path.join(scratch, 'verify.db'))
+
+def restore_backup(path, target_path):
+    """Restore a snapshot into target_path (a scratch location, not the live database).
+    
+    The restored copy is integrity-checked; returns its row counts per table.
+    To replace the live database, stop the app and move the restored file
+    over data/database.db.
+    """
+    if os.path.abspath(target_path) == os.path.abspath(database.DB_PATH):
+        raise BackupError("Refusing to restore over the live database; restore to another path and swap it in while the app is stopped")
+    
+    _decompress(path, target_path)
+    
+    problems = _integrity_check(target_path)
+    if problems:
+        raise BackupError(f"Restored database failed integrity check: {problems[:5]}")
+    
+    conn = sqlite3.connect(target_path)
+    counts = {}
+    for table in ('documents', 'transactions', 'line_items'):
+        try:
+            counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        except sqlite3.OperationalError:
+            counts[table] = None
+    conn.close()
+    
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backups of the document database")
+    parser.add_argument('--db', default=database.DB_PATH, help="database to back up")
+    parser.add_argument('--dir', default=BACKUP_DIR, help="snapshot directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    create = commands.add_parser('create', help="take, verify and rotate a snapshot")
+    create.add_argument('--keep', type=int, default=BACKUP_KEEP)
+    create.add_argument('--no-compress', action='store_true')
+    create.add_argument('--pages', type=int, default=BACKUP_PAGES_PER_STEP, help="pages copied per step")
+    
+    commands.add_parser('list', help="list snapshots")
+    
+    verify = commands.add_parser('verify', help="integrity-check a snapshot")
+    verify.add_argument('path')
+    
+    restore = commands.add_parser('restore', help="restore a snapshot to a scratch path")
+    restore.add_argument('path')
+    restore.add_argument('target')
+    
+    args = parser.parse_args()
+    database.DB_PATH = args.db
+    
+    try:
+        if args.command == 'create':
+            result = create_backup(args.dir, keep=args.keep, compress=not args.no_compress, pages=args.pages)
+            print(f"{result['path']} {result['bytes'] / 1e6:.1f} MB in {result['seconds']:.1f}s ({result['restarts']} restarts)")
+        elif args.command == 'list':
+            for backup in list_backups(args.dir):
+                print(f"{backup['path']}  {backup['bytes'] / 1e6:8.1f} MB  {backup['created_at']:%Y-%m-%d %H:%M:%S}")
+        elif args.command == 'verify':
+            print(f"ok {verify_backup(args.path)}")
+        elif args.command == 'restore':
+            print(f"restored to {args.target} {restore_backup(args.path, args.target)}")
+    except (BackupError, OSError, sqlite3.Error) as e:
+        raise SystemExit(f"backup {args.command} failed: {e}")
+
+if __name__ == '__main__':
+    main()
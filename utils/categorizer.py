@@ -0,0 +1,84 @@
+from collections import deque
+
+# How a keyword must sit in the text to count as a match
+MATCH_MODES = ('substring', 'word', 'prefix')
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton mapping keywords to labels in a single pass over the text.
+    
+    Built from (keyword, label, priority, match_mode) rules. best() scans the
+    lower-cased text once, however many keywords there are, and returns the
+    label of the highest-priority match; ties go to the earliest rule.
+    match_mode 'word' requires non-alphanumeric characters (or the text
+    edges) on both sides of the keyword, 'prefix' only before it.
+    """
+    
+    def __init__(self, rules):
+        self.rules = [
+            (keyword.lower(), label, priority, match_mode)
+            for keyword, label, priority, match_mode in rules
+            if keyword and keyword.strip()
+        ]
+        self._build()
+    
+    def _build(self):
+        goto = [{}]
+        outputs = [[]]
+        
+        # Trie of all keywords
+        for index, (keyword, _, _, _) in enumerate(self.rules):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(index)
+        
+        # Breadth-first failure links, folded into a complete transition table
+        # so matching needs a single dict lookup per character
+        fail = [0] * len(goto)
+        delta = [dict(edges) for edges in goto]
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(char, 0)
+                pending.append(child)
+            for char, fallback in delta[fail[state]].items():
+                delta[state].setdefault(char, fallback)
+        
+        self._delta = delta
+        self._outputs = [tuple(output) for output in outputs]
+    
+    def iter_matches(self, text):
+        """Yield (start, end, rule index) for every keyword occurrence that satisfies its match mode"""
+        text = (text or '').lower()
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        
+        for end, char in enumerate(text, 1):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    keyword, _, _, match_mode = self.rules[index]
+                    start = end - len(keyword)
+                    if match_mode != 'substring':
+                        if start > 0 and text[start - 1].isalnum():
+                            continue
+                        if match_mode == 'word' and end < len(text) and text[end].isalnum():
+                            continue
+                    yield start, end, index
+    
+    def best(self, text, default=None):
+        """Label of the highest-priority matching rule, or default"""
+        best_index = None
+        for _, _, index in self.iter_matches(text):
+            if best_index is None or (self.rules[index][2], -index) > (self.rules[best_index][2], -best_index):
+                best_index = index
+        return self.rules[best_index][1] if best_index is not None else default
@@ -0,0 +1,136 @@
+import sqlite3
+from utils import database
+
+CHANGE_BATCH = 10000
+
+def fetch_changes(cursor, after_seq, limit=None):
+    """Change log entries with seq > after_seq, oldest first, as (seq, table_name, row_id, operation)"""
+    sql = "SELECT seq, table_name, row_id, operation FROM change_log WHERE seq > ? ORDER BY seq"
+    params = [after_seq]
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+def summarize_changes(changes):
+    """Collapse entries to the net effect per row: {table: {'upserted': ids, 'deleted': ids}}.
+    
+    The latest operation on a row wins, so a row inserted and then deleted
+    only appears as deleted.
+    """
+    latest = {}
+    for seq, table_name, row_id, operation in changes:
+        latest[(table_name, row_id)] = operation
+    
+    summary = {}
+    for (table_name, row_id), operation in latest.items():
+        entry = summary.setdefault(table_name, {'upserted': set(), 'deleted': set()})
+        entry['deleted' if operation == 'delete' else 'upserted'].add(row_id)
+    return summary
+
+def get_max_seq(cursor):
+    """Sequence number of the newest change ever logged (0 if none)"""
+    # sqlite_sequence keeps the high-water mark even after compaction
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def get_compacted_seq(cursor):
+    """Newest sequence number whose entry may have been compacted away (0 if none).
+    
+    A consumer whose checkpoint is older than this has missed changes.
+    """
+    cursor.execute("SELECT MIN(seq) FROM change_log")
+    min_seq = cursor.fetchone()[0]
+    return min_seq - 1 if min_seq is not None else get_max_seq(cursor)
+
+def get_checkpoint(consumer):
+    """Last sequence number the consumer has processed, or None if it is not registered"""
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT checkpoint FROM change_consumers WHERE name = ?", (consumer,))
+    row = cursor.fetchone()
+    
+    conn.close()
+    return row[0] if row else None
+
+def register_consumer(consumer, checkpoint=None):
+    """Start tracking a consumer; by default it only sees changes made from now on"""
+    return database.submit_write(_register_consumer, consumer, checkpoint).result()
+
+def _register_consumer(cursor, consumer, checkpoint):
+    if checkpoint is None:
+        checkpoint = get_max_seq(cursor)
+    cursor.execute("INSERT OR IGNORE INTO change_consumers (name, checkpoint) VALUES (?, ?)", (consumer, checkpoint))
+    cursor.execute("SELECT checkpoint FROM change_consumers WHERE name = ?", (consumer,))
+    return cursor.fetchone()[0]
+
+def read_changes(consumer, limit=CHANGE_BATCH):
+    """Next batch of changes after the consumer's checkpoint.
+    
+    Returns (changes, last_seq). Pass last_seq to commit_checkpoint() once
+    the batch is processed; until then the same batch is returned again.
+    """
+    checkpoint = get_checkpoint(consumer)
+    if checkpoint is None:
+        checkpoint = register_consumer(consumer)
+    
+    conn = sqlite3.connect(database.DB_PATH)
+    changes = fetch_changes(conn.cursor(), checkpoint, limit)
+    conn.close()
+    
+    return changes, (changes[-1][0] if changes else checkpoint)
+
+def commit_checkpoint(consumer, seq):
+    """Record that the consumer has processed all changes up to seq"""
+    database.submit_write(_commit_checkpoint, consumer, seq).result()
+
+def _commit_checkpoint(cursor, consumer, seq):
+    cursor.execute("""
+        INSERT INTO change_consumers (name, checkpoint, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(name) DO UPDATE SET checkpoint = MAX(checkpoint, excluded.checkpoint), updated_at = excluded.updated_at
+    """, (consumer, seq))
+
+def unregister_consumer(consumer):
+    """Stop tracking a consumer so it no longer holds back compaction"""
+    database.submit_write(_unregister_consumer, consumer).result()
+
+def _unregister_consumer(cursor, consumer):
+    cursor.execute("DELETE FROM change_consumers WHERE name = ?", (consumer,))
+
+def compact():
+    """Delete entries every registered consumer has processed; returns the number deleted"""
+    return database.submit_write(compact_changes, tables=('change_log',)).result()
+
+def compact_changes(cursor):
+    """compact() on a cursor inside a write transaction; the writer thread runs it when idle"""
+    cursor.execute("SELECT MIN(checkpoint) FROM change_consumers")
+    checkpoint = cursor.fetchone()[0]
+    if checkpoint is None:
+        # Nobody is reading; new consumers start from the current sequence anyway,
+        # so without consumers nothing is kept
+        checkpoint = get_max_seq(cursor)
+    
+    cursor.execute("DELETE FROM change_log WHERE seq <= ?", (checkpoint,))
+    return cursor.rowcount
+
+def get_change_log_status():
+    """Entries kept, newest sequence number and how far behind each consumer is"""
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT COUNT(*) FROM change_log")
+    entries = cursor.fetchone()[0]
+    max_seq = get_max_seq(cursor)
+    
+    cursor.execute("SELECT name, checkpoint, updated_at FROM change_consumers ORDER BY name")
+    consumers = {
+        name: {'checkpoint': checkpoint, 'lag': max_seq - checkpoint, 'updated_at': updated_at}
+        for name, checkpoint, updated_at in cursor.fetchall()
+    }
+    
+    conn.close()
+    return {'entries': entries, 'max_seq': max_seq, 'consumers': consumers}
@@ -1,8 +1,66 @@
+import hashlib
 import os
+import threading
+import time
 import streamlit as st
 from openai import OpenAI
+from utils import text_to_sql
+from utils.answer_cache import answer_key, get_answer, put_answer, ANSWER_CACHE_PERSIST
 from utils.database import execute_query
 
+# Timeout (seconds) and retries of LLM requests. OpenAI-compatible clients retry
+# connection errors, 429s and 5xx responses with exponential backoff.
+LLM_TIMEOUT = 60
+LLM_MAX_RETRIES = 3
+
+_llm_clients = {}
+_llm_clients_lock = threading.Lock()
+_llm_client_stats = {'created': 0, 'reused': 0}
+
+def get_llm_client(provider, base_url=None, api_key=None, model=None):
+    """Shared client for a provider, base URL and API key, created on first use.
+    
+    A client keeps its HTTP connections alive in a pool, so only the first
+    message to a provider pays for connection and TLS setup. Gemini models
+    are kept per model name, but google.generativeai holds a single
+    process-wide API key: creating a model for another key switches the
+    key for every session's Gemini models.
+    """
+    key = (provider, base_url, hashlib.sha256((api_key or "").encode()).hexdigest(), model if provider == "gemini" else None)
+    
+    with _llm_clients_lock:
+        client = _llm_clients.get(key)
+        if client is not None:
+            _llm_client_stats['reused'] += 1
+            return client
+        
+        if provider == "gemini":
+            import google.generativeai as genai
+            # Process-global; see the docstring
+            genai.configure(api_key=api_key)
+            client = genai.GenerativeModel(model)
+        else:
+            client = OpenAI(base_url=base_url, api_key=api_key, timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES)
+        
+        _llm_clients[key] = client
+        _llm_client_stats['created'] += 1
+        return client
+
+def clear_llm_clients():
+    """Forget all shared clients, e.g. after the provider changes.
+    
+    Clients are not closed: other sessions may still have requests in
+    flight on them. Their connections are released once they are garbage
+    collected.
+    """
+    with _llm_clients_lock:
+        _llm_clients.clear()
+
+def get_llm_client_stats():
+    """Number of clients created and reused, and how many are open"""
+    with _llm_clients_lock:
+        return dict(_llm_client_stats, open=len(_llm_clients))
+
 def get_configured_llm():
     """Get LLM client based on settings"""
     provider = st.session_state.get('llm_provider') or st.secrets.get("llm", {}).get("provider", "OpenAI")
@@ -12,23 +70,21 @@ def get_configured_llm():
         if provider == "OpenAI":
             api_key = st.secrets.get("openai", {}).get("api_key") or os.getenv("OPENAI_API_KEY")
             if api_key:
-                return OpenAI(api_key=api_key), model, "openai"
+                return get_llm_client("openai", api_key=api_key), model, "openai"
         
         elif provider == "OpenRouter":
             api_key = st.secrets.get("openrouter", {}).get("api_key") or os.getenv("OPENROUTER_API_KEY")
             if api_key:
-                return OpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key), model, "openrouter"
+                return get_llm_client("openrouter", "https://openrouter.ai/api/v1", api_key), model, "openrouter"
         
         elif provider == "Google Gemini":
             api_key = st.secrets.get("google_gemini", {}).get("api_key") or os.getenv("GOOGLE_GEMINI_API_KEY")
             if api_key:
-                import google.generativeai as genai
-                genai.configure(api_key=api_key)
-                return genai.GenerativeModel(model), model, "gemini"
+                return get_llm_client("gemini", api_key=api_key, model=model), model, "gemini"
         
         elif provider == "Local (Ollama)":
             base_url = st.secrets.get("ollama", {}).get("base_url", "http://localhost:11434")
-            return OpenAI(base_url=base_url + "/v1", api_key="ollama"), model, "ollama"
+            return get_llm_client("ollama", base_url + "/v1", "ollama"), model, "ollama"
     
     except Exception as e:
         st.warning(f"Error loading {provider}: {str(e)}")
@@ -42,10 +98,7 @@ def get_openrouter_client():
     if not api_key:
         return None
     
-    return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key
-    )
+    return get_llm_client("openrouter", "https://openrouter.ai/api/v1", api_key)
 
 def get_openai_client():
     """Get OpenAI client from secrets (legacy support)"""
@@ -54,42 +107,82 @@ def get_openai_client():
     if not api_key:
         return None
     
-    return OpenAI(api_key=api_key)
+    return get_llm_client("openai", api_key=api_key)
 
-def process_query(query):
-    """Process natural language query about expenses"""
+def process_query(query, stream=False):
+    """Process natural language query about expenses.
     
-    # Determine SQL query based on user question
-    sql = generate_sql(query)
+    With stream=True the answer is an iterator of text chunks: the LLM's
+    tokens as they arrive, or a cached or basic answer as a single chunk.
+    """
+    result = _process_query(query, stream)
+    if stream and isinstance(result["answer"], str):
+        result["answer"] = iter([result["answer"]])
+    return result
+
+def _process_query(query, stream):
+    try:
+        client, model, provider = get_configured_llm()
+    except Exception:
+        client, model, provider = None, None, None
     
-    # Execute query
+    # SQL from a cached plan or the LLM, else from keywords
+    sql, params, sql_source = None, (), "keywords"
+    results = None
+    complete = None
+    if client and provider:
+        complete = lambda system, question: complete_sql(client, model, provider, system, question)
     try:
-        results = execute_query(sql)
-    except Exception as e:
-        return {
-            "answer": f"Sorry, I couldn't process that query. Error: {str(e)}",
-            "data": [],
-            "sql": sql,
-            "provider": "error"
-        }
+        planned = text_to_sql.to_sql(query, complete)
+        if planned is not None:
+            sql, params, sql_source = planned
+            results = execute_query(sql, params)
+    except Exception:
+        sql, params, sql_source = None, (), "keywords"
+    
+    if sql is None:
+        sql = generate_sql(query)
+        
+        # Execute query
+        try:
+            results = execute_query(sql)
+        except Exception as e:
+            return {
+                "answer": f"Sorry, I couldn't process that query. Error: {str(e)}",
+                "data": [],
+                "sql": sql,
+                "sql_source": sql_source,
+                "provider": "error"
+            }
     
     # Format response with configured LLM
     try:
-        client, model, provider = get_configured_llm()
-        
         if client and provider:
-            if provider == "gemini":
-                # Google Gemini uses different API
-                answer = chat_with_gemini(client, query, results)
-            else:
-                # OpenAI-compatible (OpenAI, OpenRouter, Ollama)
-                answer = chat_with_llm(client, query, results, model)
+            # The same question about unchanged data gets the same answer
+            persist = st.session_state.get('answer_cache_persist', ANSWER_CACHE_PERSIST)
+            key = answer_key(query, results, provider, model)
+            answer = get_answer(key, persist)
+            cached = answer is not None
+            
+            if not cached and stream:
+                answer = _stream_and_cache(stream_answer(client, model, provider, query, results), key, persist, query, results)
+            elif not cached:
+                start = time.perf_counter()
+                if provider == "gemini":
+                    # Google Gemini uses different API
+                    answer = chat_with_gemini(client, query, results)
+                else:
+                    # OpenAI-compatible (OpenAI, OpenRouter, Ollama)
+                    answer = chat_with_llm(client, query, results, model)
+                put_answer(key, answer, (time.perf_counter() - start) * 1000, persist)
             
             return {
                 "answer": answer,
                 "data": results,
                 "sql": sql,
-                "provider": provider
+                "sql_source": sql_source,
+                "provider": provider,
+                "cached": cached
             }
         else:
             # Fallback to basic response
@@ -98,6 +191,7 @@ def process_query(query):
                 "answer": answer,
                 "data": results,
                 "sql": sql,
+                "sql_source": sql_source,
                 "provider": "basic"
             }
     
@@ -107,6 +201,7 @@ def process_query(query):
             "answer": format_basic_response(query, results),
             "data": results,
             "sql": sql,
+            "sql_source": sql_source,
             "provider": "basic"
         }
 
@@ -115,16 +210,25 @@ def generate_sql(query):
     query_lower = query.lower()
     
     if "total" in query_lower and "amount" in query_lower:
-        return "SELECT SUM(amount) as total FROM transactions"
+        return "SELECT SUM(amount) as total FROM transactions WHERE duplicate_of IS NULL"
     
     elif "count" in query_lower or "how many" in query_lower:
-        return "SELECT COUNT(*) as count FROM transactions"
+        return "SELECT COUNT(*) as count FROM transactions WHERE duplicate_of IS NULL"
     
     elif "category" in query_lower or "categories" in query_lower:
-        return "SELECT category, SUM(amount) as total FROM transactions WHERE category IS NOT NULL GROUP BY category ORDER BY total DESC"
+        return "SELECT category, SUM(amount) as total FROM transactions WHERE category IS NOT NULL AND duplicate_of IS NULL GROUP BY category ORDER BY total DESC"
     
     elif "vendor" in query_lower:
-        return "SELECT vendor_name, SUM(amount) as total FROM transactions WHERE vendor_name IS NOT NULL GROUP BY vendor_name ORDER BY total DESC LIMIT 10"
+        # Group OCR spelling variants under their canonical vendor
+        return """
+            SELECT COALESCE(v.name, t.vendor_name) as vendor_name, SUM(t.amount) as total
+            FROM transactions t
+            LEFT JOIN vendors v ON v.id = t.vendor_id
+            WHERE t.vendor_name IS NOT NULL AND t.duplicate_of IS NULL
+            GROUP BY COALESCE(v.id, t.vendor_name)
+            ORDER BY total DESC
+            LIMIT 10
+        """
     
     elif "recent" in query_lower or "latest" in query_lower:
         return "SELECT * FROM transactions ORDER BY created_at DESC LIMIT 10"
@@ -133,26 +237,54 @@ def generate_sql(query):
         return """
             SELECT SUM(amount) as total, COUNT(*) as count 
             FROM transactions 
-            WHERE strftime('%Y-%m', created_at) = strftime('%Y-%m', 'now')
+            WHERE strftime('%Y-%m', created_at) = strftime('%Y-%m', 'now') AND duplicate_of IS NULL
         """
     
     else:
         # Default: recent transactions
         return "SELECT * FROM transactions ORDER BY created_at DESC LIMIT 10"
 
+def _gemini_request_options():
+    """Timeout and exponential-backoff retry of transient errors for Gemini calls"""
+    from google.api_core import retry
+    return {
+        "timeout": LLM_TIMEOUT,
+        "retry": retry.Retry(initial=0.5, maximum=8.0, multiplier=2.0, timeout=LLM_TIMEOUT)
+    }
+
+def complete_sql(client, model, provider, system, question):
+    """Ask the configured LLM to translate a question into SQL"""
+    if provider == "gemini":
+        response = client.generate_content(
+            f"{system}\n\nQuestion: {question}",
+            generation_config={"temperature": 0},
+            request_options=_gemini_request_options()
+        )
+        return response.text
+    
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": question}
+        ],
+        temperature=0,
+        max_tokens=400
+    )
+    return response.choices[0].message.content
+
+ANSWER_SYSTEM_PROMPT = "You are a helpful assistant for expense tracking. Provide concise, clear answers based on the data provided. Format numbers with proper currency symbols and commas."
+
+def _answer_prompt(query, results):
+    return f"User asked: {query}\n\nDatabase results: {results}\n\nProvide a natural language answer."
+
 def chat_with_llm(client, query, results, model):
     """Use LLM to format response"""
     response = client.chat.completions.create(
         model=model,
         messages=[
-            {
-                "role": "system",
-                "content": "You are a helpful assistant for expense tracking. Provide concise, clear answers based on the data provided. Format numbers with proper currency symbols and commas."
-            },
-            {
-                "role": "user",
-                "content": f"User asked: {query}\n\nDatabase results: {results}\n\nProvide a natural language answer."
-            }
+            {"role": "system", "content": ANSWER_SYSTEM_PROMPT},
+            {"role": "user", "content": _answer_prompt(query, results)}
         ],
         temperature=0.7,
         max_tokens=300
@@ -162,16 +294,66 @@ def chat_with_llm(client, query, results, model):
 
 def chat_with_gemini(model, query, results):
     """Use Google Gemini to format response"""
-    prompt = f"""You are a helpful assistant for expense tracking. Provide concise, clear answers based on the data provided. Format numbers with proper currency symbols and commas.
+    response = model.generate_content(
+        f"{ANSWER_SYSTEM_PROMPT}\n\n{_answer_prompt(query, results)}",
+        request_options=_gemini_request_options()
+    )
+    return response.text
 
-User asked: {query}
+def stream_with_llm(client, query, results, model):
+    """Yield the LLM's response in chunks as they are generated"""
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": ANSWER_SYSTEM_PROMPT},
+            {"role": "user", "content": _answer_prompt(query, results)}
+        ],
+        temperature=0.7,
+        max_tokens=300,
+        stream=True
+    )
+    
+    for chunk in response:
+        # Some providers end with a usage chunk without choices
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def stream_with_gemini(model, query, results):
+    """Yield Google Gemini's response in chunks as they are generated"""
+    # A stream is not retried: chunks already shown cannot be taken back
+    response = model.generate_content(
+        f"{ANSWER_SYSTEM_PROMPT}\n\n{_answer_prompt(query, results)}",
+        stream=True,
+        request_options={"timeout": LLM_TIMEOUT}
+    )
+    for chunk in response:
+        if chunk.text:
+            yield chunk.text
 
-Database results: {results}
+def stream_answer(client, model, provider, query, results):
+    """Streamed response of the configured provider"""
+    if provider == "gemini":
+        return stream_with_gemini(client, query, results)
+    return stream_with_llm(client, query, results, model)
 
-Provide a natural language answer."""
+def _stream_and_cache(chunks, key, persist, query, results):
+    """Pass chunks through and cache the whole answer once the stream completes.
     
-    response = model.generate_content(prompt)
-    return response.text
+    A provider error before the first chunk falls back to the basic response.
+    """
+    start = time.perf_counter()
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+    except Exception:
+        if parts:
+            raise
+        yield format_basic_response(query, results)
+        return
+    
+    put_answer(key, "".join(parts), (time.perf_counter() - start) * 1000, persist)
 
 def format_basic_response(query, results):
     """Format basic response without LLM"""
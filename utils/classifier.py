@@ -0,0 +1,113 @@
+import io
+import zlib
+import numpy as np
+
+# Hashed character n-gram features
+FEATURE_BITS = 16
+NGRAM_SIZES = (3, 4, 5)
+MAX_TEXT_CHARS = 2000
+
+# Additive (Lidstone) smoothing of the per-category feature counts
+SMOOTHING = 0.1
+
+def text_features(text):
+    """Distinct hashed n-gram ids of a text (lower-cased, whitespace collapsed, padded with spaces)"""
+    text = f" {' '.join((text or '').lower().split())[:MAX_TEXT_CHARS]} "
+    mask = (1 << FEATURE_BITS) - 1
+    ids = {zlib.crc32(text[i:i + n].encode()) & mask for n in NGRAM_SIZES for i in range(len(text) - n + 1)}
+    return np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+def batch_features(texts):
+    """Concatenated feature ids of many texts and the [start, end) span of each"""
+    features = [text_features(text) for text in texts]
+    ends = np.cumsum([len(ids) for ids in features], dtype=np.int64)
+    starts = ends - np.array([len(ids) for ids in features], dtype=np.int64)
+    ids = np.concatenate(features) if features else np.empty(0, dtype=np.int64)
+    return ids, starts, ends
+
+def _span_sums(values, starts, ends):
+    """Sum of values[..., start:end] for every span, via one cumulative sum"""
+    cumulative = np.concatenate([np.zeros(values.shape[:-1] + (1,), dtype=np.float64), np.cumsum(values, axis=-1, dtype=np.float64)], axis=-1)
+    return cumulative[..., ends] - cumulative[..., starts]
+
+class NaiveBayesModel:
+    """Multinomial naive Bayes over hashed character n-grams.
+    
+    Training only adds counts, so partial_fit() can be called with each new
+    batch of examples. predict() scores a whole batch of texts with a few
+    array operations and returns, per text, the best label, its posterior
+    probability and the share of the text's features seen in training.
+    
+    Scoring tables are computed when the counts change, never in predict(),
+    so one model can be shared by concurrent sessions.
+    """
+    
+    def __init__(self, labels=(), class_counts=None, feature_counts=None):
+        self.labels = list(labels)
+        dimensions = 1 << FEATURE_BITS
+        self.class_counts = class_counts if class_counts is not None else np.zeros(len(self.labels), dtype=np.float64)
+        self.feature_counts = feature_counts if feature_counts is not None else np.zeros((len(self.labels), dimensions), dtype=np.float32)
+        self._update_scoring()
+    
+    @property
+    def examples(self):
+        return int(self.class_counts.sum())
+    
+    def partial_fit(self, texts, labels):
+        """Add (text, label) examples; unseen labels become new classes"""
+        for label in labels:
+            if label not in self.labels:
+                self.labels.append(label)
+        
+        missing = len(self.labels) - len(self.class_counts)
+        if missing:
+            self.class_counts = np.concatenate([self.class_counts, np.zeros(missing)])
+            self.feature_counts = np.vstack([self.feature_counts, np.zeros((missing, self.feature_counts.shape[1]), dtype=np.float32)])
+        
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        classes = np.array([label_index[label] for label in labels], dtype=np.int64)
+        ids, starts, ends = batch_features(texts)
+        
+        np.add.at(self.class_counts, classes, 1)
+        np.add.at(self.feature_counts, (np.repeat(classes, ends - starts), ids), 1)
+        self._update_scoring()
+    
+    def _update_scoring(self):
+        """Recompute the smoothed log likelihoods and the seen-feature mask from the counts"""
+        totals = self.feature_counts.sum(axis=1, dtype=np.float64)
+        log_likelihood = np.log((self.feature_counts + SMOOTHING) / (totals + SMOOTHING * self.feature_counts.shape[1])[:, None]).astype(np.float32)
+        seen = self.feature_counts.sum(axis=0) > 0
+        self._seen = seen
+        self._log_likelihood = log_likelihood
+    
+    def predict(self, texts):
+        """(labels, confidences, coverage) for a batch of texts"""
+        texts = list(texts)
+        if not self.labels:
+            return [None] * len(texts), np.zeros(len(texts)), np.zeros(len(texts))
+        
+        ids, starts, ends = batch_features(texts)
+        
+        # Log posterior of every class for every text: (classes, texts)
+        scores = _span_sums(self._log_likelihood[:, ids], starts, ends) + np.log(self.class_counts / self.class_counts.sum())[:, None]
+        scores -= scores.max(axis=0)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=0)
+        
+        best = probabilities.argmax(axis=0)
+        confidences = probabilities[best, np.arange(len(texts))]
+        
+        lengths = ends - starts
+        coverage = np.divide(_span_sums(self._seen[ids], starts, ends), lengths, out=np.zeros(len(texts)), where=lengths > 0)
+        
+        return [self.labels[i] for i in best], confidences, coverage
+    
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, labels=np.array(self.labels, dtype=str), class_counts=self.class_counts, feature_counts=self.feature_counts)
+        return buffer.getvalue()
+    
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls(arrays['labels'].tolist(), arrays['class_counts'], arrays['feature_counts'])
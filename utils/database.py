@@ -1,9 +1,323 @@
 import sqlite3
+import json
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from urllib.request import pathname2url
+from utils.categorizer import KeywordAutomaton, MATCH_MODES
+from utils.classifier import NaiveBayesModel
+from utils.dedupe import dedupe_key
+from utils.vendor_index import FuzzyIndex, normalize_product, normalize_vendor, strip_item_number
+from utils.write_queue import WriteQueue
 
 DB_PATH = "data/database.db"
 
+# Query result cache: entries are tagged with the versions of the tables they
+# read and are dropped once any of those tables is written by this process.
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_MAX_ROWS = 10000
+
+# Tables maintained by triggers from other tables
+DERIVED_TABLES = {
+    # Triggers on these tables keep the search index and the change log up to date
+    'documents': ('documents_fts', 'change_log'),
+    'transactions': ('documents_fts', 'change_log'),
+    'line_items': ('documents_fts', 'change_log'),
+    # The closure and category_id columns follow inserts, moves and deletes of categories
+    'categories': ('category_closure', 'transactions', 'line_items', 'change_log'),
+}
+
+# Authorizer actions that do not modify the database
+READ_ONLY_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, 33}  # 33 = SQLITE_RECURSIVE
+
+# Limits for execute_query/iter_query
+QUERY_TIMEOUT = 5.0
+QUERY_MAX_ROWS = 5000
+STATEMENT_CACHE_SIZE = 256
+PROGRESS_HANDLER_STEPS = 1000
+
+# Incremental vacuum: free pages needed before one runs
+VACUUM_MIN_FREE_PAGES = 256
+
+# Metadata keys exposed as generated columns on documents: column -> (JSON path, type)
+METADATA_COLUMNS = {
+    'meta_engine': ('$.engine', 'TEXT'),
+    'meta_source': ('$.source', 'TEXT'),
+    'meta_confidence': ('$.confidence', 'REAL'),
+}
+
+# Tables whose row changes are recorded in change_log
+CHANGE_LOG_TABLES = ('documents', 'transactions', 'line_items')
+
+# Transaction fields the edit APIs may change
+TRANSACTION_EDIT_FIELDS = ['vendor_name', 'invoice_number', 'transaction_date', 'amount', 'tax_amount', 'category']
+
+# Parents of the seeded categories, applied once when the category tree is first built
+DEFAULT_CATEGORY_PARENTS = {
+    'Cloud Services': 'IT & Software',
+    'Hardware & Equipment': 'IT & Software',
+    'Digital Advertising': 'Marketing & Advertising',
+    'Content Creation': 'Marketing & Advertising',
+    'Legal Fees': 'Professional Services',
+    'Accounting Services': 'Professional Services',
+    'Training & Development': 'HR & Recruitment',
+    'Meat & Poultry': 'Grocery Items',
+    'Seafood': 'Grocery Items',
+    'Dairy & Eggs': 'Grocery Items',
+    'Fruits & Vegetables': 'Grocery Items',
+    'Snacks & Beverages': 'Grocery Items',
+    'Bakery': 'Grocery Items',
+    'Frozen Foods': 'Grocery Items',
+}
+
+# Guard against parent_id cycles when the closure table is built from scratch
+MAX_CATEGORY_DEPTH = 32
+
+# Seed categorization rules: scope -> [(category, priority, keywords)]. When
+# keywords of several rules match, the highest priority wins. The priorities
+# follow the order the rules were checked in when they were code, except that
+# 'ice cream' (Frozen Foods, 80) now outranks 'cream', and 'roll'/'bun' must be
+# whole words (WORD_KEYWORDS), so 'payroll', 'rolled oats' and 'bunch' are no
+# longer Bakery.
+DEFAULT_CATEGORY_RULES = {
+    'transaction': [
+        ('IT & Software', 50, ['aws', 'azure', 'google cloud', 'microsoft', 'adobe', 'software', 'saas']),
+        ('Marketing & Advertising', 40, ['facebook', 'google ads', 'linkedin', 'marketing', 'advertising']),
+        ('Utilities', 30, ['electric', 'water', 'internet', 'telecom', 'utility']),
+        ('Travel & Entertainment', 20, ['hotel', 'airline', 'uber', 'taxi', 'travel']),
+        ('Office Supplies', 10, ['office', 'supplies', 'stationery', 'paper']),
+    ],
+    'line_item': [
+        # More specific than 'cream' below
+        ('Frozen Foods', 80, ['ice cream']),
+        ('Meat & Poultry', 70, ['chicken', 'beef', 'pork', 'sausage', 'meat', 'mutton', 'lamb']),
+        ('Seafood', 60, ['fish', 'mackerel', 'tuna', 'salmon', 'seafood', 'prawn', 'crab', 'shrimp']),
+        ('Dairy & Eggs', 50, ['egg', 'milk', 'cheese', 'yogurt', 'curd', 'dairy', 'butter', 'cream']),
+        ('Snacks & Beverages', 40, ['chips', 'snack', 'biscuit', 'cookie', 'beverage', 'drink', 'juice', 'soda']),
+        ('Fruits & Vegetables', 30, ['fruit', 'vegetable', 'apple', 'banana', 'carrot', 'beans', 'tomato', 'potato']),
+        ('Bakery', 20, ['bread', 'cake', 'pastry', 'bakery', 'bun', 'buns', 'roll', 'rolls']),
+        ('Frozen Foods', 10, ['frozen', 'popsicle']),
+    ],
+}
+
+# Seed keywords that must be whole words ('roll' should not match 'payroll', 'bun' not 'bunch')
+WORD_KEYWORDS = {'bun', 'buns', 'roll', 'rolls'}
+
+# Category used when no rule matches
+CATEGORY_FALLBACKS = {'transaction': 'Other', 'line_item': 'Grocery Items'}
+
+# Rows written per transaction by recategorize()
+RECATEGORIZE_CHUNK_ROWS = 5000
+
+# Learned categorizer: predictions below either threshold fall back to the rules
+CLASSIFIER_MIN_CONFIDENCE = 0.8
+CLASSIFIER_MIN_COVERAGE = 0.5
+CLASSIFIER_MIN_EXAMPLES = 10
+
+# A new model version is trained once this many corrections are pending
+CLASSIFIER_RETRAIN_EVERY = 10
+CLASSIFIER_KEEP_VERSIONS = 5
+
+# Distinct vendor names resolved per write by backfill_vendors()
+VENDOR_BACKFILL_CHUNK = 500
+
+# Distinct line-item descriptions resolved per write by backfill_products()
+PRODUCT_BACKFILL_CHUNK = 500
+
+# What save_document() does with an invoice that is already on file: 'reject'
+# raises DuplicateDocumentError, 'merge' fills the missing fields of the saved
+# copy and returns its id, 'flag' saves the new copy marked as a duplicate
+DUPLICATE_POLICIES = ('reject', 'merge', 'flag')
+DUPLICATE_POLICY = 'flag'
+
+# Transactions read per fetch by the duplicate scan
+DUPLICATE_SCAN_CHUNK = 5000
+
+# Transaction fields the invoice identity is built from
+DEDUPE_FIELDS = ('vendor_name', 'invoice_number', 'transaction_date', 'amount')
+
+# Canonical entities that extracted text is fuzzily resolved to: the entity and
+# alias tables, the column linking source rows, and how names are keyed and shown
+CANONICAL_ENTITIES = {
+    'vendor': {
+        'table': 'vendors', 'aliases': 'vendor_aliases', 'id_column': 'vendor_id',
+        'source': 'transactions', 'name_column': 'vendor_name',
+        'normalize': normalize_vendor, 'display': str.strip,
+    },
+    'product': {
+        'table': 'products', 'aliases': 'product_aliases', 'id_column': 'product_id',
+        'source': 'line_items', 'name_column': 'description',
+        'normalize': normalize_product, 'display': strip_item_number,
+    },
+}
+
+# Entity the name column of each editable scope resolves to
+CANONICAL_SCOPES = {'transaction': 'vendor', 'line_item': 'product'}
+
+# Line item fields the edit APIs may change
+LINE_ITEM_EDIT_FIELDS = ['description', 'quantity', 'unit_price', 'total', 'category']
+
+_write_queues = {}
+_write_queues_lock = threading.Lock()
+
+_table_versions = {}
+_query_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+# Fuzzy alias index per (entity, database), loaded on first use and extended by the writer
+_alias_indexes = {}
+_alias_index_lock = threading.Lock()
+
+# Tables read by each compiled statement (keyed by normalized SQL), recorded by the authorizer
+_statement_tables = OrderedDict()
+
+# Per-thread read-only connection and the state its callbacks use
+_local = threading.local()
+
+class QueryTimeoutError(Exception):
+    """Raised when a query runs longer than its time budget"""
+
+class DuplicateDocumentError(Exception):
+    """Raised by save_document() when the invoice is already on file and the policy is 'reject'"""
+    
+    def __init__(self, document_id):
+        super().__init__(f"Invoice already saved as document {document_id}")
+        self.document_id = document_id
+
+# Rebuilds the search index row of one document from its base tables
+SEARCH_INDEX_REFRESH = """
+    DELETE FROM documents_fts WHERE rowid = {doc};
+    INSERT INTO documents_fts (rowid, vendor_name, invoice_number, raw_text, line_items)
+    SELECT 
+        d.id,
+        (SELECT group_concat(vendor_name, ' ') FROM transactions WHERE document_id = d.id),
+        (SELECT group_concat(invoice_number, ' ') FROM transactions WHERE document_id = d.id),
+        d.raw_text,
+        (SELECT group_concat(description, ' ') FROM line_items WHERE document_id = d.id)
+    FROM documents d
+    WHERE d.id = {doc};
+"""
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """Add a column to an existing table (schema migration for older databases).
+    
+    Returns True if the column was added.
+    """
+    # table_xinfo also lists generated columns
+    cursor.execute(f"PRAGMA table_xinfo({table})")
+    if column in [row[1] for row in cursor.fetchall()]:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+def bump_table_versions(*tables):
+    """Mark tables as written so cached results that read them are invalidated"""
+    with _cache_lock:
+        for table in tables:
+            for name in (table,) + DERIVED_TABLES.get(table, ()):
+                _table_versions[name] = _table_versions.get(name, 0) + 1
+
+def _cache_get(key):
+    """Look up a cached result; returns None on a miss or when a table it read has changed"""
+    key = (DB_PATH,) + key
+    with _cache_lock:
+        entry = _query_cache.get(key)
+        
+        if entry is not None and any(_table_versions.get(table, 0) != version for table, version in entry['versions'].items()):
+            del _query_cache[key]
+            _cache_stats['invalidations'] += 1
+            entry = None
+        
+        if entry is None:
+            _cache_stats['misses'] += 1
+            return None
+        
+        _query_cache.move_to_end(key)
+        _cache_stats['hits'] += 1
+        return entry['value']
+
+def _cache_put(key, value, tables, versions):
+    """Store a result tagged with the table versions seen before it was computed"""
+    key = (DB_PATH,) + key
+    with _cache_lock:
+        _query_cache[key] = {
+            'value': value,
+            'versions': {table: versions.get(table, 0) for table in tables}
+        }
+        _query_cache.move_to_end(key)
+        
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+            _cache_stats['evictions'] += 1
+
+def _snapshot_versions():
+    """Copy of the current table versions"""
+    with _cache_lock:
+        return dict(_table_versions)
+
+def cached_read(key, tables, load):
+    """Return load() from the result cache until one of `tables` is written.
+    
+    Cached values are shared between callers and must not be mutated.
+    """
+    value = _cache_get(key)
+    if value is None:
+        versions = _snapshot_versions()
+        value = load()
+        _cache_put(key, value, tables, versions)
+    return value
+
+def get_query_cache_stats():
+    """Hit/miss counters and size of the query result cache"""
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats['size'] = len(_query_cache)
+    
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+def clear_query_cache():
+    """Drop all cached query results and reset the statistics"""
+    with _cache_lock:
+        _query_cache.clear()
+        for name in _cache_stats:
+            _cache_stats[name] = 0
+
+def get_write_queue():
+    """The writer thread for the current database, started on first use"""
+    with _write_queues_lock:
+        write_queue = _write_queues.get(DB_PATH)
+        if write_queue is None:
+            write_queue = WriteQueue(
+                DB_PATH, on_commit=bump_table_versions, on_idle=_compact_change_log,
+                on_rollback=lambda db_path=DB_PATH: _drop_alias_indexes(db_path)
+            )
+            _write_queues[DB_PATH] = write_queue
+        return write_queue
+
+def _compact_change_log(cursor):
+    """Writer idle task: drop change-log entries no consumer still needs"""
+    from utils import change_log
+    return ('change_log',) if change_log.compact_changes(cursor) else ()
+
+def submit_write(fn, *args, tables=(), transaction=True):
+    """Queue fn(cursor, *args) on the single writer thread and return a Future.
+    
+    Pending writes from all sessions are group-committed in one transaction;
+    `tables` are marked as changed for the result cache after the commit.
+    transaction=False runs fn on its own outside a transaction.
+    """
+    return get_write_queue().submit(fn, *args, tables=tables, transaction=transaction)
+
+def _normalize_sql(sql):
+    """Collapse whitespace outside string literals so formatting does not split cache keys"""
+    return re.sub(r"('(?:[^']|'')*')|\s+", lambda m: m.group(1) or ' ', sql).strip()
+
 def init_database():
     """Initialize SQLite database with schema"""
     os.makedirs("data", exist_ok=True)
@@ -11,6 +325,13 @@ def init_database():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # Lets deletes hand pages back in small steps; only takes effect on a new
+    # file, existing ones are converted by enable_incremental_vacuum()
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    
+    # WAL lets sessions keep reading while the writer thread commits
+    cursor.execute("PRAGMA journal_mode=WAL")
+    
     # Documents table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS documents (
@@ -87,6 +408,63 @@ def init_database():
         ]
         cursor.executemany("INSERT OR IGNORE INTO categories (name, department) VALUES (?, ?)", categories)
     
+    # Category tree as a closure table: every (ancestor, descendant) pair with
+    # its distance, each category being its own ancestor at depth 0
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'category_closure'")
+    build_closure = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS category_closure (
+            ancestor_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+            descendant_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (ancestor_id, descendant_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_category_closure_descendant ON category_closure(descendant_id, depth)")
+    
+    if build_closure:
+        cursor.executemany(
+            "UPDATE categories SET parent_id = (SELECT id FROM categories WHERE name = ?) WHERE name = ? AND parent_id IS NULL",
+            [(parent, child) for child, parent in DEFAULT_CATEGORY_PARENTS.items()]
+        )
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO category_closure (ancestor_id, descendant_id, depth)
+            WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM categories
+                UNION ALL
+                SELECT tree.ancestor_id, c.id, tree.depth + 1
+                FROM tree JOIN categories c ON c.parent_id = tree.descendant_id
+                WHERE tree.depth < {MAX_CATEGORY_DEPTH}
+            )
+            SELECT * FROM tree
+        """)
+    
+    # Keyword rules for auto-categorization, compiled into one automaton per scope
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS category_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+            scope TEXT NOT NULL CHECK (scope IN ('transaction', 'line_item')),
+            keyword TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            match_mode TEXT NOT NULL DEFAULT 'substring' CHECK (match_mode IN ('substring', 'word', 'prefix')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (scope, keyword, category_id)
+        )
+    """)
+    
+    cursor.execute("SELECT COUNT(*) FROM category_rules")
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany("""
+            INSERT OR IGNORE INTO category_rules (category_id, scope, keyword, priority, match_mode)
+            SELECT id, ?, ?, ?, ? FROM categories WHERE name = ?
+        """, [
+            (scope, keyword, priority, 'word' if keyword in WORD_KEYWORDS else 'substring', category)
+            for scope, groups in DEFAULT_CATEGORY_RULES.items()
+            for category, priority, keywords in groups
+            for keyword in keywords
+        ])
+    
     # Line items table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS line_items (
@@ -102,91 +480,1015 @@ def init_database():
         )
     """)
     
+    # Canonical vendors and the extracted name variants resolved to them
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vendors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            normalized_key TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vendor_aliases (
+            alias_key TEXT PRIMARY KEY,
+            alias TEXT NOT NULL,
+            vendor_id INTEGER NOT NULL REFERENCES vendors(id) ON DELETE CASCADE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    _add_column_if_missing(cursor, 'transactions', 'vendor_id', 'INTEGER REFERENCES vendors(id)')
+    
+    # Product catalog: line-item descriptions resolved to canonical products
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            normalized_key TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS product_aliases (
+            alias_key TEXT PRIMARY KEY,
+            alias TEXT NOT NULL,
+            product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    _add_column_if_missing(cursor, 'line_items', 'product_id', 'INTEGER REFERENCES products(id)')
+    
+    # Category ids next to the category names, for rollups over the category tree
+    for table in ('transactions', 'line_items'):
+        if _add_column_if_missing(cursor, table, 'category_id', 'INTEGER REFERENCES categories(id)'):
+            cursor.execute(f"UPDATE {table} SET category_id = c.id FROM categories c WHERE c.name = {table}.category")
+    
+    # Invoice identity (see utils.dedupe) and, for duplicates, the transaction they repeat
+    _add_column_if_missing(cursor, 'transactions', 'dedupe_key', 'TEXT')
+    _add_column_if_missing(cursor, 'transactions', 'duplicate_of', 'INTEGER REFERENCES transactions(id)')
+    
+    # Raw OCR text, kept for full-text search
+    _add_column_if_missing(cursor, 'documents', 'raw_text', 'TEXT')
+    
+    # Frequently filtered metadata keys, exposed as indexed virtual columns
+    added = False
+    for column, (path, column_type) in METADATA_COLUMNS.items():
+        added |= _add_column_if_missing(
+            cursor, 'documents', column,
+            # Malformed JSON yields NULL instead of failing every query on the column
+            f"{column_type} GENERATED ALWAYS AS (json_extract(CASE WHEN json_valid(metadata) THEN metadata END, '{path}')) VIRTUAL"
+        )
+    
+    # Documents saved before metadata was written get what the row itself records
+    if added:
+        cursor.execute("""
+            UPDATE documents
+            SET metadata = json_object('source', source, 'confidence', confidence_score)
+            WHERE metadata IS NULL OR json_valid(metadata) = 0
+        """)
+    
+    # Categories set by hand, the training data of the learned categorizer
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS category_corrections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            category TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_category_corrections_row ON category_corrections(scope, row_id)")
+    
+    # Trained model versions; one active version per scope
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS category_models (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope TEXT NOT NULL,
+            trained_through INTEGER NOT NULL,
+            examples INTEGER NOT NULL,
+            labels INTEGER NOT NULL,
+            model BLOB NOT NULL,
+            active INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Chat SQL generated by the LLM, keyed by question intent with literals as parameters
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sql_plans (
+            intent_key TEXT PRIMARY KEY,
+            schema_version TEXT NOT NULL,
+            sql TEXT NOT NULL,
+            bindings TEXT NOT NULL,
+            fixed TEXT NOT NULL,
+            question TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # LLM answers to chat questions, kept when answer cache persistence is on
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_answers (
+            key TEXT PRIMARY KEY,
+            answer TEXT NOT NULL,
+            latency_ms REAL NOT NULL,
+            created REAL NOT NULL
+        )
+    """)
+    
+    # Full-text search index over OCR text, vendor, invoice number and line items
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'documents_fts'")
+    if cursor.fetchone() is None:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE documents_fts USING fts5(
+                vendor_name, invoice_number, raw_text, line_items,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        """)
+        # Weight vendor and invoice matches above raw text
+        cursor.execute("INSERT INTO documents_fts (documents_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0, 3.0)')")
+        rebuild_search_index(cursor)
+    
+    # Triggers keeping the search index in sync with the base tables
+    search_triggers = {
+        'documents_fts_insert': "AFTER INSERT ON documents BEGIN {} END".format(SEARCH_INDEX_REFRESH.format(doc='NEW.id')),
+        'documents_fts_update': "AFTER UPDATE OF raw_text ON documents BEGIN {} END".format(SEARCH_INDEX_REFRESH.format(doc='NEW.id')),
+        'documents_fts_delete': "AFTER DELETE ON documents BEGIN DELETE FROM documents_fts WHERE rowid = OLD.id; END",
+        'transactions_fts_insert': "AFTER INSERT ON transactions BEGIN {} END".format(SEARCH_INDEX_REFRESH.format(doc='NEW.document_id')),
+        'transactions_fts_update': "AFTER UPDATE OF vendor_name, invoice_number, document_id ON transactions BEGIN {} {} END".format(
+            SEARCH_INDEX_REFRESH.format(doc='OLD.document_id'), SEARCH_INDEX_REFRESH.format(doc='NEW.document_id')),
+        'transactions_fts_delete': "AFTER DELETE ON transactions BEGIN {} END".format(SEARCH_INDEX_REFRESH.format(doc='OLD.document_id')),
+        'line_items_fts_insert': "AFTER INSERT ON line_items BEGIN {} END".format(SEARCH_INDEX_REFRESH.format(doc='NEW.document_id')),
+        'line_items_fts_update': "AFTER UPDATE OF description, document_id ON line_items BEGIN {} {} END".format(
+            SEARCH_INDEX_REFRESH.format(doc='OLD.document_id'), SEARCH_INDEX_REFRESH.format(doc='NEW.document_id')),
+        'line_items_fts_delete': "AFTER DELETE ON line_items BEGIN {} END".format(SEARCH_INDEX_REFRESH.format(doc='OLD.document_id')),
+    }
+    for name, body in search_triggers.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    
+    # Triggers keeping the closure table and the category ids in step with categories
+    category_triggers = {
+        'categories_tree_insert': """AFTER INSERT ON categories BEGIN
+            INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+            SELECT NEW.id, NEW.id, 0
+            UNION ALL
+            SELECT ancestor_id, NEW.id, depth + 1 FROM category_closure WHERE descendant_id = NEW.parent_id;
+            UPDATE categories SET department = (SELECT department FROM categories WHERE id = NEW.parent_id)
+            WHERE id = NEW.id AND department IS NULL;
+            UPDATE transactions SET category_id = NEW.id WHERE category = NEW.name;
+            UPDATE line_items SET category_id = NEW.id WHERE category = NEW.name;
+        END""",
+        'categories_tree_check': """BEFORE UPDATE OF parent_id ON categories WHEN NEW.parent_id IS NOT NULL BEGIN
+            SELECT RAISE(ABORT, 'a category cannot be moved under itself')
+            WHERE EXISTS (SELECT 1 FROM category_closure WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id);
+        END""",
+        'categories_tree_move': """AFTER UPDATE OF parent_id ON categories WHEN NEW.parent_id IS NOT OLD.parent_id BEGIN
+            DELETE FROM category_closure
+            WHERE descendant_id IN (SELECT descendant_id FROM category_closure WHERE ancestor_id = NEW.id)
+              AND ancestor_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = NEW.id AND ancestor_id != NEW.id);
+            INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+            SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+            FROM category_closure above, category_closure below
+            WHERE above.descendant_id = NEW.parent_id AND below.ancestor_id = NEW.id;
+        END""",
+        'categories_tree_delete': """AFTER DELETE ON categories BEGIN
+            DELETE FROM category_closure WHERE ancestor_id = OLD.id OR descendant_id = OLD.id;
+            UPDATE categories SET parent_id = OLD.parent_id WHERE parent_id = OLD.id;
+            UPDATE transactions SET category_id = NULL WHERE category_id = OLD.id;
+            UPDATE line_items SET category_id = NULL WHERE category_id = OLD.id;
+        END""",
+        'transactions_category_id': """AFTER UPDATE OF category ON transactions WHEN NEW.category IS NOT OLD.category BEGIN
+            UPDATE transactions SET category_id = (SELECT id FROM categories WHERE name = NEW.category) WHERE id = NEW.id;
+        END""",
+        'line_items_category_id': """AFTER UPDATE OF category ON line_items WHEN NEW.category IS NOT OLD.category BEGIN
+            UPDATE line_items SET category_id = (SELECT id FROM categories WHERE name = NEW.category) WHERE id = NEW.id;
+        END""",
+    }
+    for name, body in category_triggers.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    
+    # Append-only change log for incremental consumers (mirrors, exports, rollups)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Last sequence number each consumer has processed
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_consumers (
+            name TEXT PRIMARY KEY,
+            checkpoint INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    for table in CHANGE_LOG_TABLES:
+        for event, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_change_{event} AFTER {event.upper()} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, operation) VALUES ('{table}', {row}.id, '{event}');
+                END
+            """)
+    
+    # Indexes for paginated listing and filtering
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_uploaded_at ON documents(uploaded_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status, uploaded_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_document_id ON transactions(document_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions(category)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_vendor_name ON transactions(vendor_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_vendor_id ON transactions(vendor_id)")
+    # Covers department and category rollups of the spending of original invoices
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category_rollup ON transactions(category_id, duplicate_of, amount)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_duplicate_of ON transactions(duplicate_of) WHERE duplicate_of IS NOT NULL")
+    
+    # One original per invoice. Existing rows are keyed (and earlier
+    # duplicates flagged) before the index is first created.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_transactions_dedupe_key'")
+    if cursor.fetchone() is None:
+        _flag_duplicates(cursor)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_dedupe_key ON transactions(dedupe_key)
+        WHERE dedupe_key IS NOT NULL AND duplicate_of IS NULL
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vendor_aliases_vendor_id ON vendor_aliases(vendor_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_line_items_document_id ON line_items(document_id)")
+    # Covers the per-product spending rollup of the reports, including the duplicate filter
+    cursor.execute("DROP INDEX IF EXISTS idx_line_items_product_id")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_line_items_product_rollup ON line_items(product_id, total, category, transaction_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_aliases_product_id ON product_aliases(product_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_meta_engine ON documents(meta_engine, meta_confidence)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_meta_source ON documents(meta_source, meta_engine, meta_confidence)")
+    
     conn.commit()
     conn.close()
 
-def save_document(data):
-    """Save extracted document data to database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def save_document(data, duplicate_policy=None):
+    """Save extracted document data to database.
+    
+    An invoice already on file (same vendor, invoice number, date and
+    amount) is handled by duplicate_policy, DUPLICATE_POLICY by default.
+    Under 'merge' and 'flag' the id of the saved original is put in
+    data['duplicate_of'].
+    """
+    duplicate_policy = duplicate_policy or DUPLICATE_POLICY
+    if duplicate_policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicate policy: {duplicate_policy}")
+    
+    # Auto-categorize
+    category = auto_categorize(data.get('vendor_name', ''), data.get('raw_text', ''))
+    
+    future = submit_write(_insert_document, data, category, duplicate_policy, tables=('documents', 'transactions', 'vendors'))
+    return future.result()
+
+def _insert_document(cursor, data, category, duplicate_policy=DUPLICATE_POLICY):
+    """Insert a document and its transaction; returns the document id (of the original, when merged)"""
+    key = dedupe_key(*(data.get(field) for field in DEDUPE_FIELDS))
+    original = None
+    if key:
+        # Served by the partial unique index, so the check costs one lookup
+        cursor.execute("SELECT id, document_id FROM transactions WHERE dedupe_key = ? AND duplicate_of IS NULL", (key,))
+        original = cursor.fetchone()
+    
+    if original is not None:
+        if duplicate_policy == 'reject':
+            raise DuplicateDocumentError(original[1])
+        data['duplicate_of'] = original[1]
+        if duplicate_policy == 'merge':
+            _merge_document(cursor, original, data)
+            return original[1]
+    
+    metadata = dict(data.get('metadata') or {})
+    source = metadata.get('source') or 'upload'
+    
+    # Extraction details go with the document, per-field confidences with the transaction
+    transaction_metadata = {'field_confidence': metadata.pop('field_confidence', {})}
+    document_metadata = dict(metadata, source=source, confidence=data.get('confidence', 0))
     
     # Insert document
     cursor.execute("""
-        INSERT INTO documents (source, document_type, status, confidence_score, processed_at)
-        VALUES (?, ?, ?, ?, ?)
-    """, ('upload', 'invoice', 'processed', data.get('confidence', 0), datetime.now()))
+        INSERT INTO documents (source, document_type, status, confidence_score, file_path, processed_at, raw_text, metadata)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        source, 'invoice', 'duplicate' if original else 'processed', data.get('confidence', 0), data.get('file_path'), datetime.now(), data.get('raw_text'),
+        json.dumps(document_metadata)
+    ))
     
     document_id = cursor.lastrowid
     
-    # Auto-categorize
-    category = auto_categorize(data.get('vendor_name', ''), data.get('raw_text', ''))
-    
     # Insert transaction
     cursor.execute("""
         INSERT INTO transactions (
-            document_id, vendor_name, invoice_number, transaction_date,
-            amount, tax_amount, category, status
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            document_id, vendor_name, vendor_id, invoice_number, transaction_date,
+            amount, tax_amount, category, category_id, status, metadata, dedupe_key, duplicate_of
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT id FROM categories WHERE name = ?), ?, ?, ?, ?)
     """, (
         document_id,
         data.get('vendor_name'),
+        _resolve_vendor(cursor, data.get('vendor_name')),
         data.get('invoice_number'),
         data.get('transaction_date'),
         data.get('amount', 0),
         data.get('tax_amount', 0),
         category,
-        'processed'
+        category,
+        'processed',
+        json.dumps(transaction_metadata),
+        key,
+        original[0] if original else None
     ))
     
-    conn.commit()
+    return document_id
+
+def _merge_document(cursor, original, data):
+    """Fill fields the saved copy of an invoice is missing from a later copy"""
+    transaction_id, document_id = original
+    cursor.execute(
+        "UPDATE documents SET file_path = COALESCE(file_path, ?), raw_text = COALESCE(raw_text, ?) WHERE id = ?",
+        (data.get('file_path'), data.get('raw_text'), document_id)
+    )
+    cursor.execute(
+        "UPDATE transactions SET tax_amount = COALESCE(NULLIF(tax_amount, 0), ?) WHERE id = ?",
+        (data.get('tax_amount'), transaction_id)
+    )
+
+def find_duplicates():
+    """Transactions that repeat an earlier invoice but are not flagged as such yet.
+    
+    Returns {duplicate transaction id: original transaction id}, from one
+    pass over the table.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    try:
+        _, links = _scan_duplicates(cursor)
+    finally:
+        conn.close()
+    
+    return {row_id: original for row_id, original in links.items() if original is not None}
+
+def flag_duplicates():
+    """Key every transaction and flag the ones repeating an earlier invoice; returns the number newly flagged"""
+    return submit_write(_flag_duplicates, tables=('documents', 'transactions')).result()
+
+def _scan_duplicates(cursor):
+    """Single pass over transactions in id order: the earliest row with a key is its original.
+    
+    Returns the (key, id) pairs whose stored key is out of date and
+    {transaction id: original id or None} for rows whose link must change.
+    """
+    cursor.execute(f"SELECT id, {', '.join(DEDUPE_FIELDS)}, dedupe_key, duplicate_of FROM transactions ORDER BY id")
+    
+    originals = {}
+    keys = []
+    links = {}
+    while True:
+        rows = cursor.fetchmany(DUPLICATE_SCAN_CHUNK)
+        if not rows:
+            break
+        for row_id, vendor_name, invoice_number, transaction_date, amount, stored_key, duplicate_of in rows:
+            key = dedupe_key(vendor_name, invoice_number, transaction_date, amount)
+            if key != stored_key:
+                keys.append((key, row_id))
+            
+            original = originals.setdefault(key, row_id) if key else row_id
+            original = None if original == row_id else original
+            if original != duplicate_of:
+                links[row_id] = original
+    
+    return keys, links
+
+def _flag_duplicates(cursor):
+    keys, links = _scan_duplicates(cursor)
+    flagged = [(row_id, original) for row_id, original in links.items() if original is not None]
+    
+    # Flag, rekey, then unflag, so no two originals share a key at any step
+    _set_duplicate_links(cursor, flagged)
+    cursor.executemany("UPDATE transactions SET dedupe_key = ? WHERE id = ?", keys)
+    _set_duplicate_links(cursor, [(row_id, original) for row_id, original in links.items() if original is None])
+    return len(flagged)
+
+def _set_duplicate_links(cursor, links):
+    """Point transactions at their original (None for originals) and keep document statuses in step"""
+    links = list(links)
+    cursor.executemany("UPDATE transactions SET duplicate_of = ? WHERE id = ?", [(original, row_id) for row_id, original in links])
+    
+    for i in range(0, len(links), 500):
+        chunk = [row_id for row_id, _ in links[i:i + 500]]
+        cursor.execute(f"""
+            UPDATE documents SET status = CASE
+                WHEN EXISTS (SELECT 1 FROM transactions t WHERE t.document_id = documents.id AND t.duplicate_of IS NOT NULL) THEN 'duplicate'
+                WHEN status = 'duplicate' THEN 'processed'
+                ELSE status
+            END
+            WHERE id IN (SELECT document_id FROM transactions WHERE id IN ({', '.join('?' * len(chunk))}))
+        """, chunk)
+
+def _rekey_transactions(cursor, transaction_ids):
+    """Recompute the invoice identity of edited transactions and relink them and any copies they left behind"""
+    links = []
+    for row_id in transaction_ids:
+        cursor.execute(f"SELECT {', '.join(DEDUPE_FIELDS)} FROM transactions WHERE id = ?", (row_id,))
+        row = cursor.fetchone()
+        if row is None:
+            continue
+        key = dedupe_key(*row)
+        
+        original = None
+        if key:
+            cursor.execute("SELECT id FROM transactions WHERE dedupe_key = ? AND duplicate_of IS NULL AND id != ?", (key, row_id))
+            original = cursor.fetchone()
+        cursor.execute(
+            "UPDATE transactions SET dedupe_key = ?, duplicate_of = ? WHERE id = ?",
+            (key, original[0] if original else None, row_id)
+        )
+        links.append((row_id, original[0] if original else None))
+    
+    _set_duplicate_links(cursor, links)
+    _repair_duplicate_links(cursor)
+
+def _repair_duplicate_links(cursor):
+    """Relink duplicates whose original was deleted or edited into another invoice.
+    
+    The earliest orphan of each invoice becomes its new original.
+    """
+    cursor.execute("""
+        SELECT t.id, t.dedupe_key
+        FROM transactions t
+        LEFT JOIN transactions o ON o.id = t.duplicate_of
+        WHERE t.duplicate_of IS NOT NULL
+          AND (o.id IS NULL OR o.duplicate_of IS NOT NULL OR o.dedupe_key IS NOT t.dedupe_key)
+        ORDER BY t.id
+    """)
+    orphans = cursor.fetchall()
+    
+    links = []
+    for row_id, key in orphans:
+        cursor.execute("SELECT id FROM transactions WHERE dedupe_key = ? AND duplicate_of IS NULL", (key,))
+        original = cursor.fetchone()
+        # Unlinking makes this row the original the next orphans find
+        cursor.execute("UPDATE transactions SET duplicate_of = ? WHERE id = ?", (original[0] if original else None, row_id))
+        links.append((row_id, original[0] if original else None))
+    
+    _set_duplicate_links(cursor, links)
+
+def _alias_index(entity):
+    """Fuzzy index of an entity's aliases for the current database"""
+    with _alias_index_lock:
+        index = _alias_indexes.get((entity, DB_PATH))
+        if index is None:
+            spec = CANONICAL_ENTITIES[entity]
+            index = FuzzyIndex()
+            conn = sqlite3.connect(DB_PATH)
+            for alias_key, entity_id in conn.execute(f"SELECT alias_key, {spec['id_column']} FROM {spec['aliases']}"):
+                index.add(alias_key, entity_id)
+            conn.close()
+            _alias_indexes[(entity, DB_PATH)] = index
+        return index
+
+def _drop_alias_indexes(db_path):
+    """Writer rollback hook: forget alias indexes that may hold keys of rolled-back writes"""
+    with _alias_index_lock:
+        for entity in CANONICAL_ENTITIES:
+            _alias_indexes.pop((entity, db_path), None)
+
+def _match_canonical(entity, name):
+    key = CANONICAL_ENTITIES[entity]['normalize'](name)
+    match = _alias_index(entity).lookup(key) if key else None
+    if match is None:
+        return None
+    return {'id': match[0], 'matched': match[1], 'distance': match[2]}
+
+def match_vendor(name):
+    """Vendor an extracted name resolves to, as {'id', 'matched', 'distance'}, or None if it would be new"""
+    return _match_canonical('vendor', name)
+
+def match_product(description):
+    """Product a line-item description resolves to, as {'id', 'matched', 'distance'}, or None if it would be new"""
+    return _match_canonical('product', description)
+
+def _resolve_canonical(cursor, entity, name):
+    """Canonical id for an extracted name, creating the entity if nothing is close enough.
+    
+    Runs on the writer thread, which is the only one extending the index.
+    New spellings are recorded as aliases so the next lookup is exact.
+    """
+    spec = CANONICAL_ENTITIES[entity]
+    key = spec['normalize'](name)
+    if not key:
+        return None
+    
+    index = _alias_index(entity)
+    match = index.lookup(key)
+    
+    if match is not None:
+        # Rolled-back ids are reused by the next insert, so check the alias row itself
+        cursor.execute(f"SELECT 1 FROM {spec['aliases']} WHERE alias_key = ? AND {spec['id_column']} = ?", (match[1], match[0]))
+        if cursor.fetchone() is None:
+            # Indexed by a write that was later rolled back
+            index.remove(match[1])
+            match = None
+    
+    if match is None:
+        cursor.execute(
+            f"INSERT INTO {spec['table']} (name, normalized_key) VALUES (?, ?) ON CONFLICT (normalized_key) DO NOTHING",
+            (spec['display'](name), key)
+        )
+        cursor.execute(f"SELECT id FROM {spec['table']} WHERE normalized_key = ?", (key,))
+        entity_id = cursor.fetchone()[0]
+    else:
+        entity_id = match[0]
+    
+    if match is None or match[2] > 0:
+        cursor.execute(
+            f"INSERT OR IGNORE INTO {spec['aliases']} (alias_key, alias, {spec['id_column']}) VALUES (?, ?, ?)",
+            (key, spec['display'](name), entity_id)
+        )
+        index.add(key, entity_id)
+    
+    return entity_id
+
+def _resolve_vendor(cursor, name):
+    return _resolve_canonical(cursor, 'vendor', name)
+
+def _resolve_product(cursor, description):
+    return _resolve_canonical(cursor, 'product', description)
+
+def get_vendors():
+    """Canonical vendors with their alias and transaction counts, by name"""
+    return cached_read(('get_vendors',), ('vendors', 'transactions'), lambda: _load_canonical('vendor'))
+
+def get_products():
+    """Catalog products with their alias and line item counts, by name"""
+    return cached_read(('get_products',), ('products', 'line_items'), lambda: _load_canonical('product'))
+
+def _load_canonical(entity):
+    spec = CANONICAL_ENTITIES[entity]
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    cursor.execute(f"""
+        SELECT
+            e.id,
+            e.name,
+            (SELECT COUNT(*) FROM {spec['aliases']} a WHERE a.{spec['id_column']} = e.id) AS aliases,
+            (SELECT COUNT(*) FROM {spec['source']} s WHERE s.{spec['id_column']} = e.id) AS {spec['source']}
+        FROM {spec['table']} e
+        ORDER BY e.name
+    """)
+    rows = [dict(row) for row in cursor.fetchall()]
+    
     conn.close()
+    return rows
+
+def get_product_names(product_ids):
+    """{product id: catalog name} for the given ids"""
+    product_ids = list(product_ids)
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
     
-    return document_id
+    names = {}
+    for i in range(0, len(product_ids), 500):
+        chunk = product_ids[i:i + 500]
+        cursor.execute(f"SELECT id, name FROM products WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+        names.update(cursor.fetchall())
+    
+    conn.close()
+    return names
+
+def _unlinked_count(entity):
+    spec = CANONICAL_ENTITIES[entity]
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM {spec['source']}
+        WHERE {spec['id_column']} IS NULL AND {spec['name_column']} IS NOT NULL AND TRIM({spec['name_column']}) != ''
+    """)
+    count = cursor.fetchone()[0]
+    
+    conn.close()
+    return count
+
+def get_unlinked_vendor_count():
+    """Transactions with a vendor name but no canonical vendor yet"""
+    return _unlinked_count('vendor')
+
+def get_unlinked_product_count():
+    """Line items with a description but no catalog product yet"""
+    return _unlinked_count('product')
+
+def _backfill_canonical(entity, chunk_size):
+    """Link source rows saved before the entity was tracked.
+    
+    Distinct names are resolved most frequent first, so the common spelling
+    becomes the canonical name and rarer OCR variants attach to it as
+    aliases. Returns the number of rows linked.
+    """
+    spec = CANONICAL_ENTITIES[entity]
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute(f"""
+        SELECT {spec['name_column']} FROM {spec['source']}
+        WHERE {spec['id_column']} IS NULL AND {spec['name_column']} IS NOT NULL AND TRIM({spec['name_column']}) != ''
+        GROUP BY {spec['name_column']}
+        ORDER BY COUNT(*) DESC, {spec['name_column']}
+    """)
+    names = [row[0] for row in cursor.fetchall()]
+    
+    conn.close()
+    
+    futures = [
+        submit_write(_link_canonical, entity, names[i:i + chunk_size], tables=(spec['source'], spec['table']))
+        for i in range(0, len(names), chunk_size)
+    ]
+    return sum(future.result() for future in futures)
+
+def backfill_vendors(chunk_size=VENDOR_BACKFILL_CHUNK):
+    """Link transactions saved before vendors were tracked to canonical vendors"""
+    return _backfill_canonical('vendor', chunk_size)
+
+def backfill_products(chunk_size=PRODUCT_BACKFILL_CHUNK):
+    """Link line items saved before the product catalog existed to catalog products"""
+    return _backfill_canonical('product', chunk_size)
+
+def _link_canonical(cursor, entity, names):
+    spec = CANONICAL_ENTITIES[entity]
+    linked = 0
+    for name in names:
+        cursor.execute(
+            f"UPDATE {spec['source']} SET {spec['id_column']} = ? WHERE {spec['name_column']} = ? AND {spec['id_column']} IS NULL",
+            (_resolve_canonical(cursor, entity, name), name)
+        )
+        linked += cursor.rowcount
+    return linked
 
 def auto_categorize(vendor, text):
     """Auto-categorize based on vendor and text"""
-    vendor_lower = (vendor or '').lower()
-    text_lower = (text or '').lower()
+    return categorize('transaction', f"{vendor or ''}\n{text or ''}")
+
+def categorize(scope, text):
+    """Category for a single text; see categorize_batch()"""
+    return categorize_batch(scope, [text])[0]
+
+def categorize_batch(scope, texts):
+    """Categories for many texts of one scope ('transaction' or 'line_item').
     
-    # IT & Software
-    if any(kw in vendor_lower or kw in text_lower for kw in ['aws', 'azure', 'google cloud', 'microsoft', 'adobe', 'software', 'saas']):
-        return 'IT & Software'
+    The learned model is scored on the whole batch at once. Texts it is
+    unsure about, or that share too few features with its training data,
+    go to the keyword rules and then to the scope's fallback category.
+    """
+    texts = list(texts)
+    categories = [None] * len(texts)
     
-    # Marketing
-    if any(kw in vendor_lower or kw in text_lower for kw in ['facebook', 'google ads', 'linkedin', 'marketing', 'advertising']):
-        return 'Marketing & Advertising'
+    model = get_category_model(scope)
+    if model is not None and model.examples >= CLASSIFIER_MIN_EXAMPLES and len(model.labels) > 1:
+        labels, confidences, coverage = model.predict(texts)
+        categories = [
+            label if confidence >= CLASSIFIER_MIN_CONFIDENCE and covered >= CLASSIFIER_MIN_COVERAGE else None
+            for label, confidence, covered in zip(labels, confidences, coverage)
+        ]
     
-    # Utilities
-    if any(kw in vendor_lower or kw in text_lower for kw in ['electric', 'water', 'internet', 'telecom', 'utility']):
-        return 'Utilities'
+    automaton = get_category_automata().get(scope)
+    return [
+        category or (automaton.best(text) if automaton else None) or CATEGORY_FALLBACKS[scope]
+        for category, text in zip(categories, texts)
+    ]
+
+def get_category_automata():
+    """Compiled keyword automaton per rule scope, rebuilt after rules or categories change"""
+    return cached_read(('category_automata',), ('category_rules', 'categories'), _compile_category_rules)
+
+def _compile_category_rules():
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
     
-    # Travel
-    if any(kw in vendor_lower or kw in text_lower for kw in ['hotel', 'airline', 'uber', 'taxi', 'travel']):
-        return 'Travel & Entertainment'
+    cursor.execute("""
+        SELECT r.scope, r.keyword, c.name, r.priority, r.match_mode
+        FROM category_rules r
+        JOIN categories c ON c.id = r.category_id
+        ORDER BY r.scope, r.priority DESC, r.id
+    """)
+    rules = {}
+    for scope, keyword, category, priority, match_mode in cursor.fetchall():
+        rules.setdefault(scope, []).append((keyword, category, priority, match_mode))
     
-    # Office Supplies
-    if any(kw in vendor_lower or kw in text_lower for kw in ['office', 'supplies', 'stationery', 'paper']):
-        return 'Office Supplies'
+    conn.close()
+    return {scope: KeywordAutomaton(scope_rules) for scope, scope_rules in rules.items()}
+
+def get_categories():
+    """Names of all categories"""
+    return cached_read(('get_categories',), ('categories',), lambda: _load_distinct_values('categories', 'name'))
+
+def get_category_tree():
+    """Categories in tree order, each with its parent, department and depth"""
+    return cached_read(('get_category_tree',), ('categories',), _load_category_tree)
+
+def _load_category_tree():
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    # Ordering by the names along each category's path lists parents before their children
+    cursor.execute("""
+        SELECT
+            c.id,
+            c.name,
+            c.parent_id,
+            c.department,
+            (SELECT MAX(depth) FROM category_closure WHERE descendant_id = c.id) AS depth,
+            (
+                SELECT group_concat(name, char(31)) FROM (
+                    SELECT a.name FROM category_closure cl JOIN categories a ON a.id = cl.ancestor_id
+                    WHERE cl.descendant_id = c.id ORDER BY cl.depth DESC
+                )
+            ) AS path
+        FROM categories c
+        ORDER BY path
+    """)
+    tree = [dict(row) for row in cursor.fetchall()]
+    
+    conn.close()
+    return tree
+
+def set_category_parent(category, parent=None):
+    """Move a category (with its subcategories) under parent, or to the top level when parent is None"""
+    submit_write(_set_category_parent, category, parent, tables=('categories',)).result()
+
+def _set_category_parent(cursor, category, parent):
+    parent_id = None
+    if parent is not None:
+        cursor.execute("SELECT id FROM categories WHERE name = ?", (parent,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Unknown category: {parent}")
+        parent_id = row[0]
+    
+    try:
+        cursor.execute("UPDATE categories SET parent_id = ? WHERE name = ?", (parent_id, category))
+    except sqlite3.IntegrityError as e:
+        raise ValueError(f"Cannot move {category} under {parent}: {e}")
+    if cursor.rowcount == 0:
+        raise ValueError(f"Unknown category: {category}")
+
+def get_category_rules(scope=None):
+    """Categorization rules, highest priority first"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    sql = """
+        SELECT r.id, r.scope, r.keyword, c.name AS category, r.priority, r.match_mode
+        FROM category_rules r
+        JOIN categories c ON c.id = r.category_id
+    """
+    params = []
+    if scope:
+        sql += " WHERE r.scope = ?"
+        params.append(scope)
+    cursor.execute(sql + " ORDER BY r.scope, r.priority DESC, r.id", params)
+    
+    rules = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rules
+
+def add_category_rule(category, keyword, scope='line_item', priority=0, match_mode='substring'):
+    """Add a keyword rule for an existing category; returns the rule id"""
+    keyword = (keyword or '').strip().lower()
+    if not keyword:
+        raise ValueError("Keyword must not be empty")
+    if scope not in CATEGORY_FALLBACKS:
+        raise ValueError(f"Unknown rule scope: {scope}")
+    if match_mode not in MATCH_MODES:
+        raise ValueError(f"Unknown match mode: {match_mode}")
+    
+    return submit_write(_insert_category_rule, category, keyword, scope, priority, match_mode, tables=('category_rules',)).result()
+
+def _insert_category_rule(cursor, category, keyword, scope, priority, match_mode):
+    cursor.execute("""
+        INSERT INTO category_rules (category_id, scope, keyword, priority, match_mode)
+        SELECT id, ?, ?, ?, ? FROM categories WHERE name = ?
+        ON CONFLICT (scope, keyword, category_id) DO UPDATE SET priority = excluded.priority, match_mode = excluded.match_mode
+    """, (scope, keyword, priority, match_mode, category))
+    if cursor.rowcount == 0:
+        raise ValueError(f"Unknown category: {category}")
+    
+    cursor.execute("""
+        SELECT r.id FROM category_rules r JOIN categories c ON c.id = r.category_id
+        WHERE r.scope = ? AND r.keyword = ? AND c.name = ?
+    """, (scope, keyword, category))
+    return cursor.fetchone()[0]
+
+def delete_category_rules(rule_ids):
+    """Delete rules by id; returns the number deleted"""
+    rows = [(int(rule_id),) for rule_id in rule_ids]
+    if not rows:
+        return 0
+    return submit_write(_execute_many, [("DELETE FROM category_rules WHERE id = ?", rows)], tables=('category_rules',)).result()
+
+# Text categorized per scope: (table, SELECT of id, text, current category, id column)
+CATEGORY_TEXT_SQL = {
+    'transaction': ('transactions', """
+        SELECT t.id, COALESCE(t.vendor_name, '') || char(10) || COALESCE(d.raw_text, ''), t.category
+        FROM transactions t
+        LEFT JOIN documents d ON d.id = t.document_id
+    """, 't.id'),
+    'line_item': ('line_items', "SELECT id, description, category FROM line_items", 'id'),
+}
+
+def recategorize(scopes=('transaction', 'line_item')):
+    """Re-run the categorizer over existing transactions and line items.
+    
+    Categories are computed from a read snapshot and only rows whose
+    category changes are written back, in chunks joined through a temp
+    table so uploads can commit between chunks. Rows whose category was
+    corrected by hand are left alone. Returns the number of rows changed
+    per scope.
+    """
+    changed = {}
+    for scope in scopes:
+        table, sql, id_column = CATEGORY_TEXT_SQL[scope]
+        
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.execute(
+            f"{sql} WHERE {id_column} NOT IN (SELECT row_id FROM category_corrections WHERE scope = ?)", (scope,)
+        )
+        futures = []
+        while True:
+            rows = cursor.fetchmany(RECATEGORIZE_CHUNK_ROWS)
+            if not rows:
+                break
+            categories = categorize_batch(scope, [text for _, text, _ in rows])
+            updates = [(row_id, category) for (row_id, _, current), category in zip(rows, categories) if category != current]
+            if updates:
+                futures.append(submit_write(_apply_categories, table, updates, tables=(table,)))
+        conn.close()
+        
+        changed[scope] = sum(future.result() for future in futures)
+    
+    return changed
+
+def _apply_categories(cursor, table, rows):
+    """Set category from (id, category) rows with one UPDATE ... FROM a temp table"""
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_categories (id INTEGER PRIMARY KEY, category TEXT)")
+    cursor.execute("DELETE FROM temp.bulk_categories")
+    cursor.executemany("INSERT INTO temp.bulk_categories (id, category) VALUES (?, ?)", rows)
+    
+    cursor.execute(f"""
+        UPDATE {table} SET category = b.category
+        FROM temp.bulk_categories b
+        WHERE {table}.id = b.id AND {table}.category IS NOT b.category
+    """)
+    changed = cursor.rowcount
+    
+    cursor.execute("DELETE FROM temp.bulk_categories")
+    return changed
+
+def get_category_model(scope):
+    """Active learned model of a scope, or None before the first training"""
+    return cached_read(('category_model', scope), ('category_models',), lambda: _load_category_model(scope)) or None
+
+def _load_category_model(scope):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
     
-    return 'Other'
+    cursor.execute("SELECT model FROM category_models WHERE scope = ? AND active = 1", (scope,))
+    row = cursor.fetchone()
+    
+    conn.close()
+    # False rather than None, so "no model yet" is cached too
+    return NaiveBayesModel.from_bytes(row[0]) if row else False
+
+def train_category_model(scope, full=False):
+    """Train a new model version from the corrections recorded for a scope.
+    
+    By default the active model is extended with the corrections it has not
+    seen yet; full=True retrains from the latest correction of every row.
+    Returns the new version's details, or None if there was nothing to learn.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT model, trained_through FROM category_models WHERE scope = ? AND active = 1", (scope,))
+    row = cursor.fetchone()
+    
+    if row and not full:
+        model = NaiveBayesModel.from_bytes(row[0])
+        cursor.execute("SELECT id, text, category FROM category_corrections WHERE scope = ? AND id > ? ORDER BY id", (scope, row[1]))
+    else:
+        model = NaiveBayesModel()
+        cursor.execute("""
+            SELECT id, text, category FROM category_corrections
+            WHERE id IN (SELECT MAX(id) FROM category_corrections WHERE scope = ? GROUP BY row_id)
+            ORDER BY id
+        """, (scope,))
+    corrections = cursor.fetchall()
+    conn.close()
+    
+    if not corrections:
+        return None
+    
+    model.partial_fit([text for _, text, _ in corrections], [category for _, _, category in corrections])
+    version = submit_write(_insert_category_model, scope, corrections[-1][0], model, tables=('category_models',)).result()
+    
+    return {'version': version, 'examples': model.examples, 'labels': len(model.labels), 'new_examples': len(corrections)}
+
+def _insert_category_model(cursor, scope, trained_through, model):
+    """Store a model as the active version of its scope, keeping a few older versions"""
+    cursor.execute("UPDATE category_models SET active = 0 WHERE scope = ?", (scope,))
+    cursor.execute("""
+        INSERT INTO category_models (scope, trained_through, examples, labels, model, active)
+        VALUES (?, ?, ?, ?, ?, 1)
+    """, (scope, trained_through, model.examples, len(model.labels), model.to_bytes()))
+    version = cursor.lastrowid
+    
+    cursor.execute("""
+        DELETE FROM category_models
+        WHERE scope = ? AND version NOT IN (SELECT version FROM category_models WHERE scope = ? ORDER BY version DESC LIMIT ?)
+    """, (scope, scope, CLASSIFIER_KEEP_VERSIONS))
+    return version
+
+def _train_if_due(scope):
+    """Train incrementally once enough corrections have piled up since the active version"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT COUNT(*) FROM category_corrections
+        WHERE scope = ? AND id > COALESCE((SELECT trained_through FROM category_models WHERE scope = ? AND active = 1), 0)
+    """, (scope, scope))
+    pending = cursor.fetchone()[0]
+    
+    conn.close()
+    
+    if pending >= CLASSIFIER_RETRAIN_EVERY:
+        train_category_model(scope)
+
+def list_category_models(scope=None):
+    """Stored model versions, newest first, with the number of corrections not yet learned"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    sql = """
+        SELECT
+            m.version, m.scope, m.trained_through, m.examples, m.labels, m.active, m.created_at,
+            (SELECT COUNT(*) FROM category_corrections c WHERE c.scope = m.scope AND c.id > m.trained_through) AS pending
+        FROM category_models m
+    """
+    params = []
+    if scope:
+        sql += " WHERE m.scope = ?"
+        params.append(scope)
+    cursor.execute(sql + " ORDER BY m.version DESC", params)
+    
+    models = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return models
+
+def activate_category_model(version):
+    """Make an older (or newer) stored version the active model of its scope"""
+    if not submit_write(_activate_category_model, version, tables=('category_models',)).result():
+        raise ValueError(f"Unknown model version: {version}")
+
+def _activate_category_model(cursor, version):
+    cursor.execute("""
+        UPDATE category_models SET active = (version = ?)
+        WHERE scope = (SELECT scope FROM category_models WHERE version = ?)
+    """, (version, version))
+    return cursor.rowcount
 
 def get_metrics():
     """Get dashboard metrics"""
+    return cached_read(('get_metrics',), ('documents', 'transactions', 'categories'), _load_metrics)
+
+def _load_metrics():
+    """Compute dashboard metrics from the database"""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    # Total documents
-    cursor.execute("SELECT COUNT(*) FROM documents")
+    # Total documents (copies of an invoice already on file are not counted)
+    cursor.execute("SELECT COUNT(*) FROM documents WHERE status IS NOT 'duplicate'")
     total_documents = cursor.fetchone()[0]
     
     # Total amount
-    cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM transactions")
+    cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE duplicate_of IS NULL")
     total_amount = cursor.fetchone()[0]
     
     # This month documents
     cursor.execute("""
         SELECT COUNT(*) FROM documents 
-        WHERE strftime('%Y-%m', uploaded_at) = strftime('%Y-%m', 'now')
+        WHERE strftime('%Y-%m', uploaded_at) = strftime('%Y-%m', 'now') AND status IS NOT 'duplicate'
     """)
     month_documents = cursor.fetchone()[0]
     
@@ -199,7 +1501,7 @@ def get_metrics():
     last_upload = cursor.fetchone()[0] or 'Never'
     
     # Average amount
-    cursor.execute("SELECT AVG(amount) FROM transactions WHERE amount > 0")
+    cursor.execute("SELECT AVG(amount) FROM transactions WHERE amount > 0 AND duplicate_of IS NULL")
     avg_amount = cursor.fetchone()[0] or 0
     
     # Average confidence
@@ -210,13 +1512,24 @@ def get_metrics():
     cursor.execute("""
         SELECT category, SUM(amount) as total 
         FROM transactions 
-        WHERE category IS NOT NULL
+        WHERE category IS NOT NULL AND duplicate_of IS NULL
         GROUP BY category 
         ORDER BY total DESC 
         LIMIT 5
     """)
     top_categories = cursor.fetchall()
     
+    # Spending per department, one grouped join over the category rollup index
+    cursor.execute("""
+        SELECT COALESCE(c.department, 'Unassigned') as department, SUM(t.amount) as total
+        FROM transactions t
+        LEFT JOIN categories c ON c.id = t.category_id
+        WHERE t.duplicate_of IS NULL
+        GROUP BY 1
+        ORDER BY total DESC
+    """)
+    department_totals = cursor.fetchall()
+    
     conn.close()
     
     return {
@@ -227,16 +1540,55 @@ def get_metrics():
         'last_upload': last_upload,
         'avg_amount': avg_amount,
         'avg_confidence': avg_confidence,
-        'top_categories': top_categories
+        'top_categories': top_categories,
+        'department_totals': department_totals
     }
 
-def get_all_documents():
+# Filterable document fields and the columns they map to
+DOCUMENT_FILTER_COLUMNS = {
+    'category': 't.category',
+    'vendor_name': 't.vendor_name',
+    'vendor_id': 't.vendor_id',
+    'status': 'd.status',
+    'engine': 'd.meta_engine',
+    'source': 'd.meta_source',
+}
+
+# Range filters: filter key -> (column, comparison)
+DOCUMENT_RANGE_FILTERS = {
+    'min_confidence': ('d.meta_confidence', '>='),
+    'max_confidence': ('d.meta_confidence', '<'),
+}
+
+def _document_filter_clause(filters):
+    """Build WHERE conditions and parameters for document filters"""
+    conditions = []
+    params = []
+    
+    for key, column in DOCUMENT_FILTER_COLUMNS.items():
+        value = (filters or {}).get(key)
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    
+    for key, (column, comparison) in DOCUMENT_RANGE_FILTERS.items():
+        value = (filters or {}).get(key)
+        if value is not None:
+            conditions.append(f"{column} {comparison} ?")
+            params.append(value)
+    
+    return conditions, params
+
+def get_all_documents(filters=None):
     """Get all documents with transaction data"""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
-    cursor.execute("""
+    conditions, params = _document_filter_clause(filters)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    cursor.execute(f"""
         SELECT 
             d.id,
             d.uploaded_at,
@@ -249,24 +1601,340 @@ def get_all_documents():
             d.status
         FROM documents d
         LEFT JOIN transactions t ON d.id = t.document_id
-        ORDER BY d.uploaded_at DESC
-    """)
+        {where}
+        ORDER BY d.uploaded_at DESC, d.id DESC
+    """, params)
     
     documents = [dict(row) for row in cursor.fetchall()]
     conn.close()
     
     return documents
 
-def execute_query(sql):
-    """Execute SQL query and return results"""
+def get_documents_page(filters=None, after=None, limit=25):
+    """Get one page of documents, newest first, using keyset pagination.
+    
+    `after` is the (uploaded_at, id) cursor of the last row of the previous
+    page. Returns (documents, next_cursor); next_cursor is None on the last page.
+    """
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
-    cursor.execute(sql)
-    results = [dict(row) for row in cursor.fetchall()]
+    conditions, params = _document_filter_clause(filters)
+    if after:
+        conditions.append("(d.uploaded_at, d.id) < (?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    # Fetch one extra row to know whether another page exists
+    cursor.execute(f"""
+        SELECT 
+            d.id,
+            d.uploaded_at,
+            t.id AS transaction_id,
+            t.vendor_name,
+            t.invoice_number,
+            t.transaction_date,
+            t.amount,
+            t.category,
+            d.confidence_score,
+            d.status,
+            d.file_path,
+            (SELECT COUNT(*) FROM line_items li WHERE li.document_id = d.id) AS line_item_count
+        FROM documents d
+        LEFT JOIN transactions t ON d.id = t.document_id
+        {where}
+        ORDER BY d.uploaded_at DESC, d.id DESC
+        LIMIT ?
+    """, params + [limit + 1])
+    
+    documents = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = (documents[-1]['uploaded_at'], documents[-1]['id'])
+    
+    return documents, next_cursor
+
+def get_document(document_id):
+    """Get a single document with its transaction data"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT 
+            d.id,
+            d.uploaded_at,
+            t.id AS transaction_id,
+            t.vendor_name,
+            t.invoice_number,
+            t.transaction_date,
+            t.amount,
+            t.category,
+            d.confidence_score,
+            d.status,
+            d.file_path
+        FROM documents d
+        LEFT JOIN transactions t ON d.id = t.document_id
+        WHERE d.id = ?
+    """, (document_id,))
     
+    row = cursor.fetchone()
     conn.close()
+    
+    return dict(row) if row else None
+
+def get_document_stats(filters=None):
+    """Get document count, amount and confidence aggregates for the given filters"""
+    key = ('get_document_stats', tuple(sorted((filters or {}).items())))
+    return cached_read(key, ('documents', 'transactions'), lambda: _load_document_stats(filters))
+
+def _load_document_stats(filters):
+    """Compute document aggregates from the database"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    conditions, params = _document_filter_clause(filters)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    cursor.execute(f"""
+        SELECT 
+            COUNT(*),
+            COALESCE(SUM(d.status = 'processed'), 0),
+            COALESCE(SUM(CASE WHEN t.duplicate_of IS NULL THEN t.amount END), 0),
+            COALESCE(AVG(COALESCE(d.confidence_score, 0)), 0)
+        FROM documents d
+        LEFT JOIN transactions t ON d.id = t.document_id
+        {where}
+    """, params)
+    
+    count, processed, total_amount, avg_confidence = cursor.fetchone()
+    conn.close()
+    
+    return {
+        'count': count,
+        'processed': processed,
+        'total_amount': total_amount,
+        'avg_confidence': avg_confidence
+    }
+
+def get_filter_values(field):
+    """Get distinct non-empty values of a filterable document field"""
+    column = DOCUMENT_FILTER_COLUMNS[field]
+    table = 'transactions' if column.startswith('t.') else 'documents'
+    name = column.split('.', 1)[1]
+    
+    return cached_read(('get_filter_values', field), (table,), lambda: _load_distinct_values(table, name))
+
+def _load_distinct_values(table, name):
+    """Distinct non-empty values of a column"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute(f"SELECT DISTINCT {name} FROM {table} WHERE {name} IS NOT NULL AND {name} != '' ORDER BY {name}")
+    values = [row[0] for row in cursor.fetchall()]
+    
+    conn.close()
+    return values
+
+def rebuild_search_index(cursor):
+    """Repopulate the full-text search index from the base tables"""
+    cursor.execute("DELETE FROM documents_fts")
+    cursor.execute("""
+        INSERT INTO documents_fts (rowid, vendor_name, invoice_number, raw_text, line_items)
+        SELECT 
+            d.id,
+            (SELECT group_concat(vendor_name, ' ') FROM transactions WHERE document_id = d.id),
+            (SELECT group_concat(invoice_number, ' ') FROM transactions WHERE document_id = d.id),
+            d.raw_text,
+            (SELECT group_concat(description, ' ') FROM line_items WHERE document_id = d.id)
+        FROM documents d
+    """)
+
+def _search_match_expression(text):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix"""
+    terms = re.findall(r"\w+", (text or '').lower())
+    if not terms:
+        return None
+    
+    phrases = [f'"{term}"' for term in terms]
+    phrases[-1] += '*'
+    return ' '.join(phrases)
+
+def search_documents(text, filters=None, offset=0, limit=25):
+    """Full-text search over documents, best matches first.
+    
+    Returns (documents, next_offset); each document carries a highlighted
+    `snippet`. next_offset is None on the last page.
+    """
+    match = _search_match_expression(text)
+    if match is None:
+        return [], None
+    
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    conditions, params = _document_filter_clause(filters)
+    conditions.insert(0, "documents_fts MATCH ?")
+    params.insert(0, match)
+    
+    cursor.execute(f"""
+        SELECT 
+            d.id,
+            d.uploaded_at,
+            t.id AS transaction_id,
+            t.vendor_name,
+            t.invoice_number,
+            t.transaction_date,
+            t.amount,
+            t.category,
+            d.confidence_score,
+            d.status,
+            d.file_path,
+            (SELECT COUNT(*) FROM line_items li WHERE li.document_id = d.id) AS line_item_count,
+            snippet(documents_fts, -1, '**', '**', '…', 12) AS snippet
+        FROM documents_fts
+        JOIN documents d ON d.id = documents_fts.rowid
+        LEFT JOIN transactions t ON d.id = t.document_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY documents_fts.rank
+        LIMIT ? OFFSET ?
+    """, params + [limit + 1, offset])
+    
+    documents = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    
+    next_offset = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_offset = offset + limit
+    
+    return documents, next_offset
+
+def _read_authorizer(action, arg1, arg2, db_name, trigger):
+    """Allow only reads and record the tables the statement being compiled reads"""
+    _local.compiled = True
+    if action == sqlite3.SQLITE_READ:
+        _local.tables_read.add(arg1.lower())
+        return sqlite3.SQLITE_OK
+    if action in READ_ONLY_ACTIONS:
+        return sqlite3.SQLITE_OK
+    # Internal statements of virtual tables (FTS5) poll data_version and re-declare their schema
+    if action == sqlite3.SQLITE_PRAGMA and arg1 == 'data_version' and arg2 is None:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_UPDATE and arg1 == 'sqlite_master':
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+def _progress_handler():
+    """Abort the running statement once the current deadline has passed"""
+    deadline = getattr(_local, 'deadline', None)
+    return 1 if deadline is not None and time.monotonic() > deadline else 0
+
+def get_read_connection():
+    """Read-only connection for the current thread.
+    
+    The connection is reused so its prepared-statement cache survives
+    between queries; writes are rejected both by the read-only open mode
+    and by the authorizer.
+    """
+    conn = getattr(_local, 'read_conn', None)
+    if conn is None or _local.read_path != DB_PATH:
+        if conn is not None:
+            conn.close()
+        
+        uri = f"file:{pathname2url(os.path.abspath(DB_PATH))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.set_authorizer(_read_authorizer)
+        conn.set_progress_handler(_progress_handler, PROGRESS_HANDLER_STEPS)
+        
+        _local.read_conn = conn
+        _local.read_path = DB_PATH
+        _local.tables_read = set()
+    return conn
+
+def _run_step(cursor, step, budget):
+    """Run one cursor step under the remaining time budget; returns (result, budget left)"""
+    started = time.monotonic()
+    _local.deadline = started + budget
+    try:
+        result = step()
+    except sqlite3.OperationalError as e:
+        if 'interrupted' in str(e):
+            raise QueryTimeoutError("Query exceeded its time budget and was cancelled") from e
+        raise
+    finally:
+        _local.deadline = None
+    return result, budget - (time.monotonic() - started)
+
+def iter_query(sql, params=(), timeout=QUERY_TIMEOUT, max_rows=None, chunk_size=500):
+    """Stream the rows of a read-only query as dicts.
+    
+    Rows are fetched from the cursor in chunks; the time budget covers the
+    time spent inside SQLite, and iteration stops after max_rows rows.
+    """
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    
+    _local.tables_read = set()
+    _local.compiled = False
+    
+    try:
+        _, budget = _run_step(cursor, lambda: cursor.execute(sql, params), timeout)
+        
+        # Remember which tables this statement reads for the result cache
+        if _local.compiled:
+            statement = _normalize_sql(sql)
+            with _cache_lock:
+                _statement_tables[statement] = frozenset(_local.tables_read)
+                _statement_tables.move_to_end(statement)
+                while len(_statement_tables) > STATEMENT_CACHE_SIZE * 4:
+                    _statement_tables.popitem(last=False)
+        
+        if cursor.description is None:
+            return
+        names = [column[0] for column in cursor.description]
+        
+        returned = 0
+        while max_rows is None or returned < max_rows:
+            size = chunk_size if max_rows is None else min(chunk_size, max_rows - returned)
+            rows, budget = _run_step(cursor, lambda: cursor.fetchmany(size), budget)
+            if not rows:
+                break
+            
+            for row in rows:
+                yield dict(zip(names, row))
+            returned += len(rows)
+    finally:
+        cursor.close()
+
+def execute_query(sql, params=(), timeout=QUERY_TIMEOUT, max_rows=QUERY_MAX_ROWS):
+    """Execute a read-only SQL query and return at most max_rows results.
+    
+    Queries are cancelled with QueryTimeoutError after `timeout` seconds and
+    statements that would modify the database are rejected. Results are
+    served from the result cache until a table they read is written.
+    """
+    params = tuple(params)
+    statement = _normalize_sql(sql)
+    key = ('sql', statement, params, max_rows)
+    cached = _cache_get(key)
+    if cached is not None:
+        return [dict(row) for row in cached]
+    
+    versions = _snapshot_versions()
+    results = list(iter_query(sql, params, timeout=timeout, max_rows=max_rows))
+    
+    with _cache_lock:
+        tables_read = _statement_tables.get(statement)
+    
+    if tables_read is not None and len(results) <= QUERY_CACHE_MAX_ROWS:
+        _cache_put(key, [dict(row) for row in results], tables_read, versions)
+    
     return results
 
 def save_line_items(document_id, transaction_id, line_items):
@@ -274,18 +1942,11 @@ def save_line_items(document_id, transaction_id, line_items):
     if not line_items:
         return
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    # Categorize the whole receipt in one batch
+    categories = categorize_batch('line_item', [item.get('description', '') for item in line_items])
     
-    for item in line_items:
-        # Auto-categorize each item
-        category = auto_categorize_line_item(item.get('description', ''))
-        
-        cursor.execute("""
-            INSERT INTO line_items (
-                document_id, transaction_id, description, quantity, unit_price, total, category
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
+    rows = [
+        (
             document_id,
             transaction_id,
             item.get('description'),
@@ -293,10 +1954,19 @@ def save_line_items(document_id, transaction_id, line_items):
             item.get('unit_price', 0),
             item.get('total', 0),
             category
-        ))
+        )
+        for item, category in zip(line_items, categories)
+    ]
     
-    conn.commit()
-    conn.close()
+    submit_write(_insert_line_items, rows, tables=('line_items', 'products')).result()
+
+def _insert_line_items(cursor, rows):
+    """Insert prepared line item rows, linking each description to the product catalog"""
+    cursor.executemany("""
+        INSERT INTO line_items (
+            document_id, transaction_id, description, quantity, unit_price, total, category, category_id, product_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT id FROM categories WHERE name = ?), ?)
+    """, [row + (row[6], _resolve_product(cursor, row[2])) for row in rows])
 
 def get_line_items(document_id):
     """Get all line items for a document"""
@@ -317,70 +1987,186 @@ def get_line_items(document_id):
 
 def delete_document(document_id):
     """Delete document and cascade to transactions and line_items"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    delete_documents([document_id])
+
+def delete_documents(document_ids):
+    """Delete many documents with their transactions and line items in one transaction.
     
-    # SQLite CASCADE should handle this, but let's be explicit
-    cursor.execute("DELETE FROM line_items WHERE document_id = ?", (document_id,))
-    cursor.execute("DELETE FROM transactions WHERE document_id = ?", (document_id,))
-    cursor.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+    Returns the number of documents deleted. Freed pages are returned to
+    the file system by the writer thread afterwards, without waiting for it.
+    """
+    document_ids = sorted({int(document_id) for document_id in document_ids})
+    if not document_ids:
+        return 0
     
-    conn.commit()
-    conn.close()
+    deleted = submit_write(_delete_documents, document_ids, tables=('line_items', 'transactions', 'documents')).result()
+    submit_write(_reclaim_free_space, None, VACUUM_MIN_FREE_PAGES, transaction=False)
+    return deleted
+
+def _delete_documents(cursor, document_ids):
+    """Delete the given documents, their transactions and line items through a temp-table join"""
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id INTEGER PRIMARY KEY)")
+    cursor.execute("DELETE FROM temp.bulk_ids")
+    cursor.executemany("INSERT OR IGNORE INTO temp.bulk_ids (id) VALUES (?)", [(document_id,) for document_id in document_ids])
+    
+    # Documents go first so the search-index triggers on the child tables
+    # find nothing left to re-index
+    cursor.execute("DELETE FROM documents WHERE id IN (SELECT id FROM temp.bulk_ids)")
+    deleted = cursor.rowcount
+    cursor.execute("DELETE FROM line_items WHERE document_id IN (SELECT id FROM temp.bulk_ids)")
+    cursor.execute("DELETE FROM transactions WHERE document_id IN (SELECT id FROM temp.bulk_ids)")
+    _repair_duplicate_links(cursor)
+    
+    cursor.execute("DELETE FROM temp.bulk_ids")
+    return deleted
 
 def update_transaction(transaction_id, data):
     """Update transaction fields"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    update_transactions([dict(data, id=transaction_id)])
+
+def update_transactions(changes):
+    """Apply many transaction edits in one transaction.
+    
+    `changes` is a list of dicts with the transaction 'id' and the fields to
+    set; edits to the same set of fields share one executemany. Category
+    changes are recorded as corrections for the learned categorizer.
+    Returns the number of rows updated.
+    """
+    return _edit_rows('transaction', TRANSACTION_EDIT_FIELDS, changes)
+
+def update_line_items(changes):
+    """Apply many line item edits in one transaction; same format as update_transactions()"""
+    return _edit_rows('line_item', LINE_ITEM_EDIT_FIELDS, changes)
+
+def _edit_rows(scope, edit_fields, changes):
+    table = CATEGORY_TEXT_SQL[scope][0]
     
-    # Build UPDATE query dynamically based on provided data
-    fields = []
-    values = []
+    groups = {}
+    for change in changes:
+        fields = tuple(key for key in edit_fields if key in change)
+        if fields:
+            groups.setdefault(fields, []).append([change[key] for key in fields] + [change['id']])
     
-    for key in ['vendor_name', 'invoice_number', 'transaction_date', 'amount', 'tax_amount', 'category']:
-        if key in data:
-            fields.append(f"{key} = ?")
-            values.append(data[key])
+    if not groups:
+        return 0
     
-    if fields:
-        values.append(transaction_id)
-        sql = f"UPDATE transactions SET {', '.join(fields)} WHERE id = ?"
-        cursor.execute(sql, values)
-        conn.commit()
+    statements = [
+        (f"UPDATE {table} SET {', '.join(f'{key} = ?' for key in fields)} WHERE id = ?", rows)
+        for fields, rows in groups.items()
+    ]
+    categories = [(change['id'], change['category']) for change in changes if change.get('category')]
+    # Edited vendor names and descriptions are resolved to their canonical vendor or product again
+    entity = CANONICAL_ENTITIES[CANONICAL_SCOPES[scope]]
+    names = [(change['id'], change[entity['name_column']]) for change in changes if entity['name_column'] in change]
     
-    conn.close()
+    # Edits to the invoice identity relink the transaction to its duplicates
+    rekey_ids = [change['id'] for change in changes if scope == 'transaction' and any(field in change for field in DEDUPE_FIELDS)]
+    
+    tables = (table, entity['table']) + (('documents',) if rekey_ids else ())
+    changed = submit_write(_apply_edits, scope, statements, categories, names, rekey_ids, tables=tables).result()
+    
+    if categories:
+        _train_if_due(scope)
+    return changed
 
-def auto_categorize_line_item(description):
-    """Auto-categorize individual line items based on description"""
-    desc_lower = (description or '').lower()
+def _apply_edits(cursor, scope, statements, categories, names=(), rekey_ids=()):
+    """Run edit statements, relink edited vendors or products and record the rows whose category changed as corrections"""
+    table, sql, id_column = CATEGORY_TEXT_SQL[scope]
+    
+    ids = [row_id for row_id, _ in categories]
+    previous = {}
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        cursor.execute(f"SELECT id, category FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+        previous.update(cursor.fetchall())
+    
+    changed = _execute_many(cursor, statements)
+    
+    entity = CANONICAL_SCOPES[scope]
+    spec = CANONICAL_ENTITIES[entity]
+    for row_id, name in names:
+        cursor.execute(f"UPDATE {table} SET {spec['id_column']} = ? WHERE id = ?", (_resolve_canonical(cursor, entity, name), row_id))
+    
+    if rekey_ids:
+        _rekey_transactions(cursor, rekey_ids)
     
-    # Meat & Poultry
-    if any(kw in desc_lower for kw in ['chicken', 'beef', 'pork', 'sausage', 'meat', 'mutton', 'lamb']):
-        return 'Meat & Poultry'
+    # Read the text after the edit, so a vendor fixed together with the category is learned too
+    cursor.executemany(
+        f"INSERT INTO category_corrections (scope, row_id, text, category) SELECT ?, * FROM ({sql} WHERE {id_column} = ?)",
+        [(scope, row_id) for row_id, category in categories if row_id in previous and previous[row_id] != category]
+    )
+    return changed
+
+def _execute_write(cursor, sql, params):
+    """Run a single write statement"""
+    cursor.execute(sql, params)
+
+def _execute_many(cursor, statements):
+    """Run (sql, rows) pairs with executemany; returns the total rows changed"""
+    changed = 0
+    for sql, rows in statements:
+        cursor.executemany(sql, rows)
+        changed += cursor.rowcount
+    return changed
+
+def get_storage_status():
+    """Database file size, free pages and auto-vacuum mode"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
     
-    # Seafood
-    if any(kw in desc_lower for kw in ['fish', 'mackerel', 'tuna', 'salmon', 'seafood', 'prawn', 'crab', 'shrimp']):
-        return 'Seafood'
+    status = {}
+    for pragma in ('auto_vacuum', 'page_size', 'page_count', 'freelist_count'):
+        cursor.execute(f"PRAGMA {pragma}")
+        status[pragma] = cursor.fetchone()[0]
+    conn.close()
     
-    # Dairy & Eggs
-    if any(kw in desc_lower for kw in ['egg', 'milk', 'cheese', 'yogurt', 'curd', 'dairy', 'butter', 'cream']):
-        return 'Dairy & Eggs'
+    status['incremental'] = status['auto_vacuum'] == 2
+    status['file_bytes'] = status['page_size'] * status['page_count']
+    status['free_bytes'] = status['page_size'] * status['freelist_count']
+    return status
+
+def reclaim_free_space(max_pages=None, min_free_pages=VACUUM_MIN_FREE_PAGES):
+    """Return free pages (all, or up to max_pages) to the file system, once at least min_free_pages have built up.
     
-    # Snacks & Beverages
-    if any(kw in desc_lower for kw in ['chips', 'snack', 'biscuit', 'cookie', 'beverage', 'drink', 'juice', 'soda']):
-        return 'Snacks & Beverages'
+    Runs a single PRAGMA incremental_vacuum instead of a full VACUUM, queued
+    on the writer thread between batches of writes. Returns the number of
+    pages released.
+    """
+    return submit_write(_reclaim_free_space, max_pages, min_free_pages, transaction=False).result()
+
+def _reclaim_free_space(cursor, max_pages, min_free_pages):
+    cursor.execute("PRAGMA auto_vacuum")
+    if cursor.fetchone()[0] != 2:
+        return 0
     
-    # Fruits & Vegetables
-    if any(kw in desc_lower for kw in ['fruit', 'vegetable', 'apple', 'banana', 'carrot', 'beans', 'tomato', 'potato']):
-        return 'Fruits & Vegetables'
+    cursor.execute("PRAGMA freelist_count")
+    free_pages = cursor.fetchone()[0]
+    if free_pages < min_free_pages:
+        return 0
     
-    # Bakery
-    if any(kw in desc_lower for kw in ['bread', 'cake', 'pastry', 'bakery', 'bun', 'roll']):
-        return 'Bakery'
+    # The pragma frees one page per step and execute() stops after the
+    # first; executescript() steps it to completion, which is why this runs
+    # outside the writer's transactions
+    pages = min(free_pages, max_pages or free_pages)
+    cursor.connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+    return pages
+
+def enable_incremental_vacuum():
+    """One-time switch of an existing database to auto_vacuum=INCREMENTAL.
+    
+    The mode only changes through a full VACUUM, which blocks writers while
+    it rewrites the file; run it when the app is idle.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    cursor = conn.cursor()
     
-    # Frozen Foods
-    if any(kw in desc_lower for kw in ['frozen', 'ice cream', 'popsicle']):
-        return 'Frozen Foods'
+    cursor.execute("PRAGMA auto_vacuum")
+    if cursor.fetchone()[0] != 2:
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("VACUUM")
     
-    # Default to Grocery Items
-    return 'Grocery Items'
+    conn.close()
+
+def auto_categorize_line_item(description):
+    """Auto-categorize individual line items based on description"""
+    return categorize('line_item', description)
@@ -0,0 +1,54 @@
+import re
+from utils.vendor_index import normalize_vendor
+
+MONTHS = {name: number for number, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1
+)}
+
+def normalize_invoice_number(invoice_number):
+    """Invoice number without case, spaces or punctuation ('inv-0042 ' -> 'INV0042')"""
+    return re.sub(r'[^A-Za-z0-9]+', '', str(invoice_number or '')).upper()
+
+def normalize_date(value):
+    """Extracted date with separators, zero padding and two-digit years made uniform.
+    
+    Day/month order is kept as extracted: the same document always yields the
+    same order, and guessing it would merge distinct dates.
+    """
+    text = str(value or '').strip().lower()
+    if not text:
+        return ''
+    
+    match = re.match(r'^(\d{4})[/.-](\d{1,2})[/.-](\d{1,2})', text)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+        return f"{year:04d}-{month:02d}-{day:02d}"
+    
+    match = re.match(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})$', text)
+    if match:
+        first, second, year = (int(part) for part in match.groups())
+        return f"{first:02d}-{second:02d}-{year + 2000 if year < 100 else year:04d}"
+    
+    match = re.match(r'^(\d{1,2})\s+([a-z]{3})[a-z]*\.?\s+(\d{2,4})$', text)
+    if match and match.group(2) in MONTHS:
+        year = int(match.group(3))
+        return f"{year + 2000 if year < 100 else year:04d}-{MONTHS[match.group(2)]:02d}-{int(match.group(1)):02d}"
+    
+    return ' '.join(text.split())
+
+def dedupe_key(vendor_name, invoice_number, transaction_date, amount):
+    """Identity of an invoice across channels, or None when there is too little to tell.
+    
+    Both a vendor and an invoice number are required: without them, two
+    purchases of the same amount on the same day are not duplicates.
+    """
+    vendor = normalize_vendor(vendor_name)
+    invoice = normalize_invoice_number(invoice_number)
+    if not vendor or not invoice:
+        return None
+    
+    try:
+        cents = round(float(amount or 0) * 100)
+    except (TypeError, ValueError):
+        cents = 0
+    return f"{vendor}|{invoice}|{normalize_date(transaction_date)}|{cents}"
@@ -0,0 +1,201 @@
+import csv
+import os
+import sqlite3
+import time
+from datetime import datetime
+from utils import database
+
+# Optional writers for spreadsheet and columnar formats
+try:
+    from openpyxl import Workbook
+    XLSX_AVAILABLE = True
+except ImportError:
+    XLSX_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+EXPORT_DIR = "data/exports"
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_KEEP_FILES = 10
+XLSX_MAX_ROWS = 1048576
+
+# Exported columns (one row per line item) and their Parquet types
+EXPORT_COLUMNS = {
+    'document_id': 'int',
+    'uploaded_at': 'str',
+    'status': 'str',
+    'confidence_score': 'float',
+    'vendor_name': 'str',
+    'invoice_number': 'str',
+    'transaction_date': 'str',
+    'amount': 'float',
+    'tax_amount': 'float',
+    'category': 'str',
+    'item_description': 'str',
+    'item_quantity': 'float',
+    'item_unit_price': 'float',
+    'item_total': 'float',
+    'item_category': 'str',
+}
+
+EXPORT_FORMATS = {
+    'csv': {'label': 'CSV', 'extension': 'csv', 'mime': 'text/csv'},
+    'xlsx': {'label': 'Excel', 'extension': 'xlsx', 'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'},
+    'parquet': {'label': 'Parquet', 'extension': 'parquet', 'mime': 'application/octet-stream'},
+}
+
+def available_formats():
+    """Export formats whose writer libraries are installed"""
+    installed = {'csv': True, 'xlsx': XLSX_AVAILABLE, 'parquet': PARQUET_AVAILABLE}
+    return [fmt for fmt in EXPORT_FORMATS if installed[fmt]]
+
+def iter_export_chunks(filters=None, chunk_size=EXPORT_CHUNK_ROWS):
+    """Yield lists of export rows, newest documents first.
+    
+    Rows are fetched from an open cursor in chunks, so only one chunk is in
+    memory at a time. Documents without line items appear once with empty
+    item columns.
+    """
+    conditions, params = database._document_filter_clause(filters)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute(f"""
+            SELECT
+                d.id,
+                d.uploaded_at,
+                d.status,
+                d.confidence_score,
+                t.vendor_name,
+                t.invoice_number,
+                t.transaction_date,
+                t.amount,
+                t.tax_amount,
+                t.category,
+                li.description,
+                li.quantity,
+                li.unit_price,
+                li.total,
+                li.category
+            FROM documents d
+            LEFT JOIN transactions t ON d.id = t.document_id
+            LEFT JOIN line_items li ON li.document_id = d.id
+            {where}
+            ORDER BY d.uploaded_at DESC, d.id DESC, li.id
+        """, params)
+        
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def _write_csv(path, chunks, progress):
+    rows_written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows(rows)
+            rows_written += len(rows)
+            progress(rows_written)
+    return rows_written
+
+def _write_xlsx(path, chunks, progress):
+    # Write-only workbooks stream rows to a temporary file instead of keeping cells in memory
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    
+    rows_written = 0
+    for rows in chunks:
+        for row in rows:
+            # Continue on a new sheet past Excel's row limit
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Documents {len(workbook.worksheets) + 1}" if workbook.worksheets else "Documents")
+                sheet.append(list(EXPORT_COLUMNS))
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+        rows_written += len(rows)
+        progress(rows_written)
+    
+    if sheet is None:
+        workbook.create_sheet("Documents").append(list(EXPORT_COLUMNS))
+    workbook.save(path)
+    return rows_written
+
+def _write_parquet(path, chunks, progress):
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+    schema = pa.schema([(name, types[kind]) for name, kind in EXPORT_COLUMNS.items()])
+    names = list(EXPORT_COLUMNS)
+    
+    rows_written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        # Each chunk becomes one row group
+        for rows in chunks:
+            columns = {name: [row[i] for row in rows] for i, name in enumerate(names)}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            rows_written += len(rows)
+            progress(rows_written)
+    return rows_written
+
+WRITERS = {
+    'csv': _write_csv,
+    'xlsx': _write_xlsx,
+    'parquet': _write_parquet,
+}
+
+def _prune_exports(keep=EXPORT_KEEP_FILES):
+    """Delete all but the newest `keep` export files"""
+    paths = [os.path.join(EXPORT_DIR, name) for name in os.listdir(EXPORT_DIR)]
+    # Skip exports still being written
+    paths = sorted((path for path in paths if os.path.isfile(path) and not path.endswith('.tmp')), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        os.remove(path)
+
+def export_documents(fmt='csv', filters=None, progress=None, chunk_size=EXPORT_CHUNK_ROWS):
+    """Export documents with their line items to a file under EXPORT_DIR.
+    
+    Rows are streamed from the database and written chunk by chunk, so the
+    export can be larger than available memory. `progress` is called with
+    the number of rows written so far. Returns the file path, row count,
+    size and throughput.
+    """
+    if fmt not in available_formats():
+        raise ValueError(f"Export format not available: {fmt}")
+    
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"documents-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.{EXPORT_FORMATS[fmt]['extension']}")
+    tmp_path = path + '.tmp'
+    
+    start = time.perf_counter()
+    try:
+        rows = WRITERS[fmt](tmp_path, iter_export_chunks(filters, chunk_size), progress or (lambda rows: None))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    seconds = time.perf_counter() - start
+    
+    _prune_exports()
+    
+    return {
+        'path': path,
+        'format': fmt,
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds else 0.0,
+    }
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from PIL import Image, ImageOps
+
+BLOB_DIR = "data/blobs"
+THUMBNAIL_DIR = "data/thumbnails"
+READ_CHUNK_BYTES = 1024 * 1024
+
+# Re-encode stored images when that saves space (PNG losslessly, JPEG at its original quality)
+RECOMPRESS_IMAGES = os.getenv("BLOB_RECOMPRESS", "false").lower() == "true"
+
+# Longest edge in pixels for each cached preview size
+THUMBNAIL_SIZES = {
+    'small': 160,
+    'medium': 640,
+    'large': 1280,
+}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+def _blob_key(digest, extension):
+    """Relative blob path, sharded by the first four hex digits of the hash: ab/cd/abcd....ext"""
+    return os.path.join(digest[:2], digest[2:4], digest + extension)
+
+def blob_path(key):
+    """Absolute location of a stored blob"""
+    return os.path.join(BLOB_DIR, key)
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _recompress_image(source, target, extension):
+    """Re-encode an image into target; returns False if that does not make it smaller"""
+    try:
+        with Image.open(source) as image:
+            if extension == '.png':
+                image.save(target, format='PNG', optimize=True)
+            else:
+                # Reuse the original quantization tables and chroma subsampling; decoding
+                # and re-encoding still rounds pixels, so this is near-lossless, not lossless
+                image.save(target, format='JPEG', quality='keep', subsampling='keep', optimize=True)
+    except (OSError, ValueError):
+        return False
+    return os.path.getsize(target) < os.path.getsize(source)
+
+def store_file(source_path, extension=None, recompress=None):
+    """Copy a file into the content-addressed store and return its blob key.
+    
+    The key is derived from the SHA-256 of the original bytes, so storing the
+    same file twice keeps a single copy. With recompress (default:
+    BLOB_RECOMPRESS env var), PNG images are re-encoded losslessly and JPEG
+    images at their original quality settings (not bit-exact) when that
+    saves space.
+    """
+    if recompress is None:
+        recompress = RECOMPRESS_IMAGES
+    
+    extension = (extension or os.path.splitext(source_path)[1]).lower()
+    key = _blob_key(_hash_file(source_path), extension)
+    path = blob_path(key)
+    
+    if os.path.exists(path):
+        return key
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    # Write next to the final location and rename, so readers never see partial files
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    
+    try:
+        if not (recompress and extension in IMAGE_EXTENSIONS and _recompress_image(source_path, tmp_path, extension)):
+            shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    return key
+
+def get_thumbnail(key, size='small'):
+    """Path to a cached JPEG preview of a stored image, generated on first request.
+    
+    Returns None when the blob is missing or is not an image (e.g. PDFs).
+    """
+    if not key or os.path.splitext(key)[1] not in IMAGE_EXTENSIONS:
+        return None
+    
+    thumbnail_path = os.path.join(THUMBNAIL_DIR, size, os.path.splitext(os.path.basename(key))[0] + '.jpg')
+    if os.path.exists(thumbnail_path):
+        return thumbnail_path
+    
+    source = blob_path(key)
+    if not os.path.exists(source):
+        return None
+    
+    max_edge = THUMBNAIL_SIZES[size]
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    
+    with Image.open(source) as image:
+        # Let the JPEG decoder downscale while decoding instead of decoding full resolution
+        image.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge))
+        
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(thumbnail_path), suffix='.tmp')
+        os.close(fd)
+        try:
+            image.convert('RGB').save(tmp_path, format='JPEG', quality=85)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+    
+    os.replace(tmp_path, thumbnail_path)
+    return thumbnail_path
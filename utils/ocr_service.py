@@ -1,5 +1,6 @@
 import os
 import re
+import time
 from PIL import Image, ImageEnhance, ImageFilter
 import cv2
 import numpy as np
@@ -149,9 +150,42 @@ def process_with_google_vision(image_path):
         st.warning(f"Google Vision error: {str(e)}. Falling back to EasyOCR.")
         return None
 
-def process_document(image_path):
-    """Process document with OCR and extract invoice data including line items"""
+def field_confidences(fields, text_with_positions):
+    """Mean OCR confidence of the words each extracted field was read from"""
+    confidences = {}
+    
+    for name, value in fields.items():
+        if value is None or value == '':
+            continue
+        
+        matched = []
+        for item in text_with_positions:
+            word = item['text'].strip().strip('$:').replace(',', '').lower()
+            if not word:
+                continue
+            if isinstance(value, (int, float)):
+                try:
+                    if abs(float(word) - value) < 0.005:
+                        matched.append(item['confidence'])
+                except ValueError:
+                    pass
+            elif word in str(value).lower():
+                matched.append(item['confidence'])
+        
+        if matched:
+            confidences[name] = round(sum(matched) / len(matched), 3)
+    
+    return confidences
+
+def process_document(image_path, source='upload'):
+    """Process document with OCR and extract invoice data including line items.
+    
+    The extracted data carries a `metadata` dict (engine, timings, per-field
+    confidences, source channel) that save_document stores as JSON.
+    """
     try:
+        started = time.perf_counter()
+        
         # Check which OCR engine to use - default to Google Vision
         use_google_vision = True  # Default to Google Vision
         if "settings" in st.secrets:
@@ -237,6 +271,8 @@ def process_document(image_path):
             full_text = ocr_result['full_text']
             avg_confidence = ocr_result['avg_confidence']
         
+        ocr_seconds = time.perf_counter() - started
+        
         # Parse invoice fields
         extracted_data = {
             "vendor_name": extract_vendor(full_text),
@@ -249,6 +285,17 @@ def process_document(image_path):
             "raw_text": full_text
         }
         
+        header_fields = ('vendor_name', 'invoice_number', 'transaction_date', 'amount', 'tax_amount')
+        extracted_data["metadata"] = {
+            "engine": engine_used,
+            "source": source,
+            "ocr_ms": round(ocr_seconds * 1000, 1),
+            "parse_ms": round((time.perf_counter() - started - ocr_seconds) * 1000, 1),
+            "word_count": len(text_with_positions),
+            "line_item_count": len(extracted_data["line_items"]),
+            "field_confidence": field_confidences({name: extracted_data[name] for name in header_fields}, text_with_positions),
+        }
+        
         return {
             "status": "success",
             "engine": engine_used,
@@ -0,0 +1,155 @@
+import sqlite3
+from utils import database
+
+# Line items of invoices saved more than once count only with the original copy;
+# items without a transaction are kept (a bare NOT IN is NULL for them)
+NOT_DUPLICATE = "(transaction_id IS NULL OR transaction_id NOT IN (SELECT id FROM transactions WHERE duplicate_of IS NOT NULL))"
+
+def _fetch_columns(cursor, sql, params=()):
+    """Run a query and return the result as a dict of column lists (ready for pandas/plotly)"""
+    cursor.execute(sql, params)
+    names = [column[0] for column in cursor.description]
+    rows = cursor.fetchall()
+    
+    if not rows:
+        return {name: [] for name in names}
+    
+    return {name: list(values) for name, values in zip(names, zip(*rows))}
+
+def get_category_totals(cursor):
+    """Spending and item count per line-item category"""
+    return _fetch_columns(cursor, f"""
+        SELECT category, SUM(total) as total_amount, COUNT(*) as item_count
+        FROM line_items
+        WHERE category IS NOT NULL AND {NOT_DUPLICATE}
+        GROUP BY category
+        ORDER BY total_amount DESC
+    """)
+
+def get_document_line_items(cursor):
+    """All line items with their document header and per-document category totals, in one scan"""
+    return _fetch_columns(cursor, """
+        SELECT
+            li.document_id,
+            d.uploaded_at,
+            t.vendor_name,
+            t.transaction_date,
+            t.amount,
+            li.description,
+            li.quantity,
+            li.unit_price,
+            li.total,
+            li.category,
+            SUM(li.total) OVER (PARTITION BY li.document_id, li.category) as cat_total
+        FROM line_items li
+        JOIN documents d ON d.id = li.document_id
+        JOIN transactions t ON t.document_id = d.id
+        WHERE t.duplicate_of IS NULL
+        ORDER BY d.uploaded_at DESC, li.document_id DESC, li.category, li.description
+    """)
+
+def get_top_items(cursor, limit=10):
+    """Products with the highest total spending.
+    
+    Line items are grouped by catalog product id, so spelling variants and
+    item-number prefixes of one product count together; items not linked to
+    the catalog yet are grouped by their description. Product names are
+    looked up in SQLite afterwards, so the query also runs on the mirror.
+    """
+    items = _fetch_columns(cursor, f"""
+        SELECT product_id, NULL as description, SUM(total) as total_spent, COUNT(*) as purchase_count, MAX(category) as category
+        FROM line_items
+        WHERE product_id IS NOT NULL AND {NOT_DUPLICATE}
+        GROUP BY product_id
+        UNION ALL
+        SELECT NULL, description, SUM(total), COUNT(*), MAX(category)
+        FROM line_items
+        WHERE product_id IS NULL AND {NOT_DUPLICATE}
+        GROUP BY description
+        ORDER BY total_spent DESC
+        LIMIT ?
+    """, (limit,))
+    
+    names = database.get_product_names({product_id for product_id in items['product_id'] if product_id is not None})
+    items['description'] = [
+        names.get(product_id, description) if product_id is not None else description
+        for product_id, description in zip(items['product_id'], items['description'])
+    ]
+    return items
+
+def get_department_totals(cursor):
+    """Spending and transaction count per department, in one grouped join"""
+    return _fetch_columns(cursor, """
+        SELECT COALESCE(c.department, 'Unassigned') as department, SUM(t.amount) as total_amount, COUNT(*) as transaction_count
+        FROM transactions t
+        LEFT JOIN categories c ON c.id = t.category_id
+        WHERE t.duplicate_of IS NULL
+        GROUP BY 1
+        ORDER BY total_amount DESC
+    """)
+
+def get_category_rollups(cursor):
+    """Spending of every category together with its subcategories.
+    
+    The closure table pairs each category with all its descendants, so the
+    whole tree is rolled up by one aggregate without recursion.
+    """
+    return _fetch_columns(cursor, """
+        SELECT
+            c.id,
+            c.name,
+            c.parent_id,
+            COALESCE(c.department, 'Unassigned') as department,
+            COALESCE(SUM(t.amount), 0) as total_amount,
+            COUNT(t.id) as transaction_count
+        FROM categories c
+        JOIN category_closure cl ON cl.ancestor_id = c.id
+        LEFT JOIN transactions t ON t.category_id = cl.descendant_id AND t.duplicate_of IS NULL
+        GROUP BY c.id, c.name, c.parent_id, c.department
+        ORDER BY total_amount DESC, c.name
+    """)
+
+def get_report_data(top_items_limit=10, engine='sqlite'):
+    """Fetch everything the Reports page needs, cached until the underlying tables change.
+    
+    engine is 'sqlite', 'duckdb' (the columnar mirror in utils.analytics) or
+    'auto', which uses the mirror when it has been synced.
+    """
+    if engine == 'auto':
+        from utils import analytics
+        engine = 'duckdb' if analytics.mirror_ready() else 'sqlite'
+    
+    tables = ('documents', 'transactions', 'line_items', 'products', 'categories')
+    if engine == 'duckdb':
+        tables += ('analytics_mirror',)
+    
+    return database.cached_read(
+        ('get_report_data', engine, top_items_limit),
+        tables,
+        lambda: _load_report_data(top_items_limit, engine)
+    )
+
+def run_report_queries(cursor, top_items_limit=10):
+    """Run the report queries on a DB-API cursor (SQLite or DuckDB)"""
+    return {
+        'categories': get_category_totals(cursor),
+        'document_items': get_document_line_items(cursor),
+        'top_items': get_top_items(cursor, top_items_limit),
+        'departments': get_department_totals(cursor),
+        'category_rollups': get_category_rollups(cursor),
+    }
+
+def _load_report_data(top_items_limit, engine):
+    """Run the grouped report queries on one connection (SQLite or the DuckDB mirror)"""
+    if engine == 'duckdb':
+        from utils import analytics
+        conn = analytics.connect_mirror()
+        cursor = conn
+    else:
+        conn = sqlite3.connect(database.DB_PATH)
+        cursor = conn.cursor()
+    
+    try:
+        return run_report_queries(cursor, top_items_limit)
+    finally:
+        conn.close()
@@ -0,0 +1,188 @@
+import json
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from utils import database
+
+CHUNK_TRANSACTIONS = 10000
+
+VENDOR_PREFIXES = [
+    'Fresh', 'Metro', 'Green', 'Blue', 'Prime', 'Urban', 'Golden', 'Summit', 'Harbor', 'Pioneer',
+    'Royal', 'Sunrise', 'Capital', 'Northern', 'Coastal', 'Silver', 'Evergreen', 'Liberty', 'Union', 'Apex',
+]
+VENDOR_SUFFIXES = [
+    'Market', 'Foods', 'Supplies', 'Traders', 'Mart', 'Services', 'Solutions', 'Wholesale', 'Outlet', 'Store',
+]
+
+# Typical line-item descriptions per category; categories not listed use generic items
+CATEGORY_PRODUCTS = {
+    'Meat & Poultry': ['Chicken Breast', 'Ground Beef', 'Pork Chops', 'Lamb Shoulder', 'Turkey Slices', 'Bacon'],
+    'Seafood': ['Salmon Fillet', 'Shrimp', 'Tuna Steak', 'Cod Fillet', 'Crab Sticks'],
+    'Dairy & Eggs': ['Milk 1L', 'Cheddar Cheese', 'Greek Yogurt', 'Butter', 'Eggs Dozen', 'Cream'],
+    'Fruits & Vegetables': ['Apples', 'Bananas', 'Tomatoes', 'Potatoes', 'Onions', 'Lettuce', 'Carrots'],
+    'Bakery': ['White Bread', 'Croissant', 'Bagels', 'Dinner Rolls', 'Muffins'],
+    'Snacks & Beverages': ['Potato Chips', 'Orange Juice', 'Coffee Beans', 'Green Tea', 'Cookies', 'Soda'],
+    'Frozen Foods': ['Frozen Pizza', 'Ice Cream', 'Frozen Peas', 'Fish Fingers'],
+    'Grocery Items': ['Rice 5kg', 'Pasta', 'Olive Oil', 'Flour', 'Sugar', 'Canned Beans'],
+    'Office Supplies': ['Printer Paper', 'Ballpoint Pens', 'Stapler', 'Sticky Notes', 'Toner Cartridge'],
+    'Cloud Services': ['Compute Hours', 'Object Storage', 'Managed Database', 'CDN Bandwidth'],
+    'IT & Software': ['Software License', 'Support Plan', 'Antivirus Subscription'],
+    'Hardware & Equipment': ['Laptop', 'Monitor', 'Keyboard', 'USB-C Dock', 'Network Switch'],
+}
+GENERIC_PRODUCTS = ['Service Fee', 'Consulting Hours', 'Monthly Subscription', 'Delivery Charge', 'Materials']
+
+# Extraction metadata mix: OCR engine and ingest channel
+ENGINES = ['google_vision', 'tesseract']
+ENGINE_WEIGHTS = [7, 3]
+SOURCES = ['upload', 'email', 'api']
+SOURCE_WEIGHTS = [80, 15, 5]
+
+def _zipf_cum_weights(n, exponent):
+    """Cumulative Zipf weights for ranks 1..n, for random.choices"""
+    total = 0.0
+    cum_weights = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** exponent
+        cum_weights.append(total)
+    return cum_weights
+
+def _vendor_names(count, rng):
+    """Distinct, plausible vendor names"""
+    names = [f"{prefix} {suffix}" for prefix in VENDOR_PREFIXES for suffix in VENDOR_SUFFIXES]
+    rng.shuffle(names)
+    # Past the word combinations, number the branches
+    while len(names) < count:
+        names.append(f"{rng.choice(VENDOR_PREFIXES)} {rng.choice(VENDOR_SUFFIXES)} #{len(names)}")
+    return names[:count]
+
+def _line_item_count(rng, mean_items, max_items):
+    """Items per receipt: mostly short receipts with a long tail of large baskets"""
+    return min(max_items, 1 + int(rng.expovariate(1.0 / max(mean_items - 1, 0.1))))
+
+def generate(transactions=10000, vendors=500, zipf_exponent=1.1, mean_items=4.0, max_items=40, days=365, seed=42):
+    """Append synthetic documents, transactions and line items to the database at DB_PATH.
+    
+    Vendors are drawn from a Zipf distribution (a few vendors account for most
+    receipts), each vendor has a main category from the `categories` table and
+    line-item counts follow a long-tailed distribution around mean_items.
+    Rows are bulk-inserted directly, bypassing the write queue, so run it
+    while the app is not writing. Returns the number of rows added per table.
+    """
+    rng = random.Random(seed)
+    
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT id, name FROM categories ORDER BY id")
+    category_ids = {name: category_id for category_id, name in cursor.fetchall()}
+    categories = list(category_ids)
+    if not categories:
+        conn.close()
+        raise RuntimeError("No categories found; run init_database() first")
+    
+    vendor_names = _vendor_names(vendors, rng)
+    vendor_categories = [rng.choice(categories) for _ in vendor_names]
+    vendor_weights = _zipf_cum_weights(len(vendor_names), zipf_exponent)
+    
+    # Continue after existing rows so the generator can grow a database step by step
+    start_ids = {}
+    for table in ('documents', 'transactions', 'line_items'):
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        start_ids[table] = cursor.fetchone()[0]
+    
+    # Maintaining the search index row by row dominates bulk loads: drop its
+    # triggers, rebuild the index once at the end and let init_database restore them
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%\\_fts\\_%' ESCAPE '\\'")
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"DROP TRIGGER {name}")
+    
+    now = datetime.now()
+    doc_id = start_ids['documents']
+    transaction_id = start_ids['transactions']
+    line_item_count = 0
+    
+    try:
+        for chunk_start in range(0, transactions, CHUNK_TRANSACTIONS):
+            chunk_size = min(CHUNK_TRANSACTIONS, transactions - chunk_start)
+            documents_rows, transaction_rows, line_item_rows = [], [], []
+            
+            for vendor_index in rng.choices(range(len(vendor_names)), cum_weights=vendor_weights, k=chunk_size):
+                doc_id += 1
+                transaction_id += 1
+                vendor = vendor_names[vendor_index]
+                category = vendor_categories[vendor_index]
+                
+                timestamp = (now - timedelta(seconds=rng.randint(0, days * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+                invoice_number = f"INV-{transaction_id:07d}"
+                
+                items = []
+                for _ in range(_line_item_count(rng, mean_items, max_items)):
+                    quantity = float(rng.choice((1, 1, 1, 2, 2, 3, 5)))
+                    unit_price = round(rng.lognormvariate(2.0, 0.9), 2)
+                    # Most items match the vendor's category, some come from elsewhere in the basket
+                    item_category = category if rng.random() < 0.75 else rng.choice(categories)
+                    description = rng.choice(CATEGORY_PRODUCTS.get(item_category, GENERIC_PRODUCTS))
+                    items.append((description, quantity, unit_price, round(quantity * unit_price, 2), item_category))
+                
+                subtotal = round(sum(item[3] for item in items), 2)
+                tax_amount = round(subtotal * 0.08, 2)
+                raw_text = "\n".join(
+                    [vendor, f"Invoice: {invoice_number}", f"Date: {timestamp[:10]}"]
+                    + [f"{description} {total:.2f}" for description, _, _, total, _ in items]
+                    + [f"Total: {subtotal + tax_amount:.2f}"]
+                )
+                
+                confidence = round(rng.uniform(0.6, 0.99), 2)
+                source = rng.choices(SOURCES, weights=SOURCE_WEIGHTS)[0]
+                metadata = {
+                    'engine': rng.choices(ENGINES, weights=ENGINE_WEIGHTS)[0],
+                    'source': source,
+                    'confidence': confidence,
+                    'ocr_ms': round(rng.lognormvariate(6.5, 0.4), 1),
+                    'parse_ms': round(rng.lognormvariate(1.5, 0.5), 1),
+                    'line_item_count': len(items),
+                }
+                
+                documents_rows.append((
+                    doc_id, source, 'receipt', rng.choice(('processed',) * 9 + ('pending',)),
+                    confidence, timestamp, timestamp, raw_text, json.dumps(metadata)
+                ))
+                transaction_rows.append((
+                    transaction_id, doc_id, vendor, invoice_number, timestamp[:10],
+                    round(subtotal + tax_amount, 2), tax_amount, category, category_ids[category], timestamp
+                ))
+                for description, quantity, unit_price, total, item_category in items:
+                    line_item_rows.append((doc_id, transaction_id, description, quantity, unit_price, total, item_category, category_ids[item_category], timestamp))
+            
+            cursor.executemany("""
+                INSERT INTO documents (id, source, document_type, status, confidence_score, uploaded_at, processed_at, raw_text, metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, documents_rows)
+            cursor.executemany("""
+                INSERT INTO transactions (id, document_id, vendor_name, invoice_number, transaction_date, amount, tax_amount, category, category_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, transaction_rows)
+            cursor.executemany("""
+                INSERT INTO line_items (document_id, transaction_id, description, quantity, unit_price, total, category, category_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, line_item_rows)
+            line_item_count += len(line_item_rows)
+            conn.commit()
+        
+        database.rebuild_search_index(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+        # Restores the search triggers dropped above
+        database.init_database()
+    
+    database.bump_table_versions('documents', 'transactions', 'line_items')
+    database.backfill_vendors()
+    database.backfill_products()
+    database.flag_duplicates()
+    
+    return {
+        'documents': doc_id - start_ids['documents'],
+        'transactions': transaction_id - start_ids['transactions'],
+        'line_items': line_item_count,
+    }
@@ -0,0 +1,450 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from urllib.request import pathname2url
+from utils import database
+from utils.categorizer import KeywordAutomaton
+
+# Tables the generated SQL may read, with a note for the schema prompt
+SQL_TABLES = {
+    'transactions': "one row per invoice; amount is the invoice total",
+    'line_items': "purchased items of an invoice",
+    'documents': "uploaded files",
+    'vendors': "canonical vendors (transactions.vendor_id)",
+    'products': "catalog products (line_items.product_id)",
+    'categories': "category tree (parent_id) with the owning department",
+    'category_closure': "every (ancestor_id, descendant_id, depth) pair of the category tree",
+}
+
+# Columns left out of the prompt and refused by the validator
+HIDDEN_COLUMNS = {
+    'documents': {'raw_text', 'metadata', 'file_path'},
+    'transactions': {'metadata', 'dedupe_key', 'notes'},
+    'vendors': {'normalized_key'},
+    'products': {'normalized_key'},
+}
+
+SCHEMA_NOTES = [
+    "Copies of an invoice saved twice have transactions.duplicate_of set; filter with duplicate_of IS NULL when summing or counting.",
+    "Timestamps are text 'YYYY-MM-DD HH:MM:SS'; use strftime() and date('now') for date arithmetic.",
+    "Prefer vendors.name (JOIN on vendor_id) over transactions.vendor_name, which holds OCR spelling variants.",
+]
+
+SYSTEM_PROMPT = """You translate questions about expense data into one SQLite SELECT statement.
+
+{schema}
+
+Rules:
+- Answer with the SQL only, no explanation.
+- Read only the tables and columns listed above; name columns explicitly instead of SELECT *.
+- Give aggregate columns short aliases such as total or count.
+- Add LIMIT 50 unless the question asks for a single value or a specific number of rows."""
+
+# Actions allowed while compiling generated SQL (reads are checked column by column)
+ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, 33}  # 33 = SQLITE_RECURSIVE
+
+# Words that do not change what a question asks for
+FILLER_WORDS = {
+    'a', 'an', 'the', 'me', 'my', 'our', 'we', 'us', 'i', 'please', 'show', 'tell', 'give', 'list', 'what', 'whats',
+    'what\'s', 'is', 'are', 'was', 'were', 'do', 'does', 'did', 'can', 'you', 'of', 'all', 'so', 'far', 'currently',
+}
+
+# Placeholders of literal kinds in intent keys; plans are only reused for the same kind of value
+PLACEHOLDERS = {'number': '_num_', 'vendor': '_vendor_', 'category': '_category_', 'department': '_department_'}
+
+# Which kind a name that is several kinds at once counts as
+ENTITY_KINDS = ('category', 'department', 'vendor')
+
+# Literals in a question: quoted text, ISO dates and numbers
+QUOTED_PATTERN = re.compile(r'"([^"]+)"|\'([^\']+)\'')
+DATE_PATTERN = re.compile(r'\b\d{4}-\d{2}-\d{2}\b')
+NUMBER_PATTERN = re.compile(r'(?<![\w.])\d+(?:\.\d+)?(?![\w.])')
+
+SQL_STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+
+# Names introduced by a WITH clause: "WITH [RECURSIVE] name [(columns)] AS (" and ", name AS ("
+CTE_PATTERN = re.compile(
+    r'(?:\bWITH(?:\s+RECURSIVE)?|,)\s*([A-Za-z_]\w*|"[^"]+")\s*(?:\([^()]*\))?\s*AS\s+(?:NOT\s+)?(?:MATERIALIZED\s+)?\(',
+    re.IGNORECASE
+)
+
+# SQL tokens: string literals, quoted identifiers, identifiers and numbers
+SQL_TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|[A-Za-z_][A-Za-z0-9_]*|\d+(?:\.\d+)?")
+
+# Keywords that end a GROUP BY or ORDER BY list at the same nesting level
+CLAUSE_KEYWORDS = {'HAVING', 'LIMIT', 'OFFSET', 'WINDOW', 'UNION', 'INTERSECT', 'EXCEPT', 'SELECT', 'FROM', 'WHERE'}
+
+PLAN_CACHE_SIZE = 256
+
+_plan_stats = {'hits': 0, 'misses': 0, 'generated': 0, 'rejected': 0}
+_plan_stats_lock = threading.Lock()
+
+class SQLValidationError(ValueError):
+    """Raised when generated SQL is not a single read of the allowed tables and columns"""
+
+def _count(name):
+    with _plan_stats_lock:
+        _plan_stats[name] += 1
+
+def get_schema_prompt():
+    """System prompt with a compact description of the allowed tables, and its fingerprint"""
+    return database.cached_read(('sql_schema_prompt',), (), _build_schema_prompt)
+
+def _build_schema_prompt():
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    
+    lines = []
+    for table, note in SQL_TABLES.items():
+        cursor.execute(f"PRAGMA foreign_key_list({table})")
+        references = {row[3]: f"{row[2]}.{row[4] or 'id'}" for row in cursor.fetchall()}
+        
+        cursor.execute(f"PRAGMA table_xinfo({table})")
+        columns = [
+            f"{name}->{references[name]}" if name in references else name
+            for _, name, *_ in cursor.fetchall()
+            if name not in HIDDEN_COLUMNS.get(table, ())
+        ]
+        lines.append(f"{table}({', '.join(columns)}) -- {note}")
+    
+    conn.close()
+    
+    schema = "Tables:\n" + "\n".join(lines) + "\n\nNotes:\n" + "\n".join(f"- {note}" for note in SCHEMA_NOTES)
+    prompt = SYSTEM_PROMPT.format(schema=schema)
+    return prompt, hashlib.sha1(prompt.encode()).hexdigest()[:12]
+
+def _entity_automaton():
+    """Vendor, category and department names that may appear unquoted in questions"""
+    return database.cached_read(('sql_entity_names',), ('vendors', 'categories'), _build_entity_automaton)
+
+def _build_entity_automaton():
+    conn = sqlite3.connect(database.DB_PATH)
+    names = conn.execute("""
+        SELECT 'vendor', name FROM vendors
+        UNION SELECT 'category', name FROM categories
+        UNION SELECT 'department', department FROM categories WHERE department IS NOT NULL
+    """).fetchall()
+    conn.close()
+    return KeywordAutomaton([(name, (kind, name), len(name), 'word') for kind, name in names if len(name) > 2])
+
+def extract_literals(question):
+    """Values in a question that can become query parameters, as (start, end, kind, value) in order.
+    
+    Known names are of kind 'vendor', 'category' or 'department', quoted
+    text and ISO dates 'string', other numbers 'number'. Overlaps go to the
+    longer span, then to the kind listed first in ENTITY_KINDS.
+    """
+    spans = []
+    for match in QUOTED_PATTERN.finditer(question):
+        spans.append((match.start(), match.end(), 'string', match.group(1) or match.group(2)))
+    for match in DATE_PATTERN.finditer(question):
+        spans.append((match.start(), match.end(), 'string', match.group()))
+    automaton = _entity_automaton()
+    for start, end, index in automaton.iter_matches(question):
+        kind, name = automaton.rules[index][1]
+        spans.append((start, end, kind, name))
+    for match in NUMBER_PATTERN.finditer(question):
+        spans.append((match.start(), match.end(), 'number', match.group()))
+    
+    literals = []
+    rank = {kind: position for position, kind in enumerate(ENTITY_KINDS)}
+    for span in sorted(spans, key=lambda span: (span[0], span[0] - span[1], rank.get(span[2], len(rank)))):
+        if literals and span[0] < literals[-1][1]:
+            continue
+        literals.append(span)
+    return literals
+
+def intent_key(question, literals):
+    """Question with literals replaced by placeholders of their kind, filler words dropped and plurals folded"""
+    parts = []
+    position = 0
+    for start, end, kind, _ in literals:
+        parts.append(question[position:start])
+        parts.append(f" {PLACEHOLDERS.get(kind, '_str_')} ")
+        position = end
+    parts.append(question[position:])
+    
+    words = []
+    for word in re.sub(r"[^a-z0-9_']+", ' ', ''.join(parts).lower()).split():
+        word = word.strip("'")
+        if not word or word in FILLER_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return ' '.join(words)
+
+def _literal_value(kind, value):
+    if kind != 'number':
+        return value
+    return float(value) if '.' in value else int(value)
+
+def _split_string(text, literals, indexes):
+    """Pieces of a SQL string literal: plain text, and indexes (from `indexes`) of question literals found in it"""
+    pieces = [text]
+    for index in sorted(indexes, key=lambda index: -len(literals[index][3])):
+        pattern = re.compile(r'(?<![A-Za-z0-9])' + re.escape(literals[index][3]) + r'(?![A-Za-z0-9])', re.IGNORECASE)
+        split = []
+        for piece in pieces:
+            if isinstance(piece, int):
+                split.append(piece)
+                continue
+            for position, part in enumerate(pattern.split(piece)):
+                if position:
+                    split.append(index)
+                split.append(part)
+        pieces = split
+    return [piece for piece in pieces if piece != '']
+
+def _literal_key(literal):
+    """What makes two question literals the same value"""
+    _, _, kind, value = literal
+    return ('number', float(value)) if kind == 'number' else ('text', value.lower())
+
+def _substitute(sql, literals, indexes):
+    """SQL with the literals in `indexes` replaced by placeholders, and the bindings in order.
+    
+    Numbers in a GROUP BY or ORDER BY list are column positions, not
+    values, and are never replaced.
+    """
+    numbers = {_literal_key(literals[index])[1]: index for index in indexes if literals[index][2] == 'number'}
+    bindings = []
+    parts = []
+    position = 0
+    previous = None
+    depth = 0
+    by_depth = None
+    
+    for match in SQL_TOKEN_PATTERN.finditer(sql):
+        token = match.group()
+        separator = sql[position:match.start()]
+        parts.append(separator)
+        position = match.end()
+        
+        depth += separator.count('(') - separator.count(')')
+        if by_depth is not None and depth < by_depth:
+            by_depth = None
+        
+        if token.startswith("'"):
+            pieces = _split_string(token[1:-1].replace("''", "'"), literals, indexes)
+            if all(isinstance(piece, str) for piece in pieces):
+                parts.append(token)
+            else:
+                terms = []
+                for piece in pieces:
+                    if isinstance(piece, int):
+                        bindings.append((piece, 'string'))
+                        terms.append('?')
+                    else:
+                        terms.append("'" + piece.replace("'", "''") + "'")
+                parts.append(terms[0] if len(terms) == 1 else '(' + ' || '.join(terms) + ')')
+        elif token[0].isdigit():
+            ordinal = by_depth is not None and (previous == 'BY' or separator.strip() == ',')
+            if not ordinal and float(token) in numbers:
+                bindings.append((numbers[float(token)], 'number'))
+                parts.append('?')
+            else:
+                parts.append(token)
+        else:
+            parts.append(token)
+            word = token.upper()
+            if word == 'BY' and previous in ('GROUP', 'ORDER'):
+                by_depth = depth
+            elif word in CLAUSE_KEYWORDS and depth == by_depth:
+                by_depth = None
+        
+        previous = token.upper()
+    
+    parts.append(sql[position:])
+    return ''.join(parts), bindings
+
+def parameterize(sql, literals):
+    """Replace the question's literals in generated SQL with ? placeholders.
+    
+    Returns the SQL template, the bindings (literal index, 'number' or
+    'string') of its placeholders in order, and the indexes of literals
+    that were found. A literal inside a longer string ('%Fresh Market%',
+    '-30 days') becomes a concatenation, so the pattern around it is kept.
+    Each literal is bound at most once: values the question repeats, or
+    that appear more than once in the SQL, stay fixed because it is not
+    known which occurrence belongs to which literal.
+    """
+    occurrences = {}
+    for index, literal in enumerate(literals):
+        occurrences.setdefault(_literal_key(literal), []).append(index)
+    indexes = [indexes[0] for indexes in occurrences.values() if len(indexes) == 1]
+    
+    template, bindings = _substitute(sql, literals, indexes)
+    bound = [index for index, _ in bindings]
+    repeated = {index for index in bound if bound.count(index) > 1}
+    if repeated:
+        template, bindings = _substitute(sql, literals, [index for index in indexes if index not in repeated])
+    
+    return template, bindings, {index for index, _ in bindings}
+
+def bind(bindings, literals):
+    """Parameter values of a plan for the literals of a new question"""
+    return tuple(
+        _literal_value(literals[index][2], literals[index][3]) if binding == 'number' else str(literals[index][3])
+        for index, binding in bindings
+    )
+
+def extract_sql(text):
+    """The SQL statement in an LLM reply (code fences and trailing semicolons removed)"""
+    fenced = re.search(r'```(?:sql)?\s*(.*?)```', text or '', re.DOTALL | re.IGNORECASE)
+    sql = (fenced.group(1) if fenced else text or '').strip()
+    match = re.search(r'\b(SELECT|WITH)\b', sql, re.IGNORECASE)
+    if match is None:
+        raise SQLValidationError("The reply does not contain a SELECT statement")
+    return sql[match.start():].strip().rstrip(';').strip()
+
+def validate_sql(sql, params=()):
+    """Compile generated SQL without running it and check it only reads allowed columns.
+    
+    The statement is prepared on a read-only connection under an authorizer
+    that refuses writes, PRAGMAs, ATTACH and any table or hidden column
+    outside SQL_TABLES. Returns the tables it reads.
+    """
+    code = SQL_STRING_PATTERN.sub("''", sql)
+    if ';' in code:
+        raise SQLValidationError("Only a single statement is allowed")
+    
+    # WITH clause names may be read like tables, as long as they do not shadow one
+    cte_names = {name.strip('"').lower() for name in CTE_PATTERN.findall(code)}
+    
+    tables = set()
+    refused = []
+    
+    def authorizer(action, arg1, arg2, db_name, trigger):
+        if action == sqlite3.SQLITE_READ:
+            if arg1 and arg1.lower() in cte_names:
+                return sqlite3.SQLITE_OK
+            if arg1 not in SQL_TABLES or arg2 in HIDDEN_COLUMNS.get(arg1, ()):
+                refused.append(f"{arg1}.{arg2}")
+                return sqlite3.SQLITE_DENY
+            tables.add(arg1)
+            return sqlite3.SQLITE_OK
+        if action in ALLOWED_ACTIONS:
+            return sqlite3.SQLITE_OK
+        refused.append(f"action {action}")
+        return sqlite3.SQLITE_DENY
+    
+    uri = f"file:{pathname2url(os.path.abspath(database.DB_PATH))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        schema_names = {row[0].lower() for row in conn.execute("SELECT name FROM sqlite_master")}
+        shadowing = [name for name in cte_names if name in schema_names or name.startswith(('sqlite_', 'pragma_'))]
+        if shadowing:
+            raise SQLValidationError(f"WITH clause reuses a table name ({', '.join(sorted(shadowing))})")
+        
+        conn.set_authorizer(authorizer)
+        conn.execute(f"EXPLAIN {sql}", params)
+    except sqlite3.Error as e:
+        raise SQLValidationError(f"Rejected generated SQL ({', '.join(refused) or e})") from e
+    finally:
+        conn.close()
+    
+    return tables
+
+def _load_plan(key):
+    conn = sqlite3.connect(database.DB_PATH)
+    row = conn.execute("SELECT schema_version, sql, bindings, fixed FROM sql_plans WHERE intent_key = ?", (key,)).fetchone()
+    conn.close()
+    if row is None:
+        return False
+    return {'schema_version': row[0], 'sql': row[1], 'bindings': json.loads(row[2]), 'fixed': json.loads(row[3])}
+
+def lookup_plan(question):
+    """(sql, params) of a cached plan for the question's intent, or None"""
+    _, schema_version = get_schema_prompt()
+    literals = extract_literals(question)
+    key = intent_key(question, literals)
+    
+    plan = database.cached_read(('sql_plan', key), ('sql_plans',), lambda: _load_plan(key)) or None
+    
+    # Literals the plan did not parameterize must be the same as when it was generated
+    if (
+        plan is None or plan['schema_version'] != schema_version
+        or any(index >= len(literals) or literals[index][3].lower() != value.lower() for index, value in plan['fixed'])
+        or any(index >= len(literals) for index, _ in plan['bindings'])
+    ):
+        _count('misses')
+        return None
+    
+    _count('hits')
+    return plan['sql'], bind(plan['bindings'], literals)
+
+def generate_plan(question, complete):
+    """Ask the LLM for SQL, validate it, turn literals into parameters and cache the plan.
+    
+    complete(system_prompt, question) returns the model's reply. Returns
+    (sql, params); raises SQLValidationError for unusable SQL.
+    """
+    prompt, schema_version = get_schema_prompt()
+    literals = extract_literals(question)
+    
+    try:
+        sql = extract_sql(complete(prompt, question))
+        template, bindings, used = parameterize(sql, literals)
+        params = bind(bindings, literals)
+        validate_sql(template, params)
+    except SQLValidationError:
+        _count('rejected')
+        raise
+    _count('generated')
+    
+    fixed = [(index, literal[3]) for index, literal in enumerate(literals) if index not in used]
+    database.submit_write(
+        _save_plan, intent_key(question, literals), schema_version, template, bindings, fixed, question,
+        tables=('sql_plans',)
+    ).result()
+    return template, params
+
+def _save_plan(cursor, key, schema_version, sql, bindings, fixed, question):
+    cursor.execute("""
+        INSERT INTO sql_plans (intent_key, schema_version, sql, bindings, fixed, question)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (intent_key) DO UPDATE SET
+            schema_version = excluded.schema_version, sql = excluded.sql, bindings = excluded.bindings,
+            fixed = excluded.fixed, question = excluded.question, created_at = CURRENT_TIMESTAMP
+    """, (key, schema_version, sql, json.dumps(bindings), json.dumps(fixed), question))
+    
+    # Keep the most recent plans
+    cursor.execute("""
+        DELETE FROM sql_plans WHERE intent_key NOT IN (
+            SELECT intent_key FROM sql_plans ORDER BY created_at DESC, rowid DESC LIMIT ?
+        )
+    """, (PLAN_CACHE_SIZE,))
+
+def to_sql(question, complete=None):
+    """(sql, params, source) for a question: a cached plan, else LLM-generated SQL when complete is given.
+    
+    Returns None when there is no plan and no LLM, so the caller can use
+    the keyword fallback.
+    """
+    cached = lookup_plan(question)
+    if cached is not None:
+        return cached + ('plan_cache',)
+    if complete is None:
+        return None
+    return generate_plan(question, complete) + ('llm',)
+
+def get_plan_cache_stats():
+    """Plan cache hits, misses, generated and rejected statements and the number of stored plans"""
+    with _plan_stats_lock:
+        stats = dict(_plan_stats)
+    
+    conn = sqlite3.connect(database.DB_PATH)
+    stats['plans'] = conn.execute("SELECT COUNT(*) FROM sql_plans").fetchone()[0]
+    conn.close()
+    
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+def clear_plans():
+    """Forget all cached SQL plans"""
+    database.submit_write(lambda cursor: cursor.execute("DELETE FROM sql_plans"), tables=('sql_plans',)).result()
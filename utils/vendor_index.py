@@ -0,0 +1,150 @@
+import re
+import unicodedata
+
+# Company-form words dropped from the end of names before matching
+LEGAL_SUFFIXES = {'inc', 'llc', 'ltd', 'limited', 'co', 'corp', 'corporation', 'company', 'plc', 'pvt', 'gmbh', 'pty'}
+
+# Item numbering that receipt extraction puts in front of descriptions ("1. Milk", "2) Bread")
+ITEM_NUMBER_PATTERN = re.compile(r'^\s*\d{1,3}\s*[.)]\s*')
+
+# Only the first characters of a key are expanded into deletions (SymSpell's prefix length)
+PREFIX_LENGTH = 7
+
+def normalize_vendor(name):
+    """Matching key of a vendor name: ASCII, lower case, punctuation and legal suffixes removed"""
+    text = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode().lower()
+    text = text.replace('&', ' and ')
+    words = re.sub(r'[^a-z0-9]+', ' ', text).split()
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return ' '.join(words)
+
+def strip_item_number(description):
+    """Description without the leading item number"""
+    return ITEM_NUMBER_PATTERN.sub('', description or '').strip()
+
+def normalize_product(description):
+    """Matching key of a line-item description: item number dropped, then normalized like a vendor name"""
+    text = unicodedata.normalize('NFKD', strip_item_number(description)).encode('ascii', 'ignore').decode().lower()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text).split())
+
+def max_distance_for(key):
+    """Edits tolerated for a whole key: none for short names, up to two for long ones"""
+    return min(2, len(key) // 6)
+
+def max_word_distance(word):
+    """Edits tolerated within one word; short words and words with digits must match exactly"""
+    if any(char.isdigit() for char in word):
+        return 0
+    return min(2, (len(word) - 1) // 4)
+
+def _deletions(text, distance):
+    """text and every string obtained by deleting up to `distance` characters"""
+    found = {text}
+    frontier = {text}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))} - found
+        found |= frontier
+    return found
+
+def word_distance(key, candidate, limit):
+    """Total edits between two keys word by word, or None if any word (or the total) is out of tolerance.
+    
+    Words are compared in order, so 'fresh market' can match 'fresh markel'
+    but never 'fresh mart' or 'market fresh'.
+    """
+    words = key.split()
+    candidate_words = candidate.split()
+    if len(words) != len(candidate_words):
+        return None
+    
+    total = 0
+    for word, candidate_word in zip(words, candidate_words):
+        if word == candidate_word:
+            continue
+        word_limit = min(max_word_distance(word), max_word_distance(candidate_word), limit - total)
+        distance = edit_distance(word, candidate_word, word_limit) if word_limit > 0 else 1
+        if distance > word_limit:
+            return None
+        total += distance
+    return total
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 once it is known to exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+class FuzzyIndex:
+    """SymSpell-style index from normalized keys to values.
+    
+    Every key is stored under the deletions of its prefix, so a lookup only
+    generates the deletions of the query and verifies the few candidates
+    that share one, instead of comparing against every key. Candidates are
+    verified word by word (see word_distance), so store or branch numbers
+    must match exactly.
+    
+    Keys are added (and, rarely, removed) by a single writer thread; a key
+    becomes visible to lookups only after all its deletions are stored.
+    """
+    
+    def __init__(self, max_distance=2, prefix_length=PREFIX_LENGTH):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._values = {}
+        self._deletes = {}
+    
+    def __len__(self):
+        return len(self._values)
+    
+    def get(self, key):
+        return self._values.get(key)
+    
+    def add(self, key, value):
+        if key in self._values:
+            self._values[key] = value
+            return
+        for deletion in _deletions(key[:self.prefix_length], self.max_distance):
+            self._deletes.setdefault(deletion, []).append(key)
+        self._values[key] = value
+    
+    def remove(self, key):
+        """Forget a key (its deletion entries are skipped on lookup)"""
+        self._values.pop(key, None)
+    
+    def lookup(self, key):
+        """(value, matched key, distance) of the closest key within tolerance, or None"""
+        if key in self._values:
+            return self._values[key], key, 0
+        
+        limit = min(self.max_distance, max_distance_for(key))
+        if limit == 0:
+            return None
+        
+        best = None
+        seen = set()
+        for deletion in _deletions(key[:self.prefix_length], limit):
+            for candidate in self._deletes.get(deletion, ()):
+                if candidate in seen or candidate not in self._values:
+                    continue
+                seen.add(candidate)
+                
+                if abs(len(candidate) - len(key)) > limit:
+                    continue
+                distance = word_distance(key, candidate, min(limit, max_distance_for(candidate)))
+                if distance is not None and (best is None or distance < best[2]):
+                    best = (self._values[candidate], candidate, distance)
+        return best
@@ -0,0 +1,227 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+MAX_BATCH = 64
+BUSY_TIMEOUT = 30.0
+
+# Seconds without writes after which on_idle runs (once per burst of writes)
+IDLE_DELAY = 2.0
+
+class WriteQueue:
+    """Serializes database writes through a single writer thread.
+    
+    Callers submit write functions and get a Future back. The writer drains
+    whatever is pending (up to max_batch writes) and runs it in one
+    transaction, so concurrent sessions share a single commit instead of
+    competing for the database lock. Each write runs in its own savepoint:
+    a failing write is rolled back and reported on its future without
+    affecting the rest of the batch.
+    
+    Writes submitted with transaction=False run alone on the writer's
+    connection outside any transaction, for statements such as PRAGMA
+    incremental_vacuum that cannot run inside one.
+    
+    on_idle(cursor), if given, runs in its own transaction once the queue
+    has been empty for IDLE_DELAY seconds after a write, for housekeeping
+    that should not delay callers. The tables it returns are passed to
+    on_commit once that transaction is committed.
+    
+    on_rollback(), if given, runs after a batch or single write in which
+    anything was rolled back, so in-memory state built up by the failed
+    writes can be dropped.
+    """
+    
+    def __init__(self, db_path, max_batch=MAX_BATCH, on_commit=None, on_idle=None, on_rollback=None):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self.on_idle = on_idle
+        self.on_rollback = on_rollback
+        self.stats = {'writes': 0, 'failed': 0, 'commits': 0, 'idle_runs': 0, 'callback_errors': 0}
+        
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+    
+    def submit(self, fn, *args, tables=(), transaction=True):
+        """Queue fn(cursor, *args) for the writer thread.
+        
+        `tables` are passed to on_commit once the write is committed.
+        Returns a Future resolving to fn's return value.
+        """
+        future = Future()
+        self._queue.put((fn, args, tables, future, transaction))
+        return future
+    
+    def close(self, timeout=None):
+        """Finish pending writes and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+    
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        
+        try:
+            written = False
+            held = None
+            while True:
+                if held is not None:
+                    item, held = held, None
+                else:
+                    try:
+                        item = self._queue.get(timeout=IDLE_DELAY if written and self.on_idle else None)
+                    except queue.Empty:
+                        self._run_idle(conn)
+                        written = False
+                        continue
+                if item is None:
+                    break
+                
+                if not item[4]:
+                    self._run_alone(conn, item)
+                    written = True
+                    continue
+                
+                # A write outside a transaction ends the batch and runs after it
+                batch = [item]
+                stop = False
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    if not item[4]:
+                        held = item
+                        break
+                    batch.append(item)
+                
+                try:
+                    self._commit_batch(conn, batch)
+                except Exception as e:
+                    # Never let one batch stop the only writer thread
+                    for fn, args, tables, future, transaction in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                written = True
+                
+                if stop:
+                    break
+        finally:
+            conn.close()
+    
+    def _run_idle(self, conn):
+        """Run on_idle in its own transaction; a failure is only counted, never raised"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            tables = self.on_idle(cursor)
+            cursor.execute("COMMIT")
+            self.stats['idle_runs'] += 1
+            if tables and self.on_commit:
+                self.on_commit(*tables)
+        except Exception:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                pass
+            self.stats['callback_errors'] += 1
+    
+    def _run_alone(self, conn, item):
+        """Run one write outside a transaction and resolve its future"""
+        fn, args, tables, future, transaction = item
+        if not future.set_running_or_notify_cancel():
+            return
+        
+        try:
+            result = fn(conn.cursor(), *args)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            self._notify_rollback()
+            self.stats['failed'] += 1
+            future.set_exception(e)
+            return
+        
+        if tables and self.on_commit:
+            try:
+                self.on_commit(*tables)
+            except Exception:
+                self.stats['callback_errors'] += 1
+        
+        self.stats['writes'] += 1
+        future.set_result(result)
+    
+    def _commit_batch(self, conn, batch):
+        """Run a batch of writes in one transaction and resolve their futures"""
+        cursor = conn.cursor()
+        outcomes = []
+        
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            for fn, args, tables, future, transaction in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                
+                cursor.execute("SAVEPOINT queued_write")
+                try:
+                    result = fn(cursor, *args)
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO queued_write")
+                    cursor.execute("RELEASE queued_write")
+                    outcomes.append((future, None, e, ()))
+                else:
+                    cursor.execute("RELEASE queued_write")
+                    outcomes.append((future, result, None, tables))
+            
+            cursor.execute("COMMIT")
+        except Exception as e:
+            # The transaction itself failed: nothing in the batch was written
+            if conn.in_transaction:
+                conn.rollback()
+            self._notify_rollback()
+            # Writes not started yet (BEGIN itself failed) are failed too, or their callers would wait forever
+            for fn, args, tables, future, transaction in batch:
+                if not future.done():
+                    future.set_exception(e)
+            self.stats['failed'] += len(batch)
+            return
+        
+        self.stats['commits'] += 1
+        
+        # Notify before resolving futures so callers never read stale caches
+        committed_tables = set()
+        for future, result, error, tables in outcomes:
+            committed_tables.update(tables)
+        if committed_tables and self.on_commit:
+            try:
+                self.on_commit(*committed_tables)
+            except Exception:
+                # The writes are committed either way; the writer thread must survive
+                self.stats['callback_errors'] += 1
+        
+        if any(error is not None for future, result, error, tables in outcomes):
+            self._notify_rollback()
+        
+        for future, result, error, tables in outcomes:
+            if error is None:
+                self.stats['writes'] += 1
+                future.set_result(result)
+            else:
+                self.stats['failed'] += 1
+                future.set_exception(error)
+    
+    def _notify_rollback(self):
+        """Run on_rollback; like on_commit, a failure must not stop the writer thread"""
+        if self.on_rollback is None:
+            return
+        try:
+            self.on_rollback()
+        except Exception:
+            self.stats['callback_errors'] += 1